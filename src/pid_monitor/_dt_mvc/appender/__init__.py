@@ -1,7 +1,8 @@
 import importlib
-from typing import Type, Iterator, Tuple
+from typing import Type, Iterator, Tuple, List, Optional
 
-from pid_monitor._dt_mvc.appender.typing import BaseTableAppender
+from pid_monitor._dt_mvc.appender.segmented_appender import SegmentedTableAppender
+from pid_monitor._dt_mvc.appender.typing import BaseTableAppender, TableAppenderConfig
 
 POSSIBLE_APPENDER_PATHS = (
     "pid_monitor._dt_mvc.appender.tsv_appender",
@@ -19,7 +20,7 @@ AVAILABLE_TABLE_APPENDERS = {
     "TSVTableAppender": 'TSVTableAppender',
     "LZMATSVTableAppender": 'LZMATSVTableAppender',
     "LZ77TSVTableAppender": 'LZ77TSVTableAppender',
-    #    "ArrowTableAppender": 'ArrowTableAppender', # bugs
+    "ArrowTableAppender": 'ArrowTableAppender',
     "HDF5TableAppender": 'HDF5TableAppender',
     "ParquetTableAppender": 'ParquetTableAppender',
     "SQLite3TableAppender": 'SQLite3TableAppender'
@@ -39,6 +40,33 @@ def load_table_appender_class(name: str) -> Type[BaseTableAppender]:
     raise ModuleNotFoundError
 
 
+def create_table_appender(
+        table_appender_type: str,
+        filename: str,
+        header: List[str],
+        tac: TableAppenderConfig,
+        column_types: Optional[List[str]] = None
+) -> BaseTableAppender:
+    """
+    Create an appender of a known type, which writes segments if configured so in ``tac``.
+    """
+    appender_class = load_table_appender_class(table_appender_type)
+    if tac.is_segmented and appender_class.segmentable:
+        return SegmentedTableAppender(
+            filename=filename,
+            header=header,
+            tac=tac,
+            column_types=column_types,
+            appender_class=appender_class
+        )
+    return appender_class(
+        filename=filename,
+        header=header,
+        tac=tac,
+        column_types=column_types
+    )
+
+
 def list_table_appender() -> Iterator[Tuple[str, str]]:
     for possible_path in POSSIBLE_APPENDER_PATHS:
         try:
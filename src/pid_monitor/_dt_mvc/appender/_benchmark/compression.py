@@ -0,0 +1,151 @@
+"""
+Benchmark compression ratio and throughput of compressed TSV appenders
+against reopening the compressed file on each flush, which these appenders used to do.
+
+Run with ``python -m pid_monitor._dt_mvc.appender._benchmark.compression``.
+"""
+
+import gzip
+import lzma
+import os
+import random
+import tempfile
+import time
+from typing import Any, Callable, Iterable, List, Tuple, Type
+
+import pandas as pd
+import tqdm
+
+from pid_monitor._dt_mvc.appender import load_table_appender_class
+from pid_monitor._dt_mvc.appender.lz77tsv_appender import LZ77TSVTableAppender
+from pid_monitor._dt_mvc.appender.lzmatsv_appender import LZMATSVTableAppender
+from pid_monitor._dt_mvc.appender.tsv_appender import TSVTableAppender
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, DictBufferAppender
+
+_HEADER = ["TIME", "VIRT", "RESIDENT", "SHARED", "LIB", "TEXT", "DATA", "SWAP"]
+_N_LINES = 20000
+
+
+class _ReopeningTSVTableAppender(TSVTableAppender):
+    """
+    How compressed TSV appenders used to work: reopen the file on each flush,
+    adding a new gzip member or xz stream each time.
+    """
+    opener: Callable
+
+    def _create_file_hook(self):
+        with self.opener(self._real_filename, mode="wt") as writer:
+            writer.write("\t".join(self.header) + "\n")
+
+    def _write_hook(self, df: str):
+        with self.opener(self._real_filename, mode="at") as writer:
+            writer.write(df)
+
+    def close(self):
+        DictBufferAppender.close(self)
+
+
+class _ReopeningLZ77TSVTableAppender(_ReopeningTSVTableAppender, LZ77TSVTableAppender):
+    opener = staticmethod(gzip.open)
+
+
+class _ReopeningLZMATSVTableAppender(_ReopeningTSVTableAppender, LZMATSVTableAppender):
+    opener = staticmethod(lzma.open)
+
+
+_APPENDER_CLASSES = {
+    "LZ77TSVTableAppender": {
+        "PERSISTENT": LZ77TSVTableAppender,
+        "REOPENING": _ReopeningLZ77TSVTableAppender
+    },
+    "LZMATSVTableAppender": {
+        "PERSISTENT": LZMATSVTableAppender,
+        "REOPENING": _ReopeningLZMATSVTableAppender
+    }
+}
+
+
+def _generate_rows(n_lines: int) -> List[List[Any]]:
+    """Rows resembling those of the memory tracer."""
+    rows = []
+    timestamp = time.time()
+    resident = 100 * 1024 * 1024
+    for i in range(n_lines):
+        resident += random.randint(-4096, 4096) * 16
+        rows.append([timestamp + i * 0.01, resident * 4, resident, 8 * 1024 * 1024, 0, 4096, resident // 2, 0])
+    return rows
+
+
+def _get_raw_bytes(rows: List[List[Any]]) -> int:
+    return len((
+            "\t".join(_HEADER) + "\n" +
+            "".join("\t".join(map(repr, row)) + "\n" for row in rows)
+    ).encode("UTF-8"))
+
+
+def bench_appender(
+        appender_class: Type[TSVTableAppender],
+        rows: List[List[Any]],
+        buffer_size: int
+) -> Tuple[float, int]:
+    """
+    Write ``rows`` using the appender in a temporary directory.
+
+    :return: Time spent in seconds and size of the table in bytes.
+    """
+    with tempfile.TemporaryDirectory() as dirname:
+        ts = time.time()
+        appender = appender_class(
+            os.path.join(dirname, "bench_compression"),
+            _HEADER,
+            TableAppenderConfig(buffer_size)
+        )
+        for row in rows:
+            appender.append(row)
+        appender.close()
+        te = time.time()
+        appender.validate_lines(len(rows))
+        table_bytes = sum(os.path.getsize(os.path.join(dirname, name)) for name in os.listdir(dirname))
+    return te - ts, table_bytes
+
+
+def bench(buffer_sizes: Iterable[int], n_runs: int = 5):
+    try:
+        os.remove("bench_compression_result.tsv")
+    except FileNotFoundError:
+        pass
+    final_result_appender = load_table_appender_class("TSVTableAppender")(
+        "bench_compression_result",
+        ["APPENDER_CLASS_NAME", "MODE", "BUFF_SIZE", "RUN_ID", "TIME_SPENT", "RAW_BYTES", "COMPRESSED_BYTES"],
+        TableAppenderConfig(1)
+    )
+    rows = _generate_rows(_N_LINES)
+    raw_bytes = _get_raw_bytes(rows)
+    for appender_class_name, appender_classes in _APPENDER_CLASSES.items():
+        for buffer_size in buffer_sizes:
+            desc = f"{appender_class_name}: buffer={buffer_size}"
+            for run_id in tqdm.tqdm(range(n_runs), desc=desc):
+                for mode, appender_class in appender_classes.items():
+                    time_spent, table_bytes = bench_appender(appender_class, rows, buffer_size)
+                    final_result_appender.append([
+                        appender_class_name, mode, buffer_size, run_id,
+                        time_spent, raw_bytes, table_bytes
+                    ])
+    final_result_appender.close()
+    _print_summary("bench_compression_result.tsv")
+
+
+def _print_summary(path: str):
+    df = pd.read_table(path, quotechar="'")
+    df["RATIO"] = df["RAW_BYTES"] / df["COMPRESSED_BYTES"]
+    df["MB_PER_SECOND"] = df["RAW_BYTES"] / df["TIME_SPENT"] / 1024 / 1024
+    print(
+        df
+        .groupby(["APPENDER_CLASS_NAME", "BUFF_SIZE", "MODE"])[["RATIO", "MB_PER_SECOND"]]
+        .mean()
+        .to_string()
+    )
+
+
+if __name__ == '__main__':
+    bench([16, 256])
@@ -1,49 +1,189 @@
 """
-Using arrow IPC format with one record per block.
+Using Arrow IPC file format with one record batch per flushed buffer.
 
-This application have bugs.
+The schema is derived from declared column types when the appender is created,
+so all batches share it. Columns without a declared type take the type of their first batch.
+The file can be memory-mapped and read zero-copy with :py:func:`pyarrow.ipc.open_file` once it is closed.
 """
 
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Iterator
 
-import pandas as pd
+import numpy as np
 import pyarrow as pa
 
-from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, DictBufferAppender
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, DictBufferAppender, ColumnBuffer, \
+    INT64, FLOAT64, CATEGORY, STRING, OBJECT
+
+_ARROW_TYPES = {
+    INT64: pa.int64(),
+    FLOAT64: pa.float64(),
+    CATEGORY: pa.dictionary(pa.int32(), pa.string()),
+    STRING: pa.string()
+}
+
+
+def get_arrow_schema(header: List[str], column_types: List[str]) -> Optional[pa.Schema]:
+    """
+    Get Arrow schema of declared column types, ``None`` if some columns are :py:data:`OBJECT`.
+    """
+    if OBJECT in column_types:
+        return None
+    return pa.schema([
+        (name, _ARROW_TYPES[column_type])
+        for name, column_type in zip(header, column_types)
+    ])
+
+
+def to_record_batch(buff: ColumnBuffer, schema: Optional[pa.Schema]) -> pa.RecordBatch:
+    """
+    Convert a buffer to a record batch without going through pandas.
+    Numeric columns are not copied, and category columns are dictionary-encoded with categories of this buffer.
+
+    :param schema: Schema to cast to. If ``None``, types of columns are inferred.
+    """
+    arrays = []
+    for i, (_, column_type, column) in enumerate(buff.iter_columns()):
+        if column_type == CATEGORY:
+            arrays.append(pa.DictionaryArray.from_arrays(
+                pa.array(column, type=pa.int32()),
+                pa.array(buff.get_categories(i), type=pa.string())
+            ))
+        elif schema is not None:
+            arrays.append(pa.array(column, type=schema.field(i).type))
+        else:
+            arrays.append(pa.array(column))
+    if schema is None:
+        return pa.RecordBatch.from_arrays(arrays, names=buff.header)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_batch_rows(batch: pa.RecordBatch) -> Iterator[List[Any]]:
+    """
+    Iterate over rows of a batch as lists of Python objects.
+    """
+    for row in zip(*(column.to_pylist() for column in batch.columns)):
+        yield list(row)
+
+
+def _iter_salvaged_batches(data: bytes) -> Iterator[pa.RecordBatch]:
+    try:
+        reader = pa.ipc.open_file(data)
+    except pa.ArrowException:
+        pass
+    else:
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+        return
+    # Without footer, the file is the stream format after the 8-byte leading magic.
+    try:
+        reader = pa.ipc.open_stream(data[8:])
+        while True:
+            yield reader.read_next_batch()
+    except (StopIteration, pa.ArrowException):
+        return
 
 
 class ArrowTableAppender(DictBufferAppender):
+    """
+    Write tables as Arrow IPC files.
+    """
     _schema: Optional[pa.Schema]
-    _file_handler: Optional[pa.RecordBatchStreamWriter]
+    _file_handler: Optional[pa.RecordBatchFileWriter]
+    _sink: Optional[pa.OSFile]
+    _categories: Dict[int, Dict[Any, int]]
+    """
+    Index of category column -> category -> code in the dictionary of this file.
+    Dictionaries only grow, so that new categories are written as dictionary deltas.
+    """
 
     def _get_n_lines_actually_written_hook(self) -> int:
-        return pa.ipc.open_stream(pa.OSFile(self._real_filename)).read_all().to_pandas().shape[0]
+        with pa.memory_map(self._real_filename) as source:
+            reader = pa.ipc.open_file(source)
+            return sum(
+                reader.get_batch(i).num_rows
+                for i in range(reader.num_record_batches)
+            )
 
-    def __init__(self, filename: str, header: List[str], tac: TableAppenderConfig):
-        super().__init__(filename, header, tac)
-        self._schema = None
+    def __init__(
+            self,
+            filename: str,
+            header: List[str],
+            tac: TableAppenderConfig,
+            column_types: Optional[List[str]] = None
+    ):
+        super().__init__(filename, header, tac, column_types)
+        self._categories = {
+            i: {}
+            for i, column_type in enumerate(self.column_types)
+            if column_type == CATEGORY
+        }
+        self._schema = get_arrow_schema(self.header, self.column_types)
         self._file_handler = None
+        self._sink = None
 
     def _get_real_filename_hook(self):
         self._real_filename = ".".join((self.filename, "arrow"))
 
+    @classmethod
+    def iter_salvaged_rows(
+            cls,
+            real_filename: str,
+            header: List[str],
+            column_types: List[str]
+    ) -> Iterator[List[Any]]:
+        with open(real_filename, mode="rb") as reader:
+            data = reader.read()
+        for batch in _iter_salvaged_batches(data):
+            yield from iter_batch_rows(batch)
+
     def _create_file_hook(self):
         pass
 
+    def _open_file_handler(self, schema: pa.Schema):
+        self._sink = pa.OSFile(self._real_filename, mode="wb")
+        self._file_handler = pa.ipc.new_file(
+            sink=self._sink,
+            schema=schema,
+            options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        )
+
     def _write_hook(self, df: pa.RecordBatch):
-        if self._schema is None:
+        if self._file_handler is None:
             self._schema = df.schema
-            self._file_handler = pa.ipc.new_stream(
-                sink=pa.OSFile(self._real_filename, mode="w"),
-                schema=df.schema
-            )
+            self._open_file_handler(df.schema)
         self._file_handler.write_batch(df)
 
-    def flush(self) -> pa.RecordBatch:
-        return pa.record_batch(pd.DataFrame.from_dict(data=self._buff))
+    def _to_arrow_array(self, buff: ColumnBuffer, i: int, column_type: str, column: Any) -> pa.Array:
+        if column_type == CATEGORY:
+            # Map codes of this buffer to codes of the file
+            categories = self._categories[i]
+            for category in buff.get_categories(i):
+                categories.setdefault(category, len(categories))
+            remap = np.array([categories[category] for category in buff.get_categories(i)], dtype=np.int32)
+            return pa.DictionaryArray.from_arrays(
+                pa.array(remap[column], type=pa.int32()),
+                pa.array(list(categories.keys()), type=pa.string())
+            )
+        if self._schema is not None:
+            return pa.array(column, type=self._schema.field(i).type)
+        return pa.array(column)
+
+    def flush(self, buff: ColumnBuffer) -> pa.RecordBatch:
+        arrays = [
+            self._to_arrow_array(buff, i, column_type, column)
+            for i, (_, column_type, column) in enumerate(buff.iter_columns())
+        ]
+        if self._schema is None:
+            return pa.RecordBatch.from_arrays(arrays, names=self.header)
+        return pa.RecordBatch.from_arrays(arrays, schema=self._schema)
 
     def close(self):
         super(ArrowTableAppender, self).close()
-        if self._file_handler is None:
-            return
-        self._file_handler.close()
+        with self._write_mutex:
+            if self._file_handler is None:
+                if self._schema is None:
+                    return
+                self._open_file_handler(self._schema)
+            self._file_handler.close()
+            self._sink.close()
+            self._file_handler = None
@@ -0,0 +1,205 @@
+"""
+background_writer -- Persist buffered rows of table appenders on dedicated writer threads
+
+Without a background writer, :py:func:`DictBufferAppender.append` formats and writes the buffer inline
+once it is full, so DataFrame construction, compression or SQLite inserts run on the tracer's thread,
+stalling sampling and skewing the next timestamp.
+
+With a :py:class:`BackgroundTableWriter` set in :py:class:`TableAppenderConfig`,
+the appender only swaps its full buffer for an empty one and submits it here.
+Each appender is pinned to one writer thread, so batches of the same file are written in order.
+If writers fall behind, tracers wait for room in the queue, unless asked to drop batches instead.
+
+Compression in :py:mod:`gzip` and :py:mod:`lzma` and most of pandas releases the GIL,
+so writer threads are enough to keep them off the tracers.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+_Job = Tuple[Any, Any, Optional[threading.Event]]
+"""The appender, the buffer to write (``None`` for a barrier) and an event set when done"""
+
+_STOP = None
+"""Put into queues to stop writer threads"""
+
+
+class _BackgroundTableWriterThread(threading.Thread):
+    """Worker thread of :py:class:`BackgroundTableWriter`."""
+
+    def __init__(self, writer: BackgroundTableWriter, job_queue: queue.Queue, worker_id: int):
+        super().__init__(name=f"BackgroundTableWriter-{worker_id}", daemon=True)
+        self.writer = writer
+        self.job_queue = job_queue
+
+    def run(self):
+        while True:
+            job = self.job_queue.get()
+            if job is _STOP:
+                return
+            appender, buff, done_event = job
+            if buff is not None:
+                self.writer.write_batch(appender, buff)
+            if done_event is not None:
+                done_event.set()
+
+
+class BackgroundTableWriter:
+    """
+    A pool of writer threads, each with a bounded queue of batches.
+
+    If the queue of a writer is full, the submitting thread waits for room, counted in :py:attr:`n_blocked_batches`.
+    With ``drop_when_full``, the batch is dropped and counted in :py:attr:`n_dropped_batches` instead,
+    so that tracers are never blocked, except when appenders are closed.
+    """
+
+    pool_size: int
+    queue_size: int
+    """Capacity of each writer's queue, in batches"""
+
+    drop_when_full: bool
+    """Whether batches are dropped instead of waiting when the queue is full"""
+
+    n_written_batches: int
+    n_blocked_batches: int
+    n_dropped_batches: int
+    n_dropped_rows: int
+    max_queue_depth: int
+    """Largest number of batches ever waiting in all queues"""
+
+    _queues: List[queue.Queue]
+    _workers: List[_BackgroundTableWriterThread]
+    _assignment: Dict[int, int]
+    """``id`` of appender -> index of the writer it is pinned to"""
+
+    _next_worker: itertools.cycle
+    _mutex: threading.Lock
+
+    def __init__(self, pool_size: int, queue_size: int, drop_when_full: bool = False):
+        if pool_size < 1:
+            raise ValueError(f"pool_size should be positive, got {pool_size}")
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.drop_when_full = drop_when_full
+        self.n_written_batches = 0
+        self.n_blocked_batches = 0
+        self.n_dropped_batches = 0
+        self.n_dropped_rows = 0
+        self.max_queue_depth = 0
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(pool_size)]
+        self._workers = []
+        self._assignment = {}
+        self._next_worker = itertools.cycle(range(pool_size))
+        self._mutex = threading.Lock()
+        self._log_handler = logging.getLogger()
+
+    def start(self):
+        for worker_id, job_queue in enumerate(self._queues):
+            worker = _BackgroundTableWriterThread(self, job_queue, worker_id)
+            worker.start()
+            self._workers.append(worker)
+        self._log_handler.debug(f"BackgroundTableWriter started with {self.pool_size} workers")
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of batches waiting to be written"""
+        return sum(job_queue.qsize() for job_queue in self._queues)
+
+    def _get_queue(self, appender: Any) -> queue.Queue:
+        with self._mutex:
+            try:
+                worker_id = self._assignment[id(appender)]
+            except KeyError:
+                worker_id = next(self._next_worker)
+                self._assignment[id(appender)] = worker_id
+        return self._queues[worker_id]
+
+    def submit(self, appender: Any, buff: Any, n_rows: int) -> bool:
+        """
+        Queue a full buffer of an appender, waiting for room if the queue is full
+        unless :py:attr:`drop_when_full` is set.
+
+        :return: Whether the buffer was queued. If not, it is dropped.
+        """
+        job_queue = self._get_queue(appender)
+        try:
+            job_queue.put_nowait((appender, buff, None))
+        except queue.Full:
+            if not self.drop_when_full:
+                with self._mutex:
+                    self.n_blocked_batches += 1
+                    n_blocked_batches = self.n_blocked_batches
+                if n_blocked_batches == 1:
+                    self._log_handler.warning(
+                        f"BackgroundTableWriter: queue full, waiting to write rows of {appender.filename}. "
+                        "Consider raising writer pool or queue size."
+                    )
+                job_queue.put((appender, buff, None))
+                return True
+            with self._mutex:
+                self.n_dropped_batches += 1
+                self.n_dropped_rows += n_rows
+                n_dropped_batches = self.n_dropped_batches
+            if n_dropped_batches == 1:
+                self._log_handler.warning(
+                    f"BackgroundTableWriter: queue full, dropping rows of {appender.filename}. "
+                    "Consider raising writer pool or queue size."
+                )
+            return False
+        depth = self.queue_depth
+        with self._mutex:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        return True
+
+    def drain(self, appender: Any, buff: Optional[Any] = None):
+        """
+        Queue the last buffer of an appender, blocking if the queue is full,
+        and wait until all its buffers are written. Used when closing appenders.
+        """
+        done_event = threading.Event()
+        job_queue = self._get_queue(appender)
+        job_queue.put((appender, buff, done_event))
+        done_event.wait()
+        with self._mutex:
+            self._assignment.pop(id(appender), None)
+
+    def write_batch(self, appender: Any, buff: Any):
+        try:
+            appender.write_buffer(buff)
+        except Exception as e:
+            self._log_handler.error(
+                f"BackgroundTableWriter: writing {appender.filename} "
+                f"{e.__class__.__name__} encountered! DETAILS={e.__repr__()}"
+            )
+            return
+        with self._mutex:
+            self.n_written_batches += 1
+
+    def stop(self):
+        """
+        Write everything queued and stop all workers.
+        """
+        for job_queue in self._queues:
+            job_queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._log_handler.debug(
+            f"BackgroundTableWriter stopped: WRITTEN_BATCHES={self.n_written_batches} "
+            f"BLOCKED_BATCHES={self.n_blocked_batches} "
+            f"DROPPED_BATCHES={self.n_dropped_batches} DROPPED_ROWS={self.n_dropped_rows} "
+            f"MAX_QUEUE_DEPTH={self.max_queue_depth}"
+        )
+
+    def __str__(self):
+        return "".join((
+            "WRITER: ",
+            "QUEUED: ", str(self.queue_depth), "/", str(self.queue_size * self.pool_size), ", ",
+            "MAX_QUEUED: ", str(self.max_queue_depth), ", ",
+            "BLOCKED: ", str(self.n_blocked_batches), " batches, ",
+            "DROPPED: ", str(self.n_dropped_rows), " rows"
+        ))
@@ -1,10 +1,11 @@
-from typing import List, Any
+from typing import List, Any, Optional
 
 from pid_monitor._dt_mvc.appender import BaseTableAppender
 from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig
 
 
 class DumbTableAppender(BaseTableAppender):
+    segmentable = False
 
     def _get_n_lines_actually_written_hook(self) -> int:
         return 0
@@ -12,8 +13,14 @@ class DumbTableAppender(BaseTableAppender):
     def validate_lines(self, required_number_of_lines: int) -> None:
         pass
 
-    def __init__(self, filename: str, header: List[str], tac: TableAppenderConfig):
-        super().__init__(filename, header, tac)
+    def __init__(
+            self,
+            filename: str,
+            header: List[str],
+            tac: TableAppenderConfig,
+            column_types: Optional[List[str]] = None
+    ):
+        super().__init__(filename, header, tac, column_types)
 
     def _get_real_filename_hook(self):
         self._real_filename = ""
@@ -25,4 +32,4 @@ class DumbTableAppender(BaseTableAppender):
         pass
 
     def close(self):
-        pass
+        self.closed = True
@@ -0,0 +1,99 @@
+"""
+flush_timer -- Flush buffers of table appenders that have waited too long
+
+Buffers of :py:class:`DictBufferAppender` are written once full,
+so rows of low-rate tables (e.g., ``.reg``) or of idle processes may stay in memory for long,
+and are lost if the tracer is killed.
+
+Appenders with :py:attr:`TableAppenderConfig.max_latency` set register themselves here
+when the first row enters an empty buffer.
+A single :py:class:`FlushTimer` thread keeps them in a heap ordered by due time
+and flushes each buffer once its oldest row reaches the latency,
+so no appender needs a thread of its own.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, List, Tuple
+
+_Entry = Tuple[float, int, Any]
+"""Monotonic due time, sequence number to break ties and the appender"""
+
+
+class FlushTimer(threading.Thread):
+    """
+    Thread that calls :py:func:`DictBufferAppender.flush_if_stale` of scheduled appenders when they are due.
+    """
+
+    n_flush_checks: int
+
+    _heap: List[_Entry]
+    _seq: itertools.count
+    _cond: threading.Condition
+    _should_exit: bool
+
+    def __init__(self):
+        super().__init__(name="FlushTimer", daemon=True)
+        self.n_flush_checks = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._should_exit = False
+        self._log_handler = logging.getLogger()
+
+    def schedule(self, appender: Any, due: float):
+        """
+        Check ``appender`` at monotonic time ``due``.
+        """
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._seq), appender))
+            if self._heap[0][2] is appender:
+                self._cond.notify()
+
+    def _wait_for_next(self) -> Any:
+        """
+        Wait until an appender is due and pop it, or return ``None`` if stopped.
+        """
+        with self._cond:
+            while not self._should_exit:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due = self._heap[0][0]
+                now = time.monotonic()
+                if due <= now:
+                    return heapq.heappop(self._heap)[2]
+                self._cond.wait(due - now)
+            return None
+
+    def run(self):
+        while True:
+            appender = self._wait_for_next()
+            if appender is None:
+                return
+            self.n_flush_checks += 1
+            try:
+                next_due = appender.flush_if_stale()
+            except Exception as e:
+                self._log_handler.error(
+                    f"FlushTimer: flushing {appender.filename} "
+                    f"{e.__class__.__name__} encountered! DETAILS={e.__repr__()}"
+                )
+                continue
+            if next_due is not None:
+                self.schedule(appender, next_due)
+
+    def stop(self):
+        """
+        Stop the timer. Appenders still scheduled are flushed when they are closed.
+        """
+        with self._cond:
+            self._should_exit = True
+            self._cond.notify()
+        self.join()
+        self._log_handler.debug(f"FlushTimer stopped: FLUSH_CHECKS={self.n_flush_checks}")
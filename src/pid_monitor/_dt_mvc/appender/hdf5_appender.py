@@ -1,19 +1,154 @@
-import os
+"""
+Using HDF5 tables of PyTables, through one :py:class:`pd.HDFStore` held open for the lifetime of the appender.
+
+Compression and chunk shape of the table are set when it is created by the first flush.
+Indexes of ``TIME`` (and ``PID`` of session tables) are only built at close,
+so appending does not slow down as the table grows.
+
+String columns are :py:data:`MIN_STRING_ITEMSIZE` bytes wide in UTF-8.
+Longer strings (e.g., long command lines or paths) are truncated with a warning,
+as PyTables would otherwise refuse the whole buffer.
+"""
+
+import logging
+import time
+from typing import Optional, List, Iterator, Any, Set
 
 import pandas as pd
 
-from pid_monitor._dt_mvc.appender.typing import PandasDictBufferAppender
+from pid_monitor._dt_mvc.appender.tsv_appender import SYNC_INTERVAL
+from pid_monitor._dt_mvc.appender.typing import PandasDictBufferAppender, ColumnBuffer, CATEGORY, STRING
+
+COMPLIB = "blosc:lz4"
+COMPLEVEL = 5
+
+EXPECTED_ROWS = 1000000
+"""Expected number of rows of a table, from which PyTables sizes its chunks"""
+
+MIN_STRING_ITEMSIZE = 1024
+"""Width of string columns, since PyTables tables cannot widen columns after creation"""
+
+SALVAGE_CHUNK_ROWS = 65536
+
+_KEY = "df"
+_INDEXED_COLUMNS = ("PID", "TIME")
+
+_LOG_HANDLER = logging.getLogger()
+
+
+def _truncate_strings(values: pd.Series, itemsize: int) -> Optional[pd.Series]:
+    """
+    Truncate strings longer than ``itemsize`` bytes in UTF-8, keeping whole characters.
+
+    :return: Truncated values, ``None`` if no string is too long.
+    """
+    # Characters are at most 4 bytes in UTF-8, so shorter strings need not be encoded.
+    is_candidate = values.str.len() > itemsize // 4
+    if not is_candidate.any():
+        return None
+    encoded = values[is_candidate].str.encode("UTF-8")
+    is_too_long = encoded.str.len() > itemsize
+    if not is_too_long.any():
+        return None
+    values = values.copy()
+    values[is_too_long[is_too_long].index] = encoded[is_too_long].map(
+        lambda value: value[:itemsize].decode("UTF-8", errors="ignore")
+    )
+    return values
 
 
 class HDF5TableAppender(PandasDictBufferAppender):
+    """
+    Write tables as HDF5, keeping the file open.
+    """
+    _store: Optional[pd.HDFStore]
+    _data_columns: List[str]
+    _string_columns: List[str]
+    _truncated_columns: Set[str]
+    _last_sync: float
+
     def _get_n_lines_actually_written_hook(self) -> int:
-        return pd.read_hdf(self._real_filename, key="df").shape[0]
+        with pd.HDFStore(self._real_filename, mode="r") as store:
+            if _KEY not in store:
+                return 0
+            return store.get_storer(_KEY).nrows
 
     def _get_real_filename_hook(self):
         self._real_filename = ".".join((self.filename, "hdf5"))
 
+    @classmethod
+    def iter_salvaged_rows(
+            cls,
+            real_filename: str,
+            header: List[str],
+            column_types: List[str]
+    ) -> Iterator[List[Any]]:
+        try:
+            with pd.HDFStore(real_filename, mode="r") as store:
+                if _KEY not in store:
+                    return
+                nrows = store.get_storer(_KEY).nrows
+                for start in range(0, nrows, SALVAGE_CHUNK_ROWS):
+                    df = store.select(_KEY, start=start, stop=start + SALVAGE_CHUNK_ROWS)
+                    for row in df.itertuples(index=False, name=None):
+                        yield list(row)
+        except Exception:
+            # HDF5 reports damaged files with errors of many types
+            return
+
     def _create_file_hook(self):
-        pass
+        self._store = pd.HDFStore(self._real_filename, mode="w", complevel=COMPLEVEL, complib=COMPLIB)
+        self._data_columns = [name for name in _INDEXED_COLUMNS if name in self.header]
+        self._string_columns = [
+            name
+            for name, column_type in zip(self.header, self.column_types)
+            if column_type in (CATEGORY, STRING)
+        ]
+        self._truncated_columns = set()
+        self._last_sync = time.monotonic()
+
+    def flush(self, buff: ColumnBuffer) -> pd.DataFrame:
+        df = super().flush(buff)
+        # Categories differ among buffers, which tables of PyTables cannot append.
+        for name, column_type in zip(self.header, self.column_types):
+            if column_type == CATEGORY:
+                df[name] = df[name].astype(object)
+        for name in self._string_columns:
+            truncated = _truncate_strings(df[name], MIN_STRING_ITEMSIZE)
+            if truncated is None:
+                continue
+            df[name] = truncated
+            if name not in self._truncated_columns:
+                self._truncated_columns.add(name)
+                _LOG_HANDLER.warning(
+                    f"{self._real_filename}: Strings of column {name} longer than {MIN_STRING_ITEMSIZE} bytes truncated"
+                )
+        return df
 
     def _write_hook(self, df: pd.DataFrame):
-        df.to_hdf(self._real_filename, key="df", format='table', append=os.path.exists(self._real_filename))
+        self._store.append(
+            _KEY,
+            df,
+            format="table",
+            index=False,
+            data_columns=self._data_columns,
+            expectedrows=EXPECTED_ROWS,
+            min_itemsize={name: MIN_STRING_ITEMSIZE for name in self._string_columns}
+        )
+        now = time.monotonic()
+        if now - self._last_sync >= SYNC_INTERVAL:
+            self._sync_hook()
+            self._last_sync = now
+
+    def _sync_hook(self):
+        self._store.flush()
+
+    def close(self):
+        super().close()
+        with self._write_mutex:
+            if self._store is None:
+                return
+            if _KEY in self._store and self._data_columns:
+                self._store.create_table_index(_KEY, columns=self._data_columns, optlevel=6, kind="medium")
+            self._store.close()
+            self._store = None
@@ -1,17 +1,38 @@
 import lzma
+from typing import BinaryIO, Optional
 
-from pid_monitor._dt_mvc.appender.tsv_appender import TSVTableAppender
+from pid_monitor._dt_mvc.appender.tsv_appender import TSVTableAppender, salvage_decompress
 
 
 class LZMATSVTableAppender(TSVTableAppender):
+    """
+    Write tables as xz-compressed TSV with one xz stream between two syncs.
+
+    The xz format does not support sync flushes,
+    so syncing ends the current stream and starts a new one in the same file.
+    Concatenated streams are valid xz files.
+    """
+
+    _raw_writer: Optional[BinaryIO]
 
     def _get_real_filename_hook(self):
         self._real_filename = ".".join((self.filename, "tsv", "xz"))
 
-    def _create_file_hook(self):
-        with lzma.open(self._real_filename, mode="wt") as writer:
-            writer.write("\t".join(self.header) + "\n")
+    def _open_writer_hook(self) -> BinaryIO:
+        self._raw_writer = open(self._real_filename, mode="wb")
+        return lzma.LZMAFile(self._raw_writer, mode="wb")
+
+    def _sync_hook(self):
+        self._writer.close()
+        self._raw_writer.flush()
+        self._writer = lzma.LZMAFile(self._raw_writer, mode="wb")
+
+    def _close_writer_hook(self):
+        self._writer.close()
+        self._raw_writer.close()
+        self._raw_writer = None
 
-    def _write_hook(self, df: str):
-        with lzma.open(self._real_filename, mode="at") as writer:
-            writer.write(df)
+    @classmethod
+    def _read_salvaged_hook(cls, real_filename: str) -> bytes:
+        with open(real_filename, mode="rb") as reader:
+            return salvage_decompress(reader.read(), lzma.LZMADecompressor, lzma.LZMAError)
@@ -1,21 +1,149 @@
+"""
+Using Parquet with row groups of a configured size.
+
+Flushed buffers are gathered until :py:attr:`TableAppenderConfig.row_group_size` rows
+or :py:attr:`TableAppenderConfig.row_group_bytes` bytes, whichever comes first,
+and each row group is written to its own part file under ``{filename}.parquet.parts``.
+Part files are written under a hidden name and renamed into place once complete,
+so the directory can be read as a Parquet dataset at any time during tracing.
+At close, the parts are compacted into ``{filename}.parquet`` and removed.
+
+String and category columns are dictionary-encoded.
+"""
+
+import glob
 import os
+import shutil
+from typing import List, Optional, Iterator, Any
 
-import fastparquet as fp
-import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-from pid_monitor._dt_mvc.appender.typing import PandasDictBufferAppender
+from pid_monitor._dt_mvc.appender.arrow_appender import get_arrow_schema, to_record_batch, iter_batch_rows
+from pid_monitor._dt_mvc.appender.typing import DictBufferAppender, ColumnBuffer, CATEGORY, STRING
 
 
-class ParquetTableAppender(PandasDictBufferAppender):
+class ParquetTableAppender(DictBufferAppender):
+    """
+    Write tables as Parquet, in row groups of configured size.
+    """
+    _schema: Optional[pa.Schema]
+    _parts_dirname: str
+    _pending_batches: List[pa.RecordBatch]
+    _n_pending_rows: int
+    _n_pending_bytes: int
+    _n_parts: int
+    _compacted: bool
+    """Whether parts were compacted into the final file, which readers are then pointed at"""
 
     def _get_n_lines_actually_written_hook(self) -> int:
-        return pd.read_parquet(self._real_filename).shape[0]
+        return pq.ParquetFile(self._real_filename).metadata.num_rows
 
     def _get_real_filename_hook(self):
         self._real_filename = ".".join((self.filename, "parquet"))
+        self._parts_dirname = ".".join((self._real_filename, "parts"))
+
+    @classmethod
+    def iter_salvaged_rows(
+            cls,
+            real_filename: str,
+            header: List[str],
+            column_types: List[str]
+    ) -> Iterator[List[Any]]:
+        if os.path.exists(real_filename):
+            part_filenames = [real_filename]
+        else:
+            # Not compacted: read parts renamed into place
+            part_filenames = sorted(glob.glob(os.path.join(glob.escape(real_filename + ".parts"), "part-*.parquet")))
+        for part_filename in part_filenames:
+            try:
+                parquet_file = pq.ParquetFile(part_filename)
+                for i in range(parquet_file.num_row_groups):
+                    yield from iter_batch_rows(parquet_file.read_row_group(i))
+            except (OSError, pa.ArrowException):
+                return
+
+    def get_readable_filename(self) -> str:
+        return self._real_filename if self._compacted else self._parts_dirname
+
+    def _remove_existing_file_hook(self):
+        super()._remove_existing_file_hook()
+        shutil.rmtree(self._parts_dirname, ignore_errors=True)
 
     def _create_file_hook(self):
-        pass
+        self._schema = get_arrow_schema(self.header, self.column_types)
+        self._pending_batches = []
+        self._n_pending_rows = 0
+        self._n_pending_bytes = 0
+        self._n_parts = 0
+        self._compacted = False
+
+    def _get_dictionary_columns(self) -> List[str]:
+        return [
+            name
+            for name, column_type in zip(self.header, self.column_types)
+            if column_type in (CATEGORY, STRING)
+        ]
+
+    def flush(self, buff: ColumnBuffer) -> pa.RecordBatch:
+        return to_record_batch(buff, self._schema)
+
+    def _write_hook(self, df: pa.RecordBatch):
+        if self._schema is None:
+            self._schema = df.schema
+        self._pending_batches.append(df)
+        self._n_pending_rows += df.num_rows
+        self._n_pending_bytes += df.nbytes
+        if self._n_pending_rows >= self._tac.row_group_size or self._n_pending_bytes >= self._tac.row_group_bytes:
+            self._write_part()
+
+    def _write_part(self):
+        """
+        Write pending batches as one row group of a new part file.
+        """
+        if not self._pending_batches:
+            return
+        table = pa.Table.from_batches(self._pending_batches, schema=self._schema)
+        os.makedirs(self._parts_dirname, exist_ok=True)
+        part_basename = f"part-{self._n_parts:06d}.parquet"
+        part_filename = os.path.join(self._parts_dirname, part_basename)
+        # Hidden files are skipped by readers of the directory
+        tmp_part_filename = os.path.join(self._parts_dirname, f".{part_basename}.tmp")
+        pq.write_table(
+            table,
+            tmp_part_filename,
+            row_group_size=table.num_rows,
+            use_dictionary=self._get_dictionary_columns()
+        )
+        os.replace(tmp_part_filename, part_filename)
+        self._n_parts += 1
+        self._pending_batches = []
+        self._n_pending_rows = 0
+        self._n_pending_bytes = 0
+
+    def _compact(self):
+        """
+        Merge part files into the final file, one part at a time.
+        """
+        if self._schema is None:
+            return
+        compacted_filename = self._real_filename + ".tmp"
+        with pq.ParquetWriter(
+                compacted_filename,
+                schema=self._schema,
+                use_dictionary=self._get_dictionary_columns()
+        ) as writer:
+            for part_id in range(self._n_parts):
+                part_filename = os.path.join(self._parts_dirname, f"part-{part_id:06d}.parquet")
+                writer.write_table(pq.read_table(part_filename, schema=self._schema))
+        os.replace(compacted_filename, self._real_filename)
+        self._compacted = True
+        shutil.rmtree(self._parts_dirname, ignore_errors=True)
 
-    def _write_hook(self, df: pd.DataFrame):
-        fp.write(self._real_filename, df, append=os.path.exists(self._real_filename))
+    def close(self):
+        super().close()
+        with self._write_mutex:
+            if self._compacted:
+                return
+            self._write_part()
+            self._compact()
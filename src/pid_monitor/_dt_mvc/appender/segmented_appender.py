@@ -0,0 +1,214 @@
+"""
+segmented_appender -- Write a table as rolling segments recorded in a manifest
+
+A tracer killed together with the workload (e.g., by the OOM killer) leaves its last file of each table truncated,
+which for some formats (gzip without trailer, Parquet or Arrow files without footer) cannot be read as a whole.
+
+:py:class:`SegmentedTableAppender` writes table ``{filename}`` as segments ``{filename}.seg{N}``,
+each a complete file of the wrapped appender class, and starts a new segment
+once the current one holds :py:attr:`TableAppenderConfig.segment_rows` rows
+or is older than :py:attr:`TableAppenderConfig.segment_duration` seconds.
+A segment is closed and ``fsync``-ed before it is recorded as closed in the manifest, ``{filename}.manifest.jsonl``,
+which is ``fsync``-ed after each record.
+
+So after a crash, only the segment being written may be damaged,
+and ``python -m pid_monitor recover`` stitches segments back into one table per manifest.
+
+The manifest is in JSON Lines. Its first record describes the table::
+
+    {"type": "table", "filename": ..., "table_appender_type": ..., "header": [...], "column_types": [...]}
+
+followed by a record of each segment when it is opened and when it is closed::
+
+    {"type": "segment", "segment": 0, "filename": ..., "state": "open"}
+    {"type": "segment", "segment": 0, "filename": ..., "state": "closed",
+     "n_rows": ..., "first_time": ..., "last_time": ...}
+
+and an ``{"type": "end", "n_rows": ...}`` record if the appender was closed normally.
+Filenames are relative to the directory of the manifest.
+"""
+
+import glob
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Type
+
+from pid_monitor._dt_mvc.appender.table_index import TableIndex, merge_table_indexes
+from pid_monitor._dt_mvc.appender.typing import BaseTableAppender, TableAppenderConfig
+
+MANIFEST_SUFFIX = "manifest.jsonl"
+
+
+def get_manifest_filename(filename: str) -> str:
+    return ".".join((filename, MANIFEST_SUFFIX))
+
+
+def read_manifest(manifest_filename: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read records of a manifest, skipping a last record cut by a crash.
+    """
+    with open(manifest_filename, encoding="UTF-8") as reader:
+        for line in reader:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                return
+
+
+def _fsync_path(path: str):
+    if not os.path.isfile(path):
+        return
+    with open(path, "rb") as reader:
+        os.fsync(reader.fileno())
+
+
+class SegmentedTableAppender(BaseTableAppender):
+    """
+    Write a table as segments of another appender class, see :py:mod:`segmented_appender`.
+    """
+
+    appender_class: Type[BaseTableAppender]
+    n_rows: int
+
+    _column_types: Optional[List[str]]
+    _time_index: Optional[int]
+    _manifest: Optional[TextIO]
+    _segment: Optional[BaseTableAppender]
+    _closed_segments: List[BaseTableAppender]
+    _segment_id: int
+    _segment_n_rows: int
+    _segment_start: float
+    _segment_first_time: float
+    _segment_last_time: float
+    _mutex: threading.Lock
+
+    def __init__(
+            self,
+            filename: str,
+            header: List[str],
+            tac: TableAppenderConfig,
+            column_types: Optional[List[str]] = None,
+            appender_class: Type[BaseTableAppender] = None
+    ):
+        self.appender_class = appender_class
+        self.n_rows = 0
+        self._segment = None
+        self._closed_segments = []
+        self._segment_id = 0
+        self._mutex = threading.Lock()
+        super().__init__(filename, header, tac, column_types)
+
+    def _get_real_filename_hook(self):
+        self._real_filename = get_manifest_filename(self.filename)
+
+    def _remove_existing_file_hook(self):
+        super()._remove_existing_file_hook()
+        for stale_path in glob.glob(glob.escape(self.filename) + ".seg*"):
+            if os.path.isdir(stale_path):
+                shutil.rmtree(stale_path, ignore_errors=True)
+            else:
+                os.remove(stale_path)
+
+    def _create_file_hook(self):
+        self._time_index = self.header.index("TIME") if "TIME" in self.header else None
+        self._manifest = open(self._real_filename, mode="w", encoding="UTF-8")
+        self._write_record({
+            "type": "table",
+            "filename": os.path.basename(self.filename),
+            "table_appender_type": self.appender_class.__name__,
+            "header": self.header,
+            "column_types": self.column_types
+        })
+        self._open_segment()
+
+    def _write_record(self, record: Dict[str, Any]):
+        self._manifest.write(json.dumps(record) + "\n")
+        self._manifest.flush()
+        os.fsync(self._manifest.fileno())
+
+    def _open_segment(self):
+        self._segment = self.appender_class(
+            filename=f"{self.filename}.seg{self._segment_id:06d}",
+            header=self.header,
+            tac=self._tac,
+            column_types=self.column_types
+        )
+        self._segment_n_rows = 0
+        self._segment_start = time.monotonic()
+        self._segment_first_time = math.nan
+        self._segment_last_time = math.nan
+        self._write_record({
+            "type": "segment",
+            "segment": self._segment_id,
+            "filename": os.path.basename(self._segment._real_filename),
+            "state": "open"
+        })
+
+    def _close_segment(self):
+        segment = self._segment
+        self._segment = None
+        segment.close()
+        _fsync_path(segment._real_filename)
+        self._closed_segments.append(segment)
+        self._write_record({
+            "type": "segment",
+            "segment": self._segment_id,
+            "filename": os.path.basename(segment._real_filename),
+            "state": "closed",
+            "n_rows": self._segment_n_rows,
+            "first_time": None if math.isnan(self._segment_first_time) else self._segment_first_time,
+            "last_time": None if math.isnan(self._segment_last_time) else self._segment_last_time
+        })
+        self._segment_id += 1
+
+    def _should_rotate(self) -> bool:
+        if self._segment_n_rows == 0:
+            return False
+        if 0 < self._tac.segment_rows <= self._segment_n_rows:
+            return True
+        return 0 < self._tac.segment_duration <= time.monotonic() - self._segment_start
+
+    def append(self, body: List[Any]):
+        with self._mutex:
+            if self._segment is None:
+                raise ValueError(f"Appending to closed table {self.filename}")
+            if self._should_rotate():
+                self._close_segment()
+                self._open_segment()
+            self._segment.append(body)
+            if self._time_index is not None:
+                if self._segment_n_rows == 0:
+                    self._segment_first_time = body[self._time_index]
+                self._segment_last_time = body[self._time_index]
+            self._segment_n_rows += 1
+            self.n_rows += 1
+
+    def get_table_index(self) -> Optional[TableIndex]:
+        with self._mutex:
+            segments = list(self._closed_segments)
+            if self._segment is not None:
+                segments.append(self._segment)
+        table_indexes = [segment.get_table_index() for segment in segments]
+        if None in table_indexes:
+            return None
+        return merge_table_indexes(table_indexes)
+
+    def _get_n_lines_actually_written_hook(self) -> int:
+        return sum(
+            segment.get_n_lines_written()
+            for segment in self._closed_segments
+        )
+
+    def close(self):
+        with self._mutex:
+            if self._segment is None:
+                return
+            self._close_segment()
+            self._write_record({"type": "end", "n_rows": self.n_rows})
+            self._manifest.close()
+            self._manifest = None
+            self.closed = True
@@ -0,0 +1,294 @@
+"""
+session_manifest -- Describe the processes and tables of a tracing session in one file
+
+Post-processing used to find tables by globbing the output directory and telling them apart by their names,
+which is slow on large directories and breaks as soon as a name contains ``sys`` or ``final``.
+
+:py:class:`SessionManifest` is written by :py:func:`trace_pid` to ``{output_basename}.manifest.json``
+when tracing starts, rewritten every :py:data:`UPDATE_INTERVAL` seconds and when tracing ends.
+Rewrites replace the file atomically, so readers never see a partial manifest. It looks like::
+
+    {
+        "version": 1,
+        "state": "running" or "finished",
+        "toplevel_pid": ..., "table_appender_type": ..., "start_time": ..., "end_time": ...,
+        "n_dropped_rows": ...,
+        "processes": {
+            "1234": {"ppid": ..., "name": ..., "start_time": ..., "end_time": ...}
+        },
+        "tables": [
+            {"table": "mem", "kind": "process", "pid": 1234, "filename": ..., "table_appender_type": ...,
+             "segmented": false, "shared": false, "header": [...], "column_types": [...],
+             "n_rows": ..., "min_time": ..., "max_time": ...}
+        ]
+    }
+
+``kind`` of a table is ``process`` for per-process tables (``pid`` is set),
+``system`` for system-level tables (``sys.*``) and ``session`` for other tables of the session,
+like ``reg``, ``exit`` or shared tables of :py:class:`SessionStore`.
+Per-process tables kept in a shared table have ``shared`` set and their rows are those with their ``PID``.
+Filenames are relative to the directory of the manifest, and segmented tables point to their manifests.
+Parquet tables point to the directory of their part files until they are compacted at close.
+Row counts and time ranges are ``null`` if unknown.
+``n_dropped_rows`` counts rows dropped by the background writer with ``--writer_drop_when_full``.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from pid_monitor._dt_mvc.appender.background_writer import BackgroundTableWriter
+from pid_monitor._dt_mvc.appender.segmented_appender import SegmentedTableAppender
+from pid_monitor._dt_mvc.appender.typing import BaseTableAppender
+
+SESSION_MANIFEST_VERSION = 1
+
+MANIFEST_SUFFIX = "manifest.json"
+
+UPDATE_INTERVAL = 5.0
+"""Interval in seconds between two rewrites of the manifest while tracing"""
+
+TABLE_KIND_PROCESS = "process"
+TABLE_KIND_SYSTEM = "system"
+TABLE_KIND_SESSION = "session"
+
+
+def get_session_manifest_filename(output_basename: str) -> str:
+    return ".".join((output_basename, MANIFEST_SUFFIX))
+
+
+def _to_json_float(value: Optional[float]) -> Optional[float]:
+    if value is None or math.isnan(value):
+        return None
+    return value
+
+
+class _TableEntry:
+    table_name: str
+    kind: str
+    pid: Optional[int]
+    shared: bool
+    appender: BaseTableAppender
+
+    def __init__(self, table_name: str, kind: str, pid: Optional[int], shared: bool, appender: BaseTableAppender):
+        self.table_name = table_name
+        self.kind = kind
+        self.pid = pid
+        self.shared = shared
+        self.appender = appender
+
+
+class SessionManifest(threading.Thread):
+    """
+    Keep track of processes and tables of a session, and rewrite the manifest periodically.
+    """
+
+    filename: str
+    n_writes: int
+
+    _dirname: str
+    _session: Dict[str, Any]
+    _processes: Dict[int, Dict[str, Any]]
+    _tables: List[Union[_TableEntry, Dict[str, Any]]]
+    """Tables being written, and descriptions of closed tables, which are no longer looked up"""
+    _background_writer: Optional[BackgroundTableWriter]
+    _mutex: threading.Lock
+    _should_exit: threading.Event
+
+    def __init__(
+            self,
+            output_basename: str,
+            toplevel_pid: int,
+            table_appender_type: str,
+            background_writer: Optional[BackgroundTableWriter] = None
+    ):
+        super().__init__(name="SessionManifest", daemon=True)
+        self.filename = get_session_manifest_filename(output_basename)
+        self.n_writes = 0
+        self._dirname = os.path.dirname(os.path.abspath(self.filename))
+        self._session = {
+            "version": SESSION_MANIFEST_VERSION,
+            "state": "running",
+            "toplevel_pid": toplevel_pid,
+            "table_appender_type": table_appender_type,
+            "start_time": time.time(),
+            "end_time": None
+        }
+        self._processes = {}
+        self._tables = []
+        self._background_writer = background_writer
+        self._mutex = threading.Lock()
+        self._should_exit = threading.Event()
+
+    def add_process(self, pid: int, ppid: int, name: str, start_time: float):
+        with self._mutex:
+            self._processes[pid] = {
+                "ppid": ppid,
+                "name": name,
+                "start_time": start_time,
+                "end_time": None
+            }
+
+    def end_process(self, pid: int, end_time: float):
+        with self._mutex:
+            try:
+                self._processes[pid]["end_time"] = end_time
+            except KeyError:
+                pass
+
+    def add_table(
+            self,
+            appender: BaseTableAppender,
+            table_name: str,
+            kind: str,
+            pid: Optional[int] = None,
+            shared: bool = False
+    ):
+        with self._mutex:
+            self._tables.append(_TableEntry(table_name, kind, pid, shared, appender))
+
+    def _describe_table(self, entry: _TableEntry, is_final: bool) -> Dict[str, Any]:
+        appender = entry.appender
+        if isinstance(appender, SegmentedTableAppender):
+            table_appender_type = appender.appender_class.__name__
+        elif entry.shared:
+            table_appender_type = self._session["table_appender_type"]
+        else:
+            table_appender_type = appender.__class__.__name__
+        table_index = appender.get_table_index()
+        if table_index is None and is_final:
+            try:
+                n_rows = appender.get_n_lines_written()
+            except Exception:
+                # Errors of reading back depend on the format
+                n_rows = None
+            min_time = max_time = None
+        elif table_index is None:
+            n_rows = min_time = max_time = None
+        else:
+            n_rows, min_time, max_time = table_index
+        return {
+            "table": entry.table_name,
+            "kind": entry.kind,
+            "pid": entry.pid,
+            "filename": os.path.relpath(os.path.abspath(appender.get_readable_filename()), self._dirname),
+            "table_appender_type": table_appender_type,
+            "segmented": isinstance(appender, SegmentedTableAppender),
+            "shared": entry.shared,
+            "header": appender.header,
+            "column_types": appender.column_types,
+            "n_rows": n_rows,
+            "min_time": _to_json_float(min_time),
+            "max_time": _to_json_float(max_time)
+        }
+
+    def _describe_tables(
+            self,
+            tables: List[Union[_TableEntry, Dict[str, Any]]],
+            is_final: bool
+    ) -> List[Dict[str, Any]]:
+        """
+        Describe tables, and replace closed ones by their descriptions, so their appenders can be freed.
+        """
+        descriptions = []
+        frozen = {}
+        for i, entry in enumerate(tables):
+            if isinstance(entry, dict):
+                descriptions.append(entry)
+                continue
+            is_closed = entry.appender.closed
+            description = self._describe_table(entry, is_final or is_closed)
+            if is_closed:
+                frozen[i] = description
+            descriptions.append(description)
+        with self._mutex:
+            for i, description in frozen.items():
+                self._tables[i] = description
+        return descriptions
+
+    def write(self, is_final: bool = False):
+        """
+        Rewrite the manifest. Row counts of appenders without index are only looked up once they are closed.
+        """
+        with self._mutex:
+            manifest = dict(self._session)
+            manifest["processes"] = {str(pid): dict(process) for pid, process in self._processes.items()}
+            tables = list(self._tables)
+        manifest["n_dropped_rows"] = 0 if self._background_writer is None else self._background_writer.n_dropped_rows
+        manifest["tables"] = self._describe_tables(tables, is_final)
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, mode="w", encoding="UTF-8") as writer:
+            json.dump(manifest, writer, indent=1)
+        os.replace(tmp_filename, self.filename)
+        self.n_writes += 1
+
+    def run(self):
+        while not self._should_exit.wait(UPDATE_INTERVAL):
+            self.write()
+
+    def stop(self):
+        """
+        Stop rewriting and write the final manifest. Call after all appenders are closed.
+        """
+        self._should_exit.set()
+        self.join()
+        with self._mutex:
+            self._session["state"] = "finished"
+            self._session["end_time"] = time.time()
+        self.write(is_final=True)
+
+
+def find_session_manifest(path: str) -> Optional[str]:
+    """
+    Find the manifest of a session given its output basename, the manifest itself,
+    or the directory holding it (as is created by ``trace_cmd``).
+
+    :return: ``None`` if not found.
+    """
+    candidates = [path, get_session_manifest_filename(path)]
+    if os.path.isdir(path):
+        candidates.append(get_session_manifest_filename(os.path.join(path, "")))
+        candidates.extend(
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if name.endswith("." + MANIFEST_SUFFIX)
+        )
+    for candidate in candidates:
+        if candidate.endswith(MANIFEST_SUFFIX) and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def load_session_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the manifest found by :py:func:`find_session_manifest`,
+    with filenames of tables made relative to the current directory.
+    """
+    manifest_filename = find_session_manifest(path)
+    if manifest_filename is None:
+        return None
+    with open(manifest_filename, encoding="UTF-8") as reader:
+        manifest = json.load(reader)
+    dirname = os.path.dirname(manifest_filename)
+    for table in manifest["tables"]:
+        table["filename"] = os.path.join(dirname, table["filename"])
+    return manifest
+
+
+def iter_manifest_tables(
+        manifest: Dict[str, Any],
+        table_name: Optional[str] = None,
+        kind: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over tables of a manifest, optionally of one name and kind.
+    """
+    for table in manifest["tables"]:
+        if table_name is not None and table["table"] != table_name:
+            continue
+        if kind is not None and table["kind"] != kind:
+            continue
+        yield table
@@ -0,0 +1,224 @@
+"""
+session_store -- Consolidate per-process tables of a tracing session into shared long-format tables
+
+By default, every traced process gets its own ``{basename}.{pid}.{table}`` file per table,
+so a run with thousands of processes leaves tens of thousands of small files,
+which is slow on shared filesystems both while tracing and while post-processing.
+
+With a :py:class:`SessionStore`, rows of table ``{table}`` of all processes go to one shared appender,
+``{basename}.session.{table}``, with an extra leading ``PID`` column.
+When the store is closed, ``{basename}.session.index`` records, for each process and table,
+the number of rows and the first and last ``TIME``.
+The number of files then depends only on the number of tables.
+"""
+
+import math
+import threading
+from typing import Any, Dict, List, Optional
+
+from pid_monitor._dt_mvc.appender import create_table_appender
+from pid_monitor._dt_mvc.appender.session_manifest import SessionManifest, TABLE_KIND_SESSION
+from pid_monitor._dt_mvc.appender.table_index import TableIndex
+from pid_monitor._dt_mvc.appender.typing import BaseTableAppender, TableAppenderConfig, get_column_types, \
+    INT64, FLOAT64, CATEGORY
+
+SESSION_INDEX_HEADER = [
+    "PID",
+    "TABLE",
+    "N_ROWS",
+    "FIRST_TIME",
+    "LAST_TIME"
+]
+"""Header of the index table"""
+
+SESSION_INDEX_COLUMN_TYPES = [INT64, CATEGORY, INT64, FLOAT64, FLOAT64]
+
+
+class SessionTableAppender(BaseTableAppender):
+    """
+    Appender of one table of one process, which prepends PID to each row
+    and forwards it to the shared appender of the table.
+
+    It creates no file by itself.
+    """
+
+    pid: int
+    table_name: str
+    n_rows: int
+    first_time: float
+    last_time: float
+
+    _shared_appender: BaseTableAppender
+    _has_time: bool
+
+    def __init__(
+            self,
+            filename: str,
+            header: List[str],
+            pid: int,
+            table_name: str,
+            shared_appender: BaseTableAppender,
+            column_types: Optional[List[str]] = None
+    ):
+        # BaseTableAppender.__init__ is not called since it would (re-)create the file.
+        self.filename = filename
+        self.header = header
+        self.column_types = get_column_types(header, column_types)
+        self.closed = False
+        self.pid = pid
+        self.table_name = table_name
+        self._shared_appender = shared_appender
+        self._tac = shared_appender._tac
+        self._get_real_filename_hook()
+        self._has_time = len(header) > 0 and header[0] == "TIME"
+        self.n_rows = 0
+        self.first_time = math.nan
+        self.last_time = math.nan
+
+    def _get_real_filename_hook(self):
+        self._real_filename = self._shared_appender._real_filename
+
+    def _create_file_hook(self):
+        pass
+
+    def _get_n_lines_actually_written_hook(self) -> int:
+        return self.n_rows
+
+    def get_table_index(self) -> Optional[TableIndex]:
+        return TableIndex(
+            self.n_rows,
+            None if math.isnan(self.first_time) else self.first_time,
+            None if math.isnan(self.last_time) else self.last_time
+        )
+
+    def append(self, body: List[Any]):
+        row = [self.pid]
+        row.extend(body)
+        self._shared_appender.append(row)
+        if self._has_time:
+            if self.n_rows == 0:
+                self.first_time = body[0]
+            self.last_time = body[0]
+        self.n_rows += 1
+
+    def close(self):
+        self.closed = True
+
+
+class SessionStore:
+    """
+    Create :py:class:`SessionTableAppender` for per-process tables
+    and own the shared appenders behind them.
+    """
+
+    output_basename: str
+    table_appender_type: str
+
+    _tac: TableAppenderConfig
+    _session_manifest: Optional[SessionManifest]
+    _shared_appenders: Dict[str, BaseTableAppender]
+    _headers: Dict[str, List[str]]
+    _column_types: Dict[str, List[str]]
+    _table_appenders: List[SessionTableAppender]
+    _mutex: threading.Lock
+
+    def __init__(
+            self,
+            output_basename: str,
+            table_appender_type: str,
+            tac: TableAppenderConfig,
+            session_manifest: Optional[SessionManifest] = None
+    ):
+        self.output_basename = output_basename
+        self.table_appender_type = table_appender_type
+        self._tac = tac
+        self._session_manifest = session_manifest
+        self._shared_appenders = {}
+        self._headers = {}
+        self._column_types = {}
+        self._table_appenders = []
+        self._mutex = threading.Lock()
+
+    def _create_shared_appender(
+            self,
+            table_name: str,
+            header: List[str],
+            column_types: List[str]
+    ) -> BaseTableAppender:
+        shared_appender = create_table_appender(
+            table_appender_type=self.table_appender_type,
+            filename=f"{self.output_basename}.session.{table_name}",
+            header=header,
+            tac=self._tac,
+            column_types=column_types
+        )
+        if self._session_manifest is not None:
+            self._session_manifest.add_table(shared_appender, f"session.{table_name}", TABLE_KIND_SESSION)
+        return shared_appender
+
+    def create_appender(
+            self,
+            pid: int,
+            table_name: str,
+            header: List[str],
+            column_types: Optional[List[str]] = None
+    ) -> SessionTableAppender:
+        """
+        Get an appender for table ``table_name`` of process ``pid``.
+
+        :raises ValueError: If the header or column types differ from those of other processes.
+        """
+        column_types = get_column_types(header, column_types)
+        with self._mutex:
+            try:
+                shared_appender = self._shared_appenders[table_name]
+            except KeyError:
+                shared_appender = self._create_shared_appender(
+                    table_name,
+                    ["PID", *header],
+                    [INT64, *column_types]
+                )
+                self._shared_appenders[table_name] = shared_appender
+                self._headers[table_name] = list(header)
+                self._column_types[table_name] = column_types
+            if self._headers[table_name] != list(header) or self._column_types[table_name] != column_types:
+                raise ValueError(
+                    f"Header of table {table_name} for PID {pid} is {header} of {column_types}, "
+                    f"while {self._headers[table_name]} of {self._column_types[table_name]} is expected"
+                )
+            table_appender = SessionTableAppender(
+                filename=f"{self.output_basename}.{pid}.{table_name}",
+                header=header,
+                pid=pid,
+                table_name=table_name,
+                shared_appender=shared_appender,
+                column_types=column_types
+            )
+            self._table_appenders.append(table_appender)
+        return table_appender
+
+    def get_shared_appender(self, table_name: str) -> Optional[BaseTableAppender]:
+        with self._mutex:
+            return self._shared_appenders.get(table_name)
+
+    def close(self):
+        """
+        Close all shared appenders and write the index.
+        """
+        with self._mutex:
+            for shared_appender in self._shared_appenders.values():
+                shared_appender.close()
+            index_appender = self._create_shared_appender(
+                "index",
+                SESSION_INDEX_HEADER,
+                SESSION_INDEX_COLUMN_TYPES
+            )
+            for table_appender in self._table_appenders:
+                index_appender.append([
+                    table_appender.pid,
+                    table_appender.table_name,
+                    table_appender.n_rows,
+                    table_appender.first_time,
+                    table_appender.last_time
+                ])
+            index_appender.close()
@@ -1,22 +1,164 @@
+"""
+Using SQLite3 with all tables of a session in one database, ``{output_basename}.sqlite3``.
+
+All appenders of a database share one connection in WAL mode,
+and each flushed buffer is inserted with ``executemany`` in its own transaction,
+so the database can be queried by other processes while tracing is still running.
+Tables with ``PID`` and ``TIME`` columns (see :py:mod:`session_store`) are indexed on ``(PID, TIME)``.
+"""
+
+import contextlib
+import os
 import sqlite3
+import threading
+from typing import Dict, List, Any, Tuple, Iterator, Optional, Set
+
+import numpy as np
+
+from pid_monitor._dt_mvc.appender.typing import DictBufferAppender, ColumnBuffer, \
+    INT64, FLOAT64, CATEGORY, STRING, OBJECT
+
+_SQLITE3_TYPES = {
+    INT64: "INTEGER",
+    FLOAT64: "REAL",
+    CATEGORY: "TEXT",
+    STRING: "TEXT",
+    OBJECT: ""
+}
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class _SQLite3Database:
+    """
+    A connection shared by all appenders of one database file.
+    """
+
+    path: str
+    n_users: int
+
+    _connection: sqlite3.Connection
+    _mutex: threading.Lock
+
+    def __init__(self, path: str):
+        self.path = path
+        self.n_users = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._mutex = threading.Lock()
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._mutex:
+            self._connection.execute("BEGIN")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
 
-import pandas as pd
+    def close(self):
+        with self._mutex:
+            self._connection.execute("PRAGMA optimize")
+            self._connection.close()
 
-from pid_monitor._dt_mvc.appender.typing import PandasDictBufferAppender
 
+_DATABASES: Dict[str, _SQLite3Database] = {}
+_CREATED_PATHS: Set[str] = set()
+"""Databases created by this process, which are not removed when opened again"""
 
-class SQLite3TableAppender(PandasDictBufferAppender):
+_DATABASES_MUTEX = threading.Lock()
+
+
+def _acquire_database(path: str) -> _SQLite3Database:
+    with _DATABASES_MUTEX:
+        try:
+            database = _DATABASES[path]
+        except KeyError:
+            if path not in _CREATED_PATHS:
+                for stale_path in (path, path + "-wal", path + "-shm"):
+                    if os.path.exists(stale_path):
+                        os.remove(stale_path)
+                _CREATED_PATHS.add(path)
+            database = _DATABASES[path] = _SQLite3Database(path)
+        database.n_users += 1
+        return database
+
+
+def _release_database(path: str):
+    with _DATABASES_MUTEX:
+        database = _DATABASES[path]
+        database.n_users -= 1
+        if database.n_users == 0:
+            _DATABASES.pop(path)
+            database.close()
+
+
+class SQLite3TableAppender(DictBufferAppender):
+    """
+    Write tables into one SQLite3 database per session, named after the rest of the filename (e.g., ``session.mem``).
+    Without a session basename, write table ``db`` of ``{filename}.sqlite3``.
+    """
+    single_container = True
+    segmentable = False
+
+    _table_name: str
+    _database: Optional[_SQLite3Database]
+    _insert_statement: str
 
     def _get_n_lines_actually_written_hook(self) -> int:
-        with sqlite3.connect(self._real_filename) as con:
-            return pd.read_sql_query("SELECT * FROM db", con=con).shape[0]
+        with contextlib.closing(sqlite3.connect(self._real_filename)) as con:
+            return con.execute(f"SELECT COUNT(*) FROM {_quote(self._table_name)}").fetchone()[0]
 
     def _get_real_filename_hook(self):
-        self._real_filename = ".".join((self.filename, "sqlite3"))
+        output_basename = self._tac.output_basename
+        if output_basename is not None and self.filename.startswith(output_basename + "."):
+            self._real_filename = ".".join((output_basename, "sqlite3"))
+            self._table_name = self.filename[len(output_basename) + 1:]
+        else:
+            self._real_filename = ".".join((self.filename, "sqlite3"))
+            self._table_name = "db"
 
-    def _create_file_hook(self):
+    def _remove_existing_file_hook(self):
+        # Shared by other appenders; stale databases are removed when first opened.
         pass
 
-    def _write_hook(self, df: pd.DataFrame):
-        with sqlite3.connect(self._real_filename) as con:
-            df.to_sql(name="db", con=con, if_exists="append")
+    def _create_file_hook(self):
+        self._database = _acquire_database(self._real_filename)
+        table = _quote(self._table_name)
+        columns = ", ".join(
+            f"{_quote(name)} {_SQLITE3_TYPES[column_type]}".rstrip()
+            for name, column_type in zip(self.header, self.column_types)
+        )
+        with self._database.transaction() as con:
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+            con.execute(f"CREATE TABLE {table} ({columns})")
+            if "PID" in self.header and "TIME" in self.header:
+                con.execute(f"CREATE INDEX {_quote(self._table_name + '.PID_TIME')} ON {table} (PID, TIME)")
+        self._insert_statement = f"INSERT INTO {table} VALUES ({', '.join('?' * len(self.header))})"
+
+    def flush(self, buff: ColumnBuffer) -> List[Tuple[Any, ...]]:
+        columns = []
+        for i, (_, column_type, column) in enumerate(buff.iter_columns()):
+            if column_type == CATEGORY:
+                column = np.array(buff.get_categories(i), dtype=object)[column]
+            if isinstance(column, np.ndarray):
+                column = column.tolist()
+            columns.append(column)
+        return list(zip(*columns))
+
+    def _write_hook(self, df: List[Tuple[Any, ...]]):
+        with self._database.transaction() as con:
+            con.executemany(self._insert_statement, df)
+
+    def close(self):
+        super().close()
+        with self._write_mutex:
+            if self._database is None:
+                return
+            self._database = None
+            _release_database(self._real_filename)
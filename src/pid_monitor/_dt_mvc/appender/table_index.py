@@ -0,0 +1,74 @@
+"""
+table_index -- Summary of the rows written to a table
+
+Counting rows or finding the time range of a table would otherwise need reading the whole file back.
+:py:class:`DictBufferAppender` keeps the number of rows and time range of the buffers it writes
+in a :py:class:`TableIndexBuilder`, in memory, and the session manifest records them
+(see :py:mod:`session_manifest`), so post-processing finds them without opening tables
+and tracing needs no file besides the table itself.
+"""
+
+import math
+from typing import Optional, NamedTuple, Iterable
+
+
+class TableIndex(NamedTuple):
+    """
+    Summary of a table. Times are ``None`` for empty tables or tables without a ``TIME`` column.
+    """
+    n_rows: int
+    min_time: Optional[float]
+    max_time: Optional[float]
+
+
+def merge_table_indexes(table_indexes: Iterable[TableIndex]) -> TableIndex:
+    """
+    Summary of a table made of parts with the given summaries.
+    """
+    n_rows = 0
+    min_times = []
+    max_times = []
+    for table_index in table_indexes:
+        n_rows += table_index.n_rows
+        if table_index.min_time is not None:
+            min_times.append(table_index.min_time)
+        if table_index.max_time is not None:
+            max_times.append(table_index.max_time)
+    return TableIndex(
+        n_rows,
+        min(min_times) if min_times else None,
+        max(max_times) if max_times else None
+    )
+
+
+def _to_optional_float(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+class TableIndexBuilder:
+    """
+    Summarize buffers written to a table.
+    Not thread-safe; appenders call it while holding their write mutex.
+    """
+
+    n_rows: int
+    min_time: float
+    max_time: float
+
+    def __init__(self):
+        self.n_rows = 0
+        self.min_time = math.nan
+        self.max_time = math.nan
+
+    def append(self, n_rows: int, min_time: float, max_time: float):
+        """
+        Record a written buffer of ``n_rows`` rows. Use NaN for unknown times.
+        """
+        self.n_rows += n_rows
+        if not math.isnan(min_time):
+            self.min_time = min_time if math.isnan(self.min_time) else min(self.min_time, min_time)
+        if not math.isnan(max_time):
+            self.max_time = max_time if math.isnan(self.max_time) else max(self.max_time, max_time)
+
+    def get_table_index(self) -> TableIndex:
+        return TableIndex(self.n_rows, _to_optional_float(self.min_time), _to_optional_float(self.max_time))
@@ -0,0 +1,172 @@
+"""
+table_reader -- Read tables listed in a session manifest into pandas
+
+Tables are read column-wise with the fastest reader of their format,
+so post-processing needs not know how they were written.
+Tables larger than memory are read in chunks of rows, in the order they were written.
+Tables still being written are read as far as they are persisted.
+"""
+
+import contextlib
+import glob
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pid_monitor._dt_mvc.appender.segmented_appender import read_manifest
+
+_TSV_TABLE_APPENDERS = ("TSVTableAppender", "LZ77TSVTableAppender", "LZMATSVTableAppender")
+
+DEFAULT_CHUNK_ROWS = 65536
+
+_PARQUET_PARTS_SUFFIX = ".parts"
+
+
+def _get_parquet_part_filenames(filename: str) -> List[str]:
+    """
+    Files of a Parquet table, given either its compacted file or the directory of its parts,
+    since the table may have been compacted after the manifest was written.
+    """
+    if filename.endswith(_PARQUET_PARTS_SUFFIX):
+        compacted_filename = filename[:-len(_PARQUET_PARTS_SUFFIX)]
+    else:
+        compacted_filename = filename
+    if os.path.exists(compacted_filename):
+        return [compacted_filename]
+    parts_dirname = compacted_filename + _PARQUET_PARTS_SUFFIX
+    return sorted(glob.glob(os.path.join(glob.escape(parts_dirname), "part-*.parquet")))
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _read_file(
+        filename: str,
+        table_appender_type: str,
+        columns: Optional[List[str]],
+        sqlite3_table_name: str
+) -> pd.DataFrame:
+    if table_appender_type in _TSV_TABLE_APPENDERS:
+        return pd.read_csv(filename, sep="\t", quotechar="'", usecols=columns, engine="pyarrow")
+    if table_appender_type == "ArrowTableAppender":
+        with pa.memory_map(filename) as source:
+            table = pa.ipc.open_file(source).read_all()
+            return (table if columns is None else table.select(columns)).to_pandas()
+    if table_appender_type == "ParquetTableAppender":
+        part_filenames = _get_parquet_part_filenames(filename)
+        if not part_filenames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(
+            [pd.read_parquet(part_filename, columns=columns) for part_filename in part_filenames],
+            ignore_index=True
+        )
+    if table_appender_type == "HDF5TableAppender":
+        return pd.read_hdf(filename, columns=columns)
+    if table_appender_type == "SQLite3TableAppender":
+        selected = "*" if columns is None else ", ".join(map(_quote, columns))
+        with contextlib.closing(sqlite3.connect(filename)) as con:
+            return pd.read_sql_query(f"SELECT {selected} FROM {_quote(sqlite3_table_name)}", con)
+    raise ValueError(f"Cannot read tables of {table_appender_type}")
+
+
+def _iter_file_chunks(
+        filename: str,
+        table_appender_type: str,
+        columns: Optional[List[str]],
+        sqlite3_table_name: str,
+        chunk_rows: int
+) -> Iterator[pd.DataFrame]:
+    if table_appender_type in _TSV_TABLE_APPENDERS:
+        yield from pd.read_csv(filename, sep="\t", quotechar="'", usecols=columns, chunksize=chunk_rows)
+    elif table_appender_type == "ArrowTableAppender":
+        # Record batches are buffers flushed by the appender
+        with pa.memory_map(filename) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                yield (batch if columns is None else batch.select(columns)).to_pandas()
+    elif table_appender_type == "ParquetTableAppender":
+        for part_filename in _get_parquet_part_filenames(filename):
+            # Without pre-buffering, which reads whole files ahead
+            parquet_file = pq.ParquetFile(part_filename, pre_buffer=False)
+            try:
+                for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+                    yield batch.to_pandas()
+            finally:
+                parquet_file.close()
+    elif table_appender_type == "HDF5TableAppender":
+        yield from pd.read_hdf(filename, columns=columns, chunksize=chunk_rows)
+    elif table_appender_type == "SQLite3TableAppender":
+        selected = "*" if columns is None else ", ".join(map(_quote, columns))
+        with contextlib.closing(sqlite3.connect(filename)) as con:
+            yield from pd.read_sql_query(
+                f"SELECT {selected} FROM {_quote(sqlite3_table_name)} ORDER BY rowid",
+                con,
+                chunksize=chunk_rows
+            )
+    else:
+        raise ValueError(f"Cannot read tables of {table_appender_type}")
+
+
+def _iter_closed_segments(manifest_filename: str) -> Iterator[str]:
+    dirname = os.path.dirname(manifest_filename)
+    for record in read_manifest(manifest_filename):
+        if record["type"] == "segment" and record["state"] == "closed":
+            yield os.path.join(dirname, record["filename"])
+
+
+def _read_segments(manifest_filename: str, table_appender_type: str, columns: Optional[List[str]]) -> pd.DataFrame:
+    """
+    Read closed segments of a segmented table. The segment being written is skipped; use ``recover`` for it.
+    """
+    dfs = [
+        _read_file(segment_filename, table_appender_type, columns, "")
+        for segment_filename in _iter_closed_segments(manifest_filename)
+    ]
+    if not dfs:
+        header = next(read_manifest(manifest_filename))["header"]
+        return pd.DataFrame(columns=columns or header)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def read_manifest_table(table: Dict[str, Any], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a table described in a session manifest (see :py:func:`load_session_manifest`).
+
+    For per-process tables kept in a shared table, the whole shared table is read, with its ``PID`` column.
+
+    :param columns: Columns to read, ``None`` for all.
+    :raises ValueError: If the format cannot be read.
+    """
+    if table["shared"] and columns is not None and "PID" not in columns:
+        columns = ["PID", *columns]
+    if table["segmented"]:
+        return _read_segments(table["filename"], table["table_appender_type"], columns)
+    sqlite3_table_name = f"session.{table['table']}" if table["shared"] else table["table"]
+    return _read_file(table["filename"], table["table_appender_type"], columns, sqlite3_table_name)
+
+
+def iter_manifest_table_chunks(
+        table: Dict[str, Any],
+        columns: Optional[List[str]] = None,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a table like :py:func:`read_manifest_table`, in chunks of about ``chunk_rows`` rows, in the order of writing.
+    Arrow tables are read by record batch, whatever ``chunk_rows``.
+    """
+    if table["shared"] and columns is not None and "PID" not in columns:
+        columns = ["PID", *columns]
+    if table["segmented"]:
+        for segment_filename in _iter_closed_segments(table["filename"]):
+            yield from _iter_file_chunks(segment_filename, table["table_appender_type"], columns, "", chunk_rows)
+        return
+    sqlite3_table_name = f"session.{table['table']}" if table["shared"] else table["table"]
+    yield from _iter_file_chunks(
+        table["filename"], table["table_appender_type"], columns, sqlite3_table_name, chunk_rows
+    )
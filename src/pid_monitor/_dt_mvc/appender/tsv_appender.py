@@ -1,26 +1,159 @@
+import ast
+import time
+from typing import List, Any, BinaryIO, Optional, Sequence, Iterator, Callable, Type
+
+import numpy as np
 import pandas as pd
 
-from pid_monitor._dt_mvc.appender.typing import DictBufferAppender
+from pid_monitor._dt_mvc.appender.typing import DictBufferAppender, ColumnBuffer, CATEGORY, INT64, FLOAT64
+
+SYNC_INTERVAL = 1.0
+"""
+Minimal interval in seconds between two syncs,
+after which everything written so far can be read back even if the tracer crashes.
+"""
+
+SALVAGE_BLOCK_SIZE = 64 * 1024
+"""Size of blocks fed to decompressors when salvaging, so that data before a damaged block is kept"""
+
+
+def salvage_decompress(
+        data: bytes,
+        decompressor_factory: Callable[[], Any],
+        error_type: Type[Exception]
+) -> bytes:
+    """
+    Decompress concatenated streams, keeping what is decompressed before the data ends or is damaged.
+
+    :param decompressor_factory: Creates a decompressor of one stream,
+        e.g., :py:class:`lzma.LZMADecompressor`.
+    :param error_type: Error raised by the decompressor on damaged data.
+    """
+    chunks = []
+    while data:
+        decompressor = decompressor_factory()
+        end = 0
+        for start in range(0, len(data), SALVAGE_BLOCK_SIZE):
+            end = start + SALVAGE_BLOCK_SIZE
+            try:
+                chunks.append(decompressor.decompress(data[start:end]))
+            except error_type:
+                return b"".join(chunks)
+            if decompressor.eof:
+                break
+        if not decompressor.eof:
+            break
+        data = decompressor.unused_data + data[end:]
+    return b"".join(chunks)
+
+
+def _parse_cell(cell: str, column_type: str) -> Any:
+    """
+    Parse a cell formatted by :py:func:`TSVTableAppender._format_column`.
+    """
+    if column_type == INT64:
+        return int(cell)
+    if column_type == FLOAT64:
+        return float(cell)
+    try:
+        return ast.literal_eval(cell)
+    except (ValueError, SyntaxError):
+        pass
+    try:
+        # nan and inf
+        return float(cell)
+    except ValueError:
+        return cell
 
 
 class TSVTableAppender(DictBufferAppender):
+    """
+    Write tables as TSV. The file is kept open for its lifetime
+    and synced at most every :py:data:`SYNC_INTERVAL` seconds.
+    """
+
+    _writer: Optional[BinaryIO]
+    _last_sync: float
 
     def _get_real_filename_hook(self):
         self._real_filename = ".".join((self.filename, "tsv"))
 
-    def flush(self) -> str:
-        return "\n".join(map(
-            lambda x: "\t".join(map(repr, x)),  # x is [COLUMN]
-            zip(*self._buff.values())
-        )) + "\n"
+    @staticmethod
+    def _format_column(buff: ColumnBuffer, i: int, column_type: str, column: Any) -> Sequence[str]:
+        """
+        Format one column as Python literals.
+        Category columns are formatted once per category.
+        """
+        if column_type == CATEGORY:
+            categories = np.array(list(map(repr, buff.get_categories(i))), dtype=object)
+            return categories[column]
+        if isinstance(column, np.ndarray):
+            column = column.tolist()
+        return list(map(repr, column))
+
+    def flush(self, buff: ColumnBuffer) -> str:
+        formatted_columns: List[Sequence[str]] = [
+            self._format_column(buff, i, column_type, column)
+            for i, (_, column_type, column) in enumerate(buff.iter_columns())
+        ]
+        return "\n".join(map("\t".join, zip(*formatted_columns))) + "\n"
+
+    def _open_writer_hook(self) -> BinaryIO:
+        return open(self._real_filename, mode="wb")
+
+    @classmethod
+    def _read_salvaged_hook(cls, real_filename: str) -> bytes:
+        """
+        Read the uncompressed content of a file that may be truncated.
+        """
+        with open(real_filename, mode="rb") as reader:
+            return reader.read()
+
+    @classmethod
+    def iter_salvaged_rows(
+            cls,
+            real_filename: str,
+            header: List[str],
+            column_types: List[str]
+    ) -> Iterator[List[Any]]:
+        data = cls._read_salvaged_hook(real_filename)
+        # Drop the line being written when the tracer crashed
+        lines = data[:data.rfind(b"\n") + 1].decode("UTF-8").split("\n")[1:-1]
+        for line in lines:
+            cells = line.split("\t")
+            if len(cells) != len(header):
+                return
+            try:
+                yield [_parse_cell(cell, column_type) for cell, column_type in zip(cells, column_types)]
+            except ValueError:
+                return
+
+    def _sync_hook(self):
+        self._writer.flush()
+
+    def _close_writer_hook(self):
+        self._writer.close()
 
     def _create_file_hook(self):
-        with open(self._real_filename, mode="wt") as writer:
-            writer.write("\t".join(self.header) + "\n")
+        self._writer = self._open_writer_hook()
+        self._writer.write(("\t".join(self.header) + "\n").encode("UTF-8"))
+        self._sync_hook()
+        self._last_sync = time.monotonic()
 
     def _write_hook(self, df: str):
-        with open(self._real_filename, mode="at") as writer:
-            writer.write(df)
+        self._writer.write(df.encode("UTF-8"))
+        now = time.monotonic()
+        if now - self._last_sync >= SYNC_INTERVAL:
+            self._sync_hook()
+            self._last_sync = now
+
+    def close(self):
+        super().close()
+        with self._write_mutex:
+            if self._writer is None:
+                return
+            self._close_writer_hook()
+            self._writer = None
 
     def _get_n_lines_actually_written_hook(self) -> int:
         return pd.read_table(self._real_filename, sep="\t", engine="pyarrow").shape[0]
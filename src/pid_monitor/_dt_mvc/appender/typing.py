@@ -1,10 +1,22 @@
+import array
+import math
 import multiprocessing
 import os
+import time
 from abc import abstractmethod, ABC
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Optional, Union, Iterator, Tuple, Callable
 
+import numpy as np
 import pandas as pd
 
+from pid_monitor._dt_mvc.appender.background_writer import BackgroundTableWriter
+from pid_monitor._dt_mvc.appender.flush_timer import FlushTimer
+from pid_monitor._dt_mvc.appender.table_index import TableIndex, TableIndexBuilder
+
+
+DEFAULT_ROW_GROUP_SIZE = 65536
+DEFAULT_ROW_GROUP_BYTES = 8 * 1024 * 1024
+
 
 class TableAppenderConfig:
     buffer_size: int
@@ -12,31 +24,299 @@ class TableAppenderConfig:
     Buffering strategy. 1 for no buffering.
     """
 
-    def __init__(self, buffer_size: int = 1):
+    row_group_size: int
+    """
+    Number of rows gathered before a row group is written, for appenders of columnar formats like Parquet.
+    """
+
+    row_group_bytes: int
+    """
+    Size in bytes gathered before a row group is written, if reached before :py:attr:`row_group_size`.
+    """
+
+    background_writer: Optional[BackgroundTableWriter]
+    """
+    Writer that persists full buffers on its own threads. ``None`` for writing on the appending thread.
+    """
+
+    max_latency: float
+    """
+    Longest time in seconds a row may stay buffered before being written, even if the buffer is not full.
+    ``0`` for flushing only full buffers. Needs :py:attr:`flush_timer`.
+    """
+
+    flush_timer: Optional[FlushTimer]
+    """
+    Timer shared by all appenders that flushes buffers reaching :py:attr:`max_latency`.
+    """
+
+    segment_rows: int
+    """
+    Number of rows after which a table starts a new segment. ``0`` for no limit.
+    See :py:mod:`segmented_appender`.
+    """
+
+    segment_duration: float
+    """
+    Time in seconds after which a table starts a new segment. ``0`` for no limit.
+    Tables are segmented if either this or :py:attr:`segment_rows` is set.
+    """
+
+    output_basename: Optional[str]
+    """
+    Basename of the tracing session.
+    Appenders keeping all tables in one container (see :py:attr:`BaseTableAppender.single_container`)
+    put it at ``{output_basename}.{ext}``.
+    """
+
+    def __init__(
+            self,
+            buffer_size: int = 1,
+            background_writer: Optional[BackgroundTableWriter] = None,
+            output_basename: Optional[str] = None,
+            row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+            row_group_bytes: int = DEFAULT_ROW_GROUP_BYTES,
+            max_latency: float = 0,
+            flush_timer: Optional[FlushTimer] = None,
+            segment_rows: int = 0,
+            segment_duration: float = 0
+    ):
         self.buffer_size = buffer_size
+        self.background_writer = background_writer
+        self.output_basename = output_basename
+        self.row_group_size = row_group_size
+        self.row_group_bytes = row_group_bytes
+        self.max_latency = max_latency
+        self.flush_timer = flush_timer
+        self.segment_rows = segment_rows
+        self.segment_duration = segment_duration
+
+    @property
+    def is_segmented(self) -> bool:
+        return self.segment_rows > 0 or self.segment_duration > 0
+
+
+INT64 = "int64"
+FLOAT64 = "float64"
+CATEGORY = "category"
+"""Strings with few distinct values, stored as codes into a list of categories"""
+STRING = "string"
+OBJECT = "object"
+"""Any Python object. Columns of tables without a declared schema are of this type"""
+
+COLUMN_TYPES = (INT64, FLOAT64, CATEGORY, STRING, OBJECT)
+
+_ARRAY_TYPECODES = {
+    INT64: ("q", np.int64),
+    FLOAT64: ("d", np.float64),
+    CATEGORY: ("i", np.int32)
+}
+"""Column types stored in :py:class:`array.array`, with their type codes and NumPy dtypes"""
+
+
+def get_column_types(header: List[str], column_types: Optional[List[str]]) -> List[str]:
+    """
+    Check declared column types against the header.
+
+    :return: Declared column types, or all :py:data:`OBJECT` if not declared.
+    :raises ValueError: On unknown types or if the length differs from that of the header.
+    """
+    if column_types is None:
+        return [OBJECT] * len(header)
+    if len(column_types) != len(header):
+        raise ValueError(f"{len(column_types)} column types declared for header {header}")
+    for column_type in column_types:
+        if column_type not in COLUMN_TYPES:
+            raise ValueError(f"Unknown column type {column_type}, should be one of {COLUMN_TYPES}")
+    return list(column_types)
+
+
+class ColumnBuffer:
+    """
+    Rows buffered by column.
+
+    Columns of :py:data:`INT64` and :py:data:`FLOAT64` are :py:class:`array.array`,
+    and :py:data:`CATEGORY` columns are arrays of codes into categories of this buffer,
+    so values are unboxed on append and read back as contiguous NumPy arrays without copying.
+    :py:data:`STRING` and :py:data:`OBJECT` columns are lists.
+    """
+
+    header: List[str]
+    column_types: List[str]
+    n_rows: int
+
+    is_stale: bool
+    """Flushed because its oldest row reached max latency, after which the appender syncs"""
+
+    _columns: List[Union[array.array, List[Any]]]
+    _column_appenders: List[Callable[[Any], None]]
+    """Append one value to each column"""
+    _categories: Dict[int, Dict[Any, int]]
+    """Index of category column -> category -> code"""
+
+    def __init__(self, header: List[str], column_types: List[str]):
+        self.header = header
+        self.column_types = column_types
+        self.reset()
+
+    def reset(self):
+        self.n_rows = 0
+        self.is_stale = False
+        self._columns = []
+        self._column_appenders = []
+        self._categories = {}
+        for i, column_type in enumerate(self.column_types):
+            try:
+                column = array.array(_ARRAY_TYPECODES[column_type][0])
+            except KeyError:
+                column = []
+            self._columns.append(column)
+            if column_type == CATEGORY:
+                self._categories[i] = {}
+                self._column_appenders.append(self._get_category_appender(column, self._categories[i]))
+            else:
+                self._column_appenders.append(column.append)
+
+    @staticmethod
+    def _get_category_appender(codes: array.array, categories: Dict[Any, int]) -> Callable[[Any], None]:
+        def append_category(value: Any):
+            try:
+                codes.append(categories[value])
+            except KeyError:
+                code = categories[value] = len(categories)
+                codes.append(code)
+
+        return append_category
+
+    def append(self, row: List[Any]):
+        """
+        Append a row. If a value cannot be stored in its column, the buffer is left unchanged.
+
+        :raises ValueError: If the length of the row differs from that of the header.
+        """
+        if len(row) != len(self._columns):
+            raise ValueError(f"Row of {len(row)} values appended to header {self.header}")
+        i = 0
+        try:
+            for column_appender, value in zip(self._column_appenders, row):
+                column_appender(value)
+                i += 1
+        except Exception:
+            self._rollback(i)
+            raise
+        self.n_rows += 1
+
+    def _rollback(self, n_columns: int):
+        """
+        Remove the last value of the first ``n_columns`` columns, and categories only used by them.
+        """
+        for i in range(n_columns):
+            value = self._columns[i].pop()
+            categories = self._categories.get(i)
+            if categories is not None and value == len(categories) - 1 and value not in self._columns[i]:
+                categories.popitem()
+
+    def __len__(self):
+        return self.n_rows
+
+    def get_column(self, i: int) -> Union[np.ndarray, List[Any]]:
+        """
+        Get values of the ``i``-th column, or codes for :py:data:`CATEGORY` columns.
+        Arrays share memory with the buffer.
+        """
+        column = self._columns[i]
+        if isinstance(column, array.array):
+            return np.frombuffer(column, dtype=_ARRAY_TYPECODES[self.column_types[i]][1])
+        return column
+
+    def get_categories(self, i: int) -> List[Any]:
+        """
+        Get categories of the ``i``-th column in the order of their codes.
+        """
+        return list(self._categories[i].keys())
+
+    def iter_columns(self) -> Iterator[Tuple[str, str, Union[np.ndarray, List[Any]]]]:
+        """
+        Iterate over name, type and values (or codes) of each column.
+        """
+        for i, (name, column_type) in enumerate(zip(self.header, self.column_types)):
+            yield name, column_type, self.get_column(i)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get columns as arrays or lists, with :py:data:`CATEGORY` columns as :py:class:`pd.Categorical`.
+        """
+        retd = {}
+        for i, (name, column_type, column) in enumerate(self.iter_columns()):
+            if column_type == CATEGORY:
+                column = pd.Categorical.from_codes(column, categories=self.get_categories(i))
+            retd[name] = column
+        return retd
 
 
 class BaseTableAppender:
+    single_container: bool = False
+    """Whether all tables of a session are kept in one container rather than one file per table"""
+
+    segmentable: bool = True
+    """Whether tables can be written as segments, see :py:mod:`segmented_appender`"""
+
     filename: str
     header: List[str]
+    column_types: List[str]
+    """Types of each column, see :py:data:`COLUMN_TYPES`"""
+
+    closed: bool
+    """Whether :py:func:`close` has been called, after which the table no longer changes"""
+
     _real_filename: str
     _tac: TableAppenderConfig
 
-    def __init__(self, filename: str, header: List[str], tac: TableAppenderConfig):
+    def __init__(
+            self,
+            filename: str,
+            header: List[str],
+            tac: TableAppenderConfig,
+            column_types: Optional[List[str]] = None
+    ):
         self.filename = filename
         self.header = header
-        self._get_real_filename_hook()
+        self.column_types = get_column_types(header, column_types)
+        self.closed = False
         self._tac = tac
+        self._get_real_filename_hook()
+        self._remove_existing_file_hook()
+        self._create_file_hook()
+
+    def _remove_existing_file_hook(self):
         if os.path.exists(self._real_filename):
             os.remove(self._real_filename)
-        self._create_file_hook()
 
     @abstractmethod
     def _get_n_lines_actually_written_hook(self) -> int:
         pass
 
+    def get_n_lines_written(self) -> int:
+        """
+        Number of rows written, by reading the file back.
+        """
+        return self._get_n_lines_actually_written_hook()
+
+    def get_table_index(self) -> Optional[TableIndex]:
+        """
+        Number of rows written so far and their time range, as accounted by the appender (see :py:mod:`table_index`).
+        ``None`` if unknown.
+        """
+        return None
+
+    def get_readable_filename(self) -> str:
+        """
+        Where rows written so far can be read, which may differ from the final file while the table is open.
+        """
+        return self._real_filename
+
     def validate_lines(self, required_number_of_lines: int) -> None:
-        actual_number_of_lines = self._get_n_lines_actually_written_hook()
+        actual_number_of_lines = self.get_n_lines_written()
         if actual_number_of_lines != required_number_of_lines:
             raise AssertionError(
                 f"{self._real_filename}, "
@@ -48,6 +328,21 @@ class BaseTableAppender:
     def _get_real_filename_hook(self):
         pass
 
+    @classmethod
+    def iter_salvaged_rows(
+            cls,
+            real_filename: str,
+            header: List[str],
+            column_types: List[str]
+    ) -> Iterator[List[Any]]:
+        """
+        Read rows back from a file written by this class, which may be truncated by a crash.
+        Rows after the first damaged part are lost.
+
+        :raises NotImplementedError: If the format cannot be read back.
+        """
+        raise NotImplementedError(f"{cls.__name__} cannot read back {real_filename}")
+
     @abstractmethod
     def _create_file_hook(self):
         pass
@@ -68,57 +363,152 @@ class BaseTableAppender:
 
 
 class DictBufferAppender(BaseTableAppender, ABC):
-    _h0: str
-    _buff: Dict[str, List[Any]]
+    """
+    Appender that buffers rows in a :py:class:`ColumnBuffer` and writes them once it is full,
+    or once its oldest row is older than :py:attr:`TableAppenderConfig.max_latency`.
+    """
+    _buff: ColumnBuffer
     _write_mutex: multiprocessing.Lock
     _buff_mutex: multiprocessing.Lock
+    _oldest_row_monotonic: float
+    """When the first row of current buffer was appended"""
+
+    _flush_scheduled: bool
+    """Whether this appender is waiting in :py:attr:`TableAppenderConfig.flush_timer`"""
+
+    _table_index_builder: TableIndexBuilder
+
+    _time_column_index: Optional[int]
 
-    def __init__(self, filename: str, header: List[str], tac: TableAppenderConfig):
-        super().__init__(filename, header, tac)
+    def __init__(
+            self,
+            filename: str,
+            header: List[str],
+            tac: TableAppenderConfig,
+            column_types: Optional[List[str]] = None
+    ):
+        super().__init__(filename, header, tac, column_types)
         self._buff_mutex = multiprocessing.Lock()
         self._write_mutex = multiprocessing.Lock()
-        self._buff = {}
-        self._h0 = self.header[0]
+        self._buff = self._new_buffer()
+        self._oldest_row_monotonic = 0.0
+        self._flush_scheduled = False
+        self._time_column_index = self.header.index("TIME") if "TIME" in self.header else None
+        self._table_index_builder = TableIndexBuilder()
+
+    def _new_buffer(self) -> ColumnBuffer:
+        return ColumnBuffer(self.header, self.column_types)
+
+    def _flush_locked(self) -> Optional[ColumnBuffer]:
+        """
+        Write current buffer, or replace it with an empty one if there's a background writer.
+        Called with :py:attr:`_buff_mutex` held.
+
+        :return: The buffer to be submitted to the background writer, if any.
+        """
+        buff = self._buff
+        if self._tac.background_writer is None:
+            self.write_buffer(buff)
+            buff.reset()
+            return None
+        self._buff = self._new_buffer()
+        return buff
 
     def append(self, body: List[Any]):
         with self._buff_mutex:
-            if self._buff == {}:
-                self._buff = dict(zip(self.header, map(lambda x: [x], body)))
-            else:
-                for header_item, body_item in zip(self.header, body):
-                    self._buff[header_item].append(body_item)
-            if len(self) == self._tac.buffer_size:
-                df = self.flush()
-                self._buff = {}
-                with self._write_mutex:
-                    self._write_hook(df)
+            if len(self._buff) == 0:
+                self._oldest_row_monotonic = time.monotonic()
+                if not self._flush_scheduled and self._tac.max_latency > 0 and self._tac.flush_timer is not None:
+                    self._flush_scheduled = True
+                    self._tac.flush_timer.schedule(self, self._oldest_row_monotonic + self._tac.max_latency)
+            self._buff.append(body)
+            if len(self._buff) < self._tac.buffer_size:
+                return
+            buff = self._flush_locked()
+        if buff is not None:
+            self._tac.background_writer.submit(self, buff, len(buff))
+
+    def flush_if_stale(self) -> Optional[float]:
+        """
+        Flush the buffer if its oldest row is older than :py:attr:`TableAppenderConfig.max_latency`.
+        Called by :py:class:`FlushTimer`.
+
+        :return: Monotonic time to check again, ``None`` if the buffer is empty.
+        """
+        with self._buff_mutex:
+            if len(self._buff) == 0:
+                self._flush_scheduled = False
+                return None
+            due = self._oldest_row_monotonic + self._tac.max_latency
+            if time.monotonic() < due:
+                return due
+            self._flush_scheduled = False
+            self._buff.is_stale = True
+            buff = self._flush_locked()
+        if buff is not None:
+            self._tac.background_writer.submit(self, buff, len(buff))
+        return None
+
+    def write_buffer(self, buff: ColumnBuffer):
+        """
+        Convert a buffer and write it.
+        Called on the appending thread, :py:class:`FlushTimer` or a thread of :py:class:`BackgroundTableWriter`.
+        """
+        df = self.flush(buff)
+        with self._write_mutex:
+            self._write_hook(df)
+            if buff.is_stale:
+                self._sync_hook()
+            self._append_index(buff)
+
+    def _append_index(self, buff: ColumnBuffer):
+        min_time = max_time = math.nan
+        if self._time_column_index is not None and len(buff) > 0:
+            times = buff.get_column(self._time_column_index)
+            min_time = float(np.min(times))
+            max_time = float(np.max(times))
+        self._table_index_builder.append(len(buff), min_time, max_time)
+
+    def get_table_index(self) -> Optional[TableIndex]:
+        with self._write_mutex:
+            return self._table_index_builder.get_table_index()
+
+    def _sync_hook(self):
+        """
+        Make what is written so far readable after a crash. Called with :py:attr:`_write_mutex` held.
+        Does nothing by default.
+        """
+        pass
 
     @abstractmethod
     def _write_hook(self, df: Any):
         pass
 
     @abstractmethod
-    def flush(self) -> Any:
+    def flush(self, buff: ColumnBuffer) -> Any:
+        """
+        Convert a buffer to what :py:func:`_write_hook` accepts.
+        """
         pass
 
     def __len__(self):
-        if self._buff == {}:
-            return 0
-        return len(self._buff[self._h0])
+        return len(self._buff)
 
     def close(self):
-        if len(self) == 0:
-            return
-        df = self.flush()
-        self._buff = {}
-        with self._write_mutex:
-            self._write_hook(df)
+        with self._buff_mutex:
+            buff = self._buff if len(self._buff) != 0 else None
+            self._buff = self._new_buffer()
+        if self._tac.background_writer is not None:
+            self._tac.background_writer.drain(self, buff)
+        elif buff is not None:
+            self.write_buffer(buff)
+        self.closed = True
 
 
 class PandasDictBufferAppender(DictBufferAppender, ABC):
 
-    def flush(self) -> pd.DataFrame:
-        df = pd.DataFrame.from_dict(data=self._buff)
+    def flush(self, buff: ColumnBuffer) -> pd.DataFrame:
+        df = pd.DataFrame(buff.to_dict(), columns=self.header, copy=False)
         return df
 
     @abstractmethod
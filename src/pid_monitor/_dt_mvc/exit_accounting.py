@@ -0,0 +1,141 @@
+"""
+exit_accounting -- Final per-process record of resource usage
+
+Tracers stop as soon as the traced process is gone, so its last CPU time, peak RSS and IO totals
+would otherwise be lost between two samples.
+For short-lived processes, that is most of the data.
+
+Here, :py:class:`ProcessAccounting` keeps running totals updated from each :py:class:`ProcessSnapshot`,
+and :py:func:`take_final_accounting` performs one last read while the process is still a zombie
+(CPU times and IO counters of a zombie are still readable, while its memory is already freed),
+falling back to the running totals if the process had already been reaped.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, List
+
+import psutil
+
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64, CATEGORY
+
+EXIT_ACCOUNTING_FIELDS = ("cpu_times", "memory_info", "io_counters")
+"""Fields of :py:class:`ProcessSnapshot` needed for exit accounting"""
+
+EXIT_ACCOUNTING_HEADER = [
+    "TIME",
+    "PID",
+    "UTIME",
+    "STIME",
+    "MAX_RSS",
+    "READ_BYTES",
+    "WRITE_BYTES",
+    "SOURCE"
+]
+"""Header of the exit accounting table"""
+
+EXIT_ACCOUNTING_COLUMN_TYPES = [FLOAT64, INT64, FLOAT64, FLOAT64, INT64, INT64, INT64, CATEGORY]
+
+SOURCE_ZOMBIE = "ZOMBIE"
+"""CPU times and IO counters were read from the zombie process"""
+
+SOURCE_SNAPSHOT = "SNAPSHOT"
+"""The process had been reaped, so the last snapshot is used"""
+
+SOURCE_ALIVE = "ALIVE"
+"""The process was still running when tracing stopped"""
+
+
+class ProcessAccounting:
+    """
+    Running totals of one process, kept across snapshots.
+
+    Values not yet known are ``-1``.
+    """
+
+    utime: float
+    stime: float
+    peak_rss: int
+    """Largest resident set size ever sampled, in bytes"""
+
+    read_bytes: int
+    write_bytes: int
+
+    _mutex: threading.Lock
+
+    def __init__(self):
+        self.utime = -1
+        self.stime = -1
+        self.peak_rss = -1
+        self.read_bytes = -1
+        self.write_bytes = -1
+        self._mutex = threading.Lock()
+
+    def update_cpu_times(self, cpu_times: Any):
+        with self._mutex:
+            self.utime = cpu_times.user
+            self.stime = cpu_times.system
+
+    def update_rss(self, rss: int):
+        with self._mutex:
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def update_io_counters(self, io_counters: Any):
+        with self._mutex:
+            self.read_bytes = io_counters.read_bytes
+            self.write_bytes = io_counters.write_bytes
+
+    def update(self, snapshot):
+        """
+        Update from fields available in a :py:class:`ProcessSnapshot`. Unavailable fields are skipped.
+        """
+        for field, updater in (
+                ("cpu_times", self.update_cpu_times),
+                ("io_counters", self.update_io_counters),
+        ):
+            try:
+                updater(snapshot[field])
+            except (KeyError, psutil.Error, OSError):
+                pass
+        for field in ("memory_full_info", "memory_info"):
+            try:
+                self.update_rss(snapshot[field].rss)
+            except (KeyError, psutil.Error, OSError):
+                pass
+
+    def to_row(self, timestamp: float, pid: int, source: str) -> List[Any]:
+        with self._mutex:
+            return [
+                timestamp,
+                pid,
+                self.utime,
+                self.stime,
+                self.peak_rss,
+                self.read_bytes,
+                self.write_bytes,
+                source
+            ]
+
+
+def take_final_accounting(process: psutil.Process, accounting: ProcessAccounting) -> str:
+    """
+    Read CPU times and IO counters of a process one last time into ``accounting``.
+
+    :return: Where the final values come from, one of ``SOURCE_*``.
+    """
+    try:
+        with process.oneshot():
+            status = process.status()
+            accounting.update_cpu_times(process.cpu_times())
+            try:
+                accounting.update_io_counters(process.io_counters())
+            except psutil.AccessDenied:
+                pass
+            if status != psutil.STATUS_ZOMBIE:
+                accounting.update_rss(process.memory_info().rss)
+    except (psutil.Error, OSError):
+        return SOURCE_SNAPSHOT
+    if status == psutil.STATUS_ZOMBIE:
+        return SOURCE_ZOMBIE
+    return SOURCE_ALIVE
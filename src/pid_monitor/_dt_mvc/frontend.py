@@ -16,5 +16,7 @@ def show_frontend(
     while len(dispatcher_controller.get_current_active_pids()) > 1:
         subprocess.call('clear')
         print(dispatcher_controller.get_frontend_cache())
+        if pmc.background_writer is not None:
+            print(pmc.background_writer)
         sleep(pmc.frontend_refresh_interval)
     _LOGGER_HANDLER.info("Toplevel PID finished")
@@ -1,8 +1,15 @@
 import argparse
 import os
-from typing import List
+from typing import List, Optional
 
-from pid_monitor._dt_mvc.appender import AVAILABLE_TABLE_APPENDERS
+from pid_monitor._dt_mvc.appender import AVAILABLE_TABLE_APPENDERS, create_table_appender
+from pid_monitor._dt_mvc.appender.background_writer import BackgroundTableWriter
+from pid_monitor._dt_mvc.appender.flush_timer import FlushTimer
+from pid_monitor._dt_mvc.appender.session_manifest import SessionManifest, TABLE_KIND_PROCESS, \
+    TABLE_KIND_SYSTEM, TABLE_KIND_SESSION
+from pid_monitor._dt_mvc.appender.session_store import SessionStore
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, BaseTableAppender, \
+    DEFAULT_ROW_GROUP_SIZE, DEFAULT_ROW_GROUP_BYTES
 
 DEFAULT_BACKEND_REFRESH_INTERVAL = 0.01
 DEFAULT_FRONTEND_REFRESH_INTERVAL = 1
@@ -24,6 +31,19 @@ DEFAULT_SYSTEM_LEVEL_TRACERS = [
 ]
 DEFAULT_TABLE_APPENDER = "LZ77TSVTableAppender"
 DEFAULT_TABLE_APPENDER_BUFFER_SIZE = 16
+DEFAULT_TABLE_APPENDER_MAX_LATENCY = 1.0
+DEFAULT_SEGMENT_ROWS = 0
+DEFAULT_SEGMENT_DURATION = 0.0
+DEFAULT_SCHEDULER_POOL_SIZE = 4
+DEFAULT_WRITER_POOL_SIZE = 1
+DEFAULT_WRITER_QUEUE_SIZE = 1024
+DEFAULT_WRITER_DROP_WHEN_FULL = False
+OUTPUT_LAYOUTS = ("auto", "per_process", "session")
+DEFAULT_OUTPUT_LAYOUT = "auto"
+PROCESS_DISCOVERY_BACKENDS = ("auto", "poll", "netlink")
+DEFAULT_PROCESS_DISCOVERY_BACKEND = "auto"
+SAMPLING_MODES = ("aligned", "free")
+DEFAULT_SAMPLING_MODE = "aligned"
 POSSIBLE_TRACER_PATHS = (
     "pid_monitor._dt_mvc.std_tracer.process_child_tracer_thread",
     "pid_monitor._dt_mvc.std_tracer.process_cpu_tracer_thread",
@@ -49,6 +69,30 @@ class PMConfig:
     frontend_refresh_interval: float
     table_appender_type: str
     toplevel_trace_pid: int
+    scheduler_pool_size: int
+    process_discovery_backend: str
+    sampling_mode: str
+    writer_pool_size: int
+    writer_queue_size: int
+    writer_drop_when_full: bool
+    output_layout: str
+    row_group_size: int
+    row_group_bytes: int
+    table_appender_max_latency: float
+    segment_rows: int
+    segment_duration: float
+
+    background_writer: Optional[BackgroundTableWriter]
+    """The running background writer, set by :py:func:`trace_pid`. ``None`` for writing inline"""
+
+    flush_timer: Optional[FlushTimer]
+    """The running flush timer, set by :py:func:`trace_pid`. ``None`` for flushing full buffers only"""
+
+    session_store: Optional[SessionStore]
+    """The session store, set by :py:func:`trace_pid`. ``None`` for one file per process per table"""
+
+    session_manifest: Optional[SessionManifest]
+    """The session manifest, set by :py:func:`trace_pid`, where appenders created are registered"""
 
     def __init__(
             self,
@@ -59,7 +103,19 @@ class PMConfig:
             process_level_tracer_to_load=None,
             frontend_refresh_interval: float = DEFAULT_FRONTEND_REFRESH_INTERVAL,
             table_appender_type: str = DEFAULT_TABLE_APPENDER,
-            table_appender_buffer_size: int = DEFAULT_TABLE_APPENDER_BUFFER_SIZE
+            table_appender_buffer_size: int = DEFAULT_TABLE_APPENDER_BUFFER_SIZE,
+            scheduler_pool_size: int = DEFAULT_SCHEDULER_POOL_SIZE,
+            process_discovery_backend: str = DEFAULT_PROCESS_DISCOVERY_BACKEND,
+            sampling_mode: str = DEFAULT_SAMPLING_MODE,
+            writer_pool_size: int = DEFAULT_WRITER_POOL_SIZE,
+            writer_queue_size: int = DEFAULT_WRITER_QUEUE_SIZE,
+            writer_drop_when_full: bool = DEFAULT_WRITER_DROP_WHEN_FULL,
+            output_layout: str = DEFAULT_OUTPUT_LAYOUT,
+            row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+            row_group_bytes: int = DEFAULT_ROW_GROUP_BYTES,
+            table_appender_max_latency: float = DEFAULT_TABLE_APPENDER_MAX_LATENCY,
+            segment_rows: int = DEFAULT_SEGMENT_ROWS,
+            segment_duration: float = DEFAULT_SEGMENT_DURATION
     ):
         if output_basename is None:
             os.makedirs(f"pid_monitor_{toplevel_trace_pid}", exist_ok=True)
@@ -76,6 +132,92 @@ class PMConfig:
         self.frontend_refresh_interval = frontend_refresh_interval
         self.table_appender_type = table_appender_type
         self.table_appender_buffer_size = table_appender_buffer_size
+        self.scheduler_pool_size = scheduler_pool_size
+        self.process_discovery_backend = process_discovery_backend
+        self.sampling_mode = sampling_mode
+        self.writer_pool_size = writer_pool_size
+        self.writer_queue_size = writer_queue_size
+        self.writer_drop_when_full = writer_drop_when_full
+        self.output_layout = output_layout
+        self.row_group_size = row_group_size
+        self.row_group_bytes = row_group_bytes
+        self.table_appender_max_latency = table_appender_max_latency
+        self.segment_rows = segment_rows
+        self.segment_duration = segment_duration
+        self.background_writer = None
+        self.flush_timer = None
+        self.session_store = None
+        self.session_manifest = None
+
+    def get_table_appender_config(self) -> TableAppenderConfig:
+        return TableAppenderConfig(
+            buffer_size=self.table_appender_buffer_size,
+            background_writer=self.background_writer,
+            output_basename=self.output_basename,
+            row_group_size=self.row_group_size,
+            row_group_bytes=self.row_group_bytes,
+            max_latency=self.table_appender_max_latency,
+            flush_timer=self.flush_timer,
+            segment_rows=self.segment_rows,
+            segment_duration=self.segment_duration
+        )
+
+    def create_table_appender(
+            self,
+            table_name: str,
+            header: List[str],
+            column_types: Optional[List[str]] = None
+    ) -> BaseTableAppender:
+        """
+        Create appender of configured type for table ``{output_basename}.{table_name}``
+        and register it to the session manifest.
+        Tables named ``sys.*`` are system-level tables.
+        """
+        appender = create_table_appender(
+            table_appender_type=self.table_appender_type,
+            filename=f"{self.output_basename}.{table_name}",
+            header=header,
+            tac=self.get_table_appender_config(),
+            column_types=column_types
+        )
+        if self.session_manifest is not None:
+            self.session_manifest.add_table(
+                appender,
+                table_name=table_name,
+                kind=TABLE_KIND_SYSTEM if table_name.startswith("sys.") else TABLE_KIND_SESSION
+            )
+        return appender
+
+    def create_process_table_appender(
+            self,
+            pid: int,
+            table_name: str,
+            header: List[str],
+            column_types: Optional[List[str]] = None
+    ) -> BaseTableAppender:
+        """
+        Create appender for table ``table_name`` of process ``pid``,
+        which is ``{output_basename}.{pid}.{table_name}``, or a part of the session store if there's one.
+        """
+        if self.session_store is not None:
+            appender = self.session_store.create_appender(pid, table_name, header, column_types)
+        else:
+            appender = create_table_appender(
+                table_appender_type=self.table_appender_type,
+                filename=f"{self.output_basename}.{pid}.{table_name}",
+                header=header,
+                tac=self.get_table_appender_config(),
+                column_types=column_types
+            )
+        if self.session_manifest is not None:
+            self.session_manifest.add_table(
+                appender,
+                table_name=table_name,
+                kind=TABLE_KIND_PROCESS,
+                pid=pid,
+                shared=self.session_store is not None
+            )
+        return appender
 
     @classmethod
     def from_args(
@@ -98,7 +240,19 @@ class PMConfig:
             system_level_tracers_to_load=parsed_args.system_level_tracers_to_load,
             process_level_tracer_to_load=parsed_args.process_level_tracer_to_load,
             table_appender_type=parsed_args.table_appender_type,
-            table_appender_buffer_size=parsed_args.table_appender_buffer_size
+            table_appender_buffer_size=parsed_args.table_appender_buffer_size,
+            scheduler_pool_size=parsed_args.scheduler_pool_size,
+            process_discovery_backend=parsed_args.process_discovery_backend,
+            sampling_mode=parsed_args.sampling_mode,
+            writer_pool_size=parsed_args.writer_pool_size,
+            writer_queue_size=parsed_args.writer_queue_size,
+            writer_drop_when_full=parsed_args.writer_drop_when_full,
+            output_layout=parsed_args.output_layout,
+            row_group_size=parsed_args.row_group_size,
+            row_group_bytes=parsed_args.row_group_bytes,
+            table_appender_max_latency=parsed_args.table_appender_max_latency,
+            segment_rows=parsed_args.segment_rows,
+            segment_duration=parsed_args.segment_duration
         )
         return newinstance
 
@@ -162,5 +316,109 @@ class PMConfig:
             required=False,
             default=DEFAULT_TABLE_APPENDER_BUFFER_SIZE
         )
+        parser.add_argument(
+            "--table_appender_max_latency",
+            help="Longest time in seconds a row may stay buffered before being written, "
+                 "even if the buffer is not full. 0 for flushing full buffers only",
+            type=float,
+            required=False,
+            default=DEFAULT_TABLE_APPENDER_MAX_LATENCY
+        )
+        parser.add_argument(
+            "--scheduler_pool_size",
+            help="Number of worker threads that drive all tracers",
+            type=int,
+            required=False,
+            default=DEFAULT_SCHEDULER_POOL_SIZE
+        )
+        parser.add_argument(
+            "--process_discovery_backend",
+            help="How to discover sub-processes. "
+                 "'netlink' uses Linux process events connector (needs CAP_NET_ADMIN) together with /proc polling, "
+                 "'poll' uses /proc polling only, "
+                 "'auto' tries 'netlink' and falls back to 'poll'",
+            type=str,
+            choices=PROCESS_DISCOVERY_BACKENDS,
+            required=False,
+            default=DEFAULT_PROCESS_DISCOVERY_BACKEND
+        )
+        parser.add_argument(
+            "--sampling_mode",
+            help="How probes are timestamped. "
+                 "'aligned' stamps all probes of a tick with the time of the tick on a grid shared by all tracers, "
+                 "'free' stamps each probe with the time it is performed",
+            type=str,
+            choices=SAMPLING_MODES,
+            required=False,
+            default=DEFAULT_SAMPLING_MODE
+        )
+        parser.add_argument(
+            "--writer_pool_size",
+            help="Number of background threads that write tables. 0 for writing on tracer threads",
+            type=int,
+            required=False,
+            default=DEFAULT_WRITER_POOL_SIZE
+        )
+        parser.add_argument(
+            "--writer_queue_size",
+            help="Number of buffers each background writer may hold before tracers wait for it",
+            type=int,
+            required=False,
+            default=DEFAULT_WRITER_QUEUE_SIZE
+        )
+        parser.add_argument(
+            "--writer_drop_when_full",
+            help="Drop buffers when the queue of a background writer is full instead of waiting, "
+                 "so sampling is never delayed. Dropped rows are counted in the session manifest",
+            action="store_true",
+            default=DEFAULT_WRITER_DROP_WHEN_FULL
+        )
+        parser.add_argument(
+            "--output_layout",
+            help="How per-process tables are stored. "
+                 "'per_process' writes one file per process per table, "
+                 "'session' writes one long-format file per table with a PID column, plus an index, "
+                 "'auto' uses 'session' for appenders keeping all tables in one container (e.g., SQLite3) "
+                 "and 'per_process' otherwise. "
+                 "With the default appender, 'auto' thus writes one file per process per table: "
+                 "pass 'session' to keep the number of files independent of the number of processes. "
+                 "The 'session' layout is opt-in since it writes no per-process .cputime files, "
+                 "which the R report reads; resample it with the resample subcommand",
+            type=str,
+            choices=OUTPUT_LAYOUTS,
+            required=False,
+            default=DEFAULT_OUTPUT_LAYOUT
+        )
+        parser.add_argument(
+            "--row_group_size",
+            help="Number of rows in each row group of columnar appenders like ParquetTableAppender",
+            type=int,
+            required=False,
+            default=DEFAULT_ROW_GROUP_SIZE
+        )
+        parser.add_argument(
+            "--row_group_bytes",
+            help="Maximum size in bytes of each row group of columnar appenders, "
+                 "used if reached before --row_group_size",
+            type=int,
+            required=False,
+            default=DEFAULT_ROW_GROUP_BYTES
+        )
+        parser.add_argument(
+            "--segment_rows",
+            help="Number of rows after which a table starts a new segment, "
+                 "so a crash damages at most the last segment. "
+                 "Use `recover` to stitch segments into tables. 0 for no limit",
+            type=int,
+            required=False,
+            default=DEFAULT_SEGMENT_ROWS
+        )
+        parser.add_argument(
+            "--segment_duration",
+            help="Time in seconds after which a table starts a new segment. 0 for no limit",
+            type=float,
+            required=False,
+            default=DEFAULT_SEGMENT_DURATION
+        )
 
         return parser
@@ -0,0 +1,192 @@
+"""
+process_snapshot -- Per-PID snapshot of ProcFS shared among tracers
+
+Process-level tracers of the same PID used to call :py:mod:`psutil` on their own,
+so files like ``/proc/[pid]/stat``, ``status`` and ``statm`` were opened and parsed several times per tick.
+
+Here, each PID have one :py:class:`ProcessSnapshotProvider`.
+Tracers declare fields they need in :py:attr:`BaseProcessTracerThread.snapshot_fields`,
+and the provider reads all of them inside :py:func:`psutil.Process.oneshot`
+at most once per tick (identified by its index on the grid of the tick scheduler), with one timestamp.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Any, Callable, Iterable, Set, Optional
+
+import psutil
+
+from pid_monitor._dt_mvc.exit_accounting import ProcessAccounting
+from pid_monitor._dt_mvc.process_table import get_latest_process_table
+
+
+def _count_children(p: psutil.Process) -> int:
+    """
+    Count children from the process table published by the scanner,
+    falling back to :py:func:`psutil.Process.children` (which scans all of ``/proc``) if there's none.
+    """
+    process_table = get_latest_process_table()
+    if process_table is None:
+        return len(p.children())
+    return process_table.count_children(p.pid)
+
+
+_FIELD_READERS: Dict[str, Callable[[psutil.Process], Any]] = {
+    "status": lambda p: p.status(),
+    "num_threads": lambda p: p.num_threads(),
+    "cpu_times": lambda p: p.cpu_times(),
+    "cpu_num": lambda p: p.cpu_num(),
+    "memory_info": lambda p: p.memory_info(),
+    "memory_full_info": lambda p: p.memory_full_info(),
+    "io_counters": lambda p: p.io_counters(),
+    "num_children": _count_children,
+    "fd_names": lambda p: os.listdir(f"/proc/{p.pid}/fd"),
+}
+"""Known fields and how to read them"""
+
+
+class ProcessSnapshot:
+    """
+    One reading of a process.
+
+    Errors are recorded per field and raised when the field is accessed,
+    so that, e.g., a :py:class:`psutil.AccessDenied` on IO counters only affects the IO tracer.
+    """
+
+    tick: int
+    """Index of the tick of the reading, ``-1`` if unknown"""
+
+    timestamp: float
+    """Wall-clock time of the reading, or of the tick in aligned sampling mode"""
+
+    monotonic: float
+    """Monotonic time of the reading"""
+
+    _values: Dict[str, Any]
+    _errors: Dict[str, Exception]
+
+    def __init__(
+            self,
+            tick: int,
+            timestamp: float,
+            monotonic: float,
+            values: Dict[str, Any],
+            errors: Dict[str, Exception]
+    ):
+        self.tick = tick
+        self.timestamp = timestamp
+        self.monotonic = monotonic
+        self._values = values
+        self._errors = errors
+
+    def __getitem__(self, field: str) -> Any:
+        error = self._errors.get(field)
+        if error is not None:
+            raise error
+        return self._values[field]
+
+
+class ProcessSnapshotProvider:
+    """
+    Take and cache :py:class:`ProcessSnapshot` of one process.
+    """
+
+    pid: int
+    process: psutil.Process
+    max_age: float
+    """A snapshot younger than this (in seconds) is reused if the tick is unknown"""
+
+    accounting: ProcessAccounting
+    """Running totals updated from each snapshot, used for exit accounting"""
+
+    _fields: Set[str]
+    _last_snapshot: Optional[ProcessSnapshot]
+    _mutex: threading.Lock
+
+    def __init__(self, pid: int, max_age: float):
+        self.pid = pid
+        self.process = psutil.Process(pid)
+        self.max_age = max_age
+        self._fields = set()
+        self._last_snapshot = None
+        self.accounting = ProcessAccounting()
+        self._mutex = threading.Lock()
+
+    def add_fields(self, fields: Iterable[str]):
+        fields = tuple(fields)
+        for field in fields:
+            if field not in _FIELD_READERS:
+                raise ValueError(f"Unknown snapshot field {field}")
+        with self._mutex:
+            self._fields.update(fields)
+            self._last_snapshot = None
+
+    def _take(self, tick: int, timestamp: Optional[float]) -> ProcessSnapshot:
+        values = {}
+        errors = {}
+        if timestamp is None:
+            timestamp = time.time()
+        monotonic = time.monotonic()
+        with self.process.oneshot():
+            for field in self._fields:
+                try:
+                    values[field] = _FIELD_READERS[field](self.process)
+                except (psutil.Error, OSError) as e:
+                    errors[field] = e
+        return ProcessSnapshot(tick, timestamp, monotonic, values, errors)
+
+    def _is_stale(self, tick: int) -> bool:
+        if self._last_snapshot is None:
+            return True
+        if tick >= 0:
+            return self._last_snapshot.tick != tick
+        return time.monotonic() - self._last_snapshot.monotonic >= self.max_age
+
+    def get(self, tick: int = -1, timestamp: Optional[float] = None) -> ProcessSnapshot:
+        """
+        Get a snapshot of a tick. Take a new one if the cached one is from another tick.
+
+        :param tick: Index of the tick. If negative, the cached one is reused if younger than :py:attr:`max_age`.
+        :param timestamp: Timestamp of the new snapshot, if taken. If ``None``, use current wall-clock time.
+        """
+        with self._mutex:
+            if self._is_stale(tick):
+                self._last_snapshot = self._take(tick, timestamp)
+                self.accounting.update(self._last_snapshot)
+            return self._last_snapshot
+
+
+_PROVIDERS: Dict[int, ProcessSnapshotProvider] = {}
+_PROVIDER_REFCOUNTS: Dict[int, int] = {}
+_PROVIDERS_MUTEX = threading.Lock()
+"""Mutex for creating or removing providers"""
+
+
+def acquire_snapshot_provider(pid: int, fields: Iterable[str], max_age: float) -> ProcessSnapshotProvider:
+    """
+    Get the shared provider of a PID, creating it if not exist, and register needed fields.
+
+    Each call should be paired with :py:func:`release_snapshot_provider`.
+    """
+    with _PROVIDERS_MUTEX:
+        try:
+            provider = _PROVIDERS[pid]
+        except KeyError:
+            provider = ProcessSnapshotProvider(pid, max_age)
+            _PROVIDERS[pid] = provider
+            _PROVIDER_REFCOUNTS[pid] = 0
+        _PROVIDER_REFCOUNTS[pid] += 1
+    provider.add_fields(fields)
+    return provider
+
+
+def release_snapshot_provider(pid: int):
+    with _PROVIDERS_MUTEX:
+        try:
+            _PROVIDER_REFCOUNTS[pid] -= 1
+        except KeyError:
+            return
+        if _PROVIDER_REFCOUNTS[pid] <= 0:
+            _PROVIDERS.pop(pid)
+            _PROVIDER_REFCOUNTS.pop(pid)
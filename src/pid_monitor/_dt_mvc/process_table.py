@@ -0,0 +1,90 @@
+"""
+process_table -- System-wide PID -> PPID table read directly from ProcFS
+
+:py:func:`psutil.Process.children` scans all of ``/proc`` on each call,
+so calling it for every traced process every tick costs O(traced processes * system processes).
+Here, ``/proc`` is walked once per tick by the process table scanner,
+and the resulting :py:class:`ProcessTable` is shared by everyone that needs parent-child relationships.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+_PROC_PATH = "/proc"
+
+
+def read_ppid(pid: int) -> Optional[int]:
+    """
+    Read PPID of a process from ``/proc/[pid]/stat``. Return ``None`` if the process is gone.
+    """
+    try:
+        with open(os.path.join(_PROC_PATH, str(pid), "stat"), "rb") as reader:
+            stat = reader.read()
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    # The second field (comm) is enclosed in parentheses and may contain spaces or parentheses.
+    try:
+        return int(stat[stat.rindex(b")") + 2:].split(maxsplit=2)[1])
+    except (ValueError, IndexError):
+        return None
+
+
+class ProcessTable:
+    """
+    A snapshot of PID -> PPID of all processes in the system, with a PPID index.
+    """
+
+    ppid_map: Dict[int, int]
+    """PID -> PPID"""
+
+    children_index: Dict[int, List[int]]
+    """PPID -> List of PID"""
+
+    def __init__(self, ppid_map: Dict[int, int]):
+        self.ppid_map = ppid_map
+        self.children_index = {}
+        for pid, ppid in ppid_map.items():
+            self.children_index.setdefault(ppid, []).append(pid)
+
+    @classmethod
+    def from_procfs(cls):
+        ppid_map = {}
+        for name in os.listdir(_PROC_PATH):
+            if not name.isdigit():
+                continue
+            pid = int(name)
+            ppid = read_ppid(pid)
+            if ppid is not None:
+                ppid_map[pid] = ppid
+        return cls(ppid_map)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self.ppid_map
+
+    def __len__(self):
+        return len(self.ppid_map)
+
+    def get_children(self, pid: int) -> List[int]:
+        return self.children_index.get(pid, [])
+
+    def count_children(self, pid: int) -> int:
+        return len(self.get_children(pid))
+
+
+_LATEST_PROCESS_TABLE: Optional[ProcessTable] = None
+_LATEST_PROCESS_TABLE_MUTEX = threading.Lock()
+
+
+def get_latest_process_table() -> Optional[ProcessTable]:
+    """
+    Get the process table published by the scanner, ``None`` if no scanner is running.
+    """
+    with _LATEST_PROCESS_TABLE_MUTEX:
+        return _LATEST_PROCESS_TABLE
+
+
+def publish_process_table(process_table: Optional[ProcessTable]):
+    global _LATEST_PROCESS_TABLE
+    with _LATEST_PROCESS_TABLE_MUTEX:
+        _LATEST_PROCESS_TABLE = process_table
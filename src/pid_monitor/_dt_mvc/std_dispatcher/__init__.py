@@ -15,6 +15,7 @@ from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFro
 from pid_monitor._dt_mvc.frontend_cache.system_frontend_cache import SystemFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig, POSSIBLE_TRACER_PATHS
 from pid_monitor._dt_mvc.std_tracer import BaseTracerThread
+from pid_monitor._dt_mvc.tick_scheduler import TickScheduler
 from pid_monitor._dt_mvc.typing import ThreadWithPMC
 
 _PROCESS_TABLE_COL_NAMES = (
@@ -35,8 +36,8 @@ class BaseTracerDispatcherThread(ThreadWithPMC):
     The base class of all dispatchers.
     """
 
-    _thread_pool: Dict[str, threading.Thread]
-    """The tracer Thread, is name -> thread"""
+    _thread_pool: Dict[str, Union[threading.Thread, BaseTracerThread]]
+    """The tracers and child dispatchers, is name -> tracer or thread"""
     _dispatcher_controller: DispatcherController
 
     _frontend_cache: Union[SystemFrontendCache, ProcessFrontendCache]
@@ -52,19 +53,22 @@ class BaseTracerDispatcherThread(ThreadWithPMC):
         dispatcher_controller.register_dispatcher(self)
         self._dispatcher_controller = dispatcher_controller
 
-    def append_threadpool(self, thread: threading.Thread):
+    def append_threadpool(self, thread: Union[threading.Thread, BaseTracerThread]):
         self._thread_pool[thread.__class__.__name__] = thread
 
     def start_tracers(
             self,
             tracers_to_load: List[str]
     ):
-        """Start loaded tracers. Should be called at the end of :py:func:`init`."""
+        """
+        Start loaded tracers by registering them to the tick scheduler.
+        Should be called at the end of :py:func:`init`.
+        """
 
         for tracer in tracers_to_load:
             try:
                 self.log_handler.info(f"trace_pid={self.trace_pid}: Fetch TRACER={tracer}")
-                new_thread = get_tracer_class(tracer)(
+                new_tracer = get_tracer_class(tracer)(
                     trace_pid=self.trace_pid,
                     pmc=self.pmc,
                     frontend_cache=self._frontend_cache
@@ -77,9 +81,15 @@ class BaseTracerDispatcherThread(ThreadWithPMC):
                     f"DETAILS={e.__repr__()}"
                 )
                 raise e
-            new_thread.start()
+            self._dispatcher_controller.tick_scheduler.register(new_tracer)
             self.log_handler.info(f"trace_pid={self.trace_pid}: Start TRACER={tracer}")
-            self.append_threadpool(new_thread)
+            self.append_threadpool(new_tracer)
+
+    def on_exec(self):
+        """
+        Called when the traced process executes a new program. Does nothing by default.
+        """
+        pass
 
     @abstractmethod
     def before_ending(self):
@@ -97,8 +107,7 @@ class BaseTracerDispatcherThread(ThreadWithPMC):
         """
         The default runner
         """
-        while not self.should_exit:
-            time.sleep(self.pmc.backend_refresh_interval)
+        self.wait_for_exit()
 
     def __del__(self):
         """
@@ -114,7 +123,7 @@ class BaseTracerDispatcherThread(ThreadWithPMC):
         Sigterm handler. By default, it:
 
         - Call py:func:`before_ending` method.
-        - Terminate all threads in ``_thread_pool``
+        - Terminate all tracers and threads in ``_thread_pool``
         - Suicide.
         """
         self.log_handler.info(f"Dispatcher for trace_pid={self.trace_pid} SIGTERM")
@@ -147,9 +156,13 @@ class DispatcherController:
 
     all_pids: Set[int]
 
+    tick_scheduler: TickScheduler
+    """The scheduler driving all tracers"""
+
     _pretty_table: prettytable.PrettyTable
 
-    def __init__(self):
+    def __init__(self, tick_scheduler: TickScheduler):
+        self.tick_scheduler = tick_scheduler
         self._dispatchers = {}
         self.all_pids = set()
         self._frontend_caches = {}
@@ -173,10 +186,31 @@ class DispatcherController:
     def get_current_active_pids(self) -> List[int]:
         return list(self._dispatchers.keys())
 
+    def get_current_dispatchers(self) -> List[BaseTracerDispatcherThread]:
+        return list(self._dispatchers.values())
+
     def register_dispatcher(self, dispatcher: BaseTracerDispatcherThread) -> None:
         self._dispatchers[dispatcher.trace_pid] = dispatcher
         self.all_pids.add(dispatcher.trace_pid)
 
+    def stop_dispatcher(self, pid: int) -> None:
+        """
+        Ask the dispatcher of a PID to exit, if it exists.
+        """
+        try:
+            self._dispatchers[pid].should_exit = True
+        except KeyError:
+            pass
+
+    def notify_exec(self, pid: int) -> None:
+        """
+        Tell the dispatcher of a PID that the process have executed a new program, if the dispatcher exists.
+        """
+        try:
+            self._dispatchers[pid].on_exec()
+        except KeyError:
+            pass
+
     def remove_dispatcher(self, pid: int) -> None:
         try:
             self._dispatchers.pop(pid)
@@ -0,0 +1,149 @@
+"""
+proc_connector -- Event-driven process discovery using the Linux process events connector
+
+Polling ``/proc`` misses processes that fork and exit between two scans.
+The process events connector (``CONFIG_PROC_EVENTS``) reports ``fork()``, ``exec()`` and ``exit()``
+of every process through a netlink socket as they happen, so dispatchers can be created immediately.
+
+Listening requires ``CAP_NET_ADMIN``. If it is not available,
+:py:func:`open_proc_connector_socket` raises :py:class:`OSError`
+and the tracer falls back to :py:class:`ProcessTableScannerThread` alone.
+
+See ``include/uapi/linux/cn_proc.h`` and ``include/uapi/linux/connector.h`` of the Linux kernel.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import struct
+from typing import Iterator, Tuple
+
+from pid_monitor._dt_mvc.pm_config import PMConfig
+from pid_monitor._dt_mvc.std_dispatcher.process_table_scanner import ProcessTableScannerThread
+from pid_monitor._dt_mvc.typing import ThreadWithPMC
+
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+NLMSG_DONE = 3
+PROC_CN_MCAST_LISTEN = 1
+
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+
+_NLMSGHDR = struct.Struct("=IHHII")
+"""len, type, flags, seq, pid"""
+
+_CN_MSG = struct.Struct("=IIIIHH")
+"""idx, val, seq, ack, len, flags"""
+
+_PROC_EVENT_HEADER = struct.Struct("=IIQ")
+"""what, cpu, timestamp_ns"""
+
+_FORK_EVENT = struct.Struct("=IIII")
+"""parent_pid, parent_tgid, child_pid, child_tgid"""
+
+_EXEC_OR_EXIT_EVENT = struct.Struct("=II")
+"""process_pid, process_tgid"""
+
+_RECV_BUFFER_SIZE = 65536
+_RECV_TIMEOUT = 0.1
+"""Timeout of recv, in seconds, so that the listener may check whether it should exit"""
+
+ProcEvent = Tuple[int, int, int]
+"""what, pid, ppid. ppid is only meaningful for PROC_EVENT_FORK"""
+
+
+def open_proc_connector_socket() -> socket.socket:
+    """
+    Open a netlink socket subscribed to process events.
+
+    :raises OSError: If the socket cannot be created or subscribed, e.g., without ``CAP_NET_ADMIN``.
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+    try:
+        sock.bind((os.getpid(), CN_IDX_PROC))
+        op = struct.pack("=I", PROC_CN_MCAST_LISTEN)
+        cn_msg = _CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(op), 0) + op
+        nlmsg = _NLMSGHDR.pack(_NLMSGHDR.size + len(cn_msg), NLMSG_DONE, 0, 0, os.getpid()) + cn_msg
+        sock.send(nlmsg)
+    except OSError:
+        sock.close()
+        raise
+    sock.settimeout(_RECV_TIMEOUT)
+    return sock
+
+
+def parse_proc_events(data: bytes) -> Iterator[ProcEvent]:
+    """
+    Parse process events in one datagram. Events of threads and unknown events are skipped.
+    """
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        nlmsg_len, nlmsg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+        if nlmsg_len < _NLMSGHDR.size:
+            return
+        if nlmsg_type == NLMSG_DONE:
+            event_offset = offset + _NLMSGHDR.size + _CN_MSG.size
+            what, _, _ = _PROC_EVENT_HEADER.unpack_from(data, event_offset)
+            body_offset = event_offset + _PROC_EVENT_HEADER.size
+            if what == PROC_EVENT_FORK:
+                _, parent_tgid, child_pid, child_tgid = _FORK_EVENT.unpack_from(data, body_offset)
+                if child_pid == child_tgid:
+                    yield what, child_tgid, parent_tgid
+            elif what in (PROC_EVENT_EXEC, PROC_EVENT_EXIT):
+                process_pid, process_tgid = _EXEC_OR_EXIT_EVENT.unpack_from(data, body_offset)
+                if process_pid == process_tgid:
+                    yield what, process_tgid, 0
+        # Netlink messages are aligned to 4 bytes
+        offset += (nlmsg_len + 3) & ~3
+
+
+class ProcConnectorListenerThread(ThreadWithPMC):
+    """
+    Forward process events to :py:class:`ProcessTableScannerThread`.
+
+    The scanner keeps polling, but less often,
+    to recover from events dropped by the kernel when the socket buffer overflows.
+    """
+
+    _sock: socket.socket
+    _process_table_scanner: ProcessTableScannerThread
+
+    def __init__(
+            self,
+            pmc: PMConfig,
+            sock: socket.socket,
+            process_table_scanner: ProcessTableScannerThread
+    ):
+        super().__init__(trace_pid=pmc.toplevel_trace_pid, pmc=pmc)
+        self._sock = sock
+        self._process_table_scanner = process_table_scanner
+
+    def run(self):
+        self.log_handler.info(f"Process events listener for trace_pid={self.trace_pid} started")
+        self._process_table_scanner.scan_interval = max(
+            self.pmc.backend_refresh_interval,
+            self.pmc.frontend_refresh_interval
+        )
+        while not self.should_exit:
+            try:
+                data = self._sock.recv(_RECV_BUFFER_SIZE)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                # ENOBUFS: Events were dropped. The scanner would catch up.
+                self.log_handler.warning(f"Process events listener: {e.__class__.__name__} encountered! {e}")
+                continue
+            for what, pid, ppid in parse_proc_events(data):
+                if what == PROC_EVENT_FORK:
+                    self._process_table_scanner.on_fork(pid, ppid)
+                elif what == PROC_EVENT_EXEC:
+                    self._process_table_scanner.on_exec(pid)
+                elif what == PROC_EVENT_EXIT:
+                    self._process_table_scanner.on_exit(pid)
+        self._process_table_scanner.scan_interval = self.pmc.backend_refresh_interval
+        self._sock.close()
+        self.log_handler.info(f"Process events listener for trace_pid={self.trace_pid} stopped")
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import threading
+from typing import Set
+
+from pid_monitor._dt_mvc import PSUTIL_NOTFOUND_ERRORS
+from pid_monitor._dt_mvc.appender import BaseTableAppender
+from pid_monitor._dt_mvc.pm_config import PMConfig
+from pid_monitor._dt_mvc.process_table import ProcessTable, publish_process_table
+from pid_monitor._dt_mvc.std_dispatcher import DispatcherController
+from pid_monitor._dt_mvc.std_dispatcher.process_tracer_dispatcher import ProcessTracerDispatcherThread
+from pid_monitor._dt_mvc.typing import ThreadWithPMC
+
+
+class ProcessTableScannerThread(ThreadWithPMC):
+    """
+    The only thread that discovers processes.
+
+    Each tick, it walks ``/proc`` once, builds a :py:class:`ProcessTable`, and:
+
+    - Attaches a :py:class:`ProcessTracerDispatcherThread` to every new process whose parent is being traced.
+    - Stops dispatchers of processes that are no longer in the table.
+
+    So the cost of discovery is O(system processes) no matter how many processes are traced.
+
+    Optionally, :py:class:`pid_monitor._dt_mvc.std_dispatcher.proc_connector.ProcConnectorListenerThread`
+    reports fork, exec and exit of processes through :py:func:`on_fork`, :py:func:`on_exec` and :py:func:`on_exit`
+    as they happen, so processes living shorter than a tick are not missed.
+    """
+
+    _dispatcher_controller: DispatcherController
+    _registry_appender: BaseTableAppender
+    _exit_appender: BaseTableAppender
+
+    _known_pids: Set[int]
+    """PIDs that had been dispatched and are still alive"""
+
+    _exited_pids: Set[int]
+    """PIDs reported as exited by :py:func:`on_exit` but still in ``/proc`` as zombies"""
+
+    _known_pids_mutex: threading.Lock
+    """Mutex for modifying ``_known_pids`` and creating dispatchers"""
+
+    scan_interval: float
+    """Interval between two scans, in seconds"""
+
+    def __init__(
+            self,
+            pmc: PMConfig,
+            dispatcher_controller: DispatcherController,
+            registry_appender: BaseTableAppender,
+            exit_appender: BaseTableAppender
+    ):
+        super().__init__(trace_pid=pmc.toplevel_trace_pid, pmc=pmc)
+        self._dispatcher_controller = dispatcher_controller
+        self._registry_appender = registry_appender
+        self._exit_appender = exit_appender
+        self._known_pids = {pmc.toplevel_trace_pid}
+        self._exited_pids = set()
+        self._known_pids_mutex = threading.Lock()
+        self.scan_interval = pmc.backend_refresh_interval
+
+    def run(self):
+        self.log_handler.info(f"Process table scanner for trace_pid={self.trace_pid} started")
+        while not self.should_exit:
+            self.scan()
+            self.wait_for_exit(self.scan_interval)
+        publish_process_table(None)
+        self.log_handler.info(f"Process table scanner for trace_pid={self.trace_pid} stopped")
+
+    def scan(self):
+        process_table = ProcessTable.from_procfs()
+        publish_process_table(process_table)
+        with self._known_pids_mutex:
+            self._detect_exited_process(process_table)
+            self._detect_new_process(process_table)
+
+    def _get_traced_pids(self) -> Set[int]:
+        traced_pids = set(self._dispatcher_controller.get_current_active_pids())
+        traced_pids.update(self._known_pids)
+        return traced_pids
+
+    def on_fork(self, pid: int, ppid: int):
+        """
+        Called when process ``ppid`` forks process ``pid``.
+        The dispatcher reads what it needs of the process before this returns.
+        """
+        with self._known_pids_mutex:
+            self._exited_pids.discard(pid)
+            if pid not in self._known_pids and ppid in self._get_traced_pids():
+                self._attach_dispatcher(pid, ppid)
+
+    def on_exec(self, pid: int):
+        """
+        Called when process ``pid`` executes a new program.
+        The registry is rewritten before this returns if the command line or executable have changed.
+        """
+        with self._known_pids_mutex:
+            if pid in self._known_pids:
+                self._dispatcher_controller.notify_exec(pid)
+
+    def on_exit(self, pid: int):
+        """
+        Called when process ``pid`` exits.
+        """
+        with self._known_pids_mutex:
+            if pid in self._known_pids:
+                self._known_pids.remove(pid)
+                self._exited_pids.add(pid)
+                self.log_handler.debug(f"SCANNER: Process {pid} exited.")
+                self._dispatcher_controller.stop_dispatcher(pid)
+
+    def _detect_exited_process(self, process_table: ProcessTable):
+        self._exited_pids.intersection_update(process_table.ppid_map.keys())
+        for pid in list(self._known_pids):
+            if pid not in process_table:
+                self._known_pids.remove(pid)
+                self.log_handler.debug(f"SCANNER: Process {pid} exited.")
+                self._dispatcher_controller.stop_dispatcher(pid)
+
+    def _detect_new_process(self, process_table: ProcessTable):
+        """
+        Attach dispatchers to all descendants of traced processes that are not yet traced,
+        including those whose parent is also new in this tick.
+        """
+        traced_pids = self._get_traced_pids()
+        pending_parents = list(traced_pids)
+        while pending_parents:
+            ppid = pending_parents.pop()
+            for pid in process_table.get_children(ppid):
+                if pid in traced_pids or pid in self._exited_pids:
+                    continue
+                traced_pids.add(pid)
+                pending_parents.append(pid)
+                self._attach_dispatcher(pid, ppid)
+
+    def _attach_dispatcher(self, pid: int, ppid: int):
+        self.log_handler.info(f"SCANNER: Sub-process {pid} detected.")
+        try:
+            new_thread = ProcessTracerDispatcherThread(
+                trace_pid=pid,
+                pmc=self.pmc,
+                dispatcher_controller=self._dispatcher_controller,
+                registry_appender=self._registry_appender,
+                exit_appender=self._exit_appender,
+                ppid=ppid
+            )
+        except PSUTIL_NOTFOUND_ERRORS as e:
+            self.log_handler.debug(f"SCANNER: Sub-process {pid} gone before dispatched ({e.__class__.__name__}).")
+            return
+        self._known_pids.add(pid)
+        new_thread.start()
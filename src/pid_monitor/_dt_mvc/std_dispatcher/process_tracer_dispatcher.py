@@ -1,78 +1,146 @@
 from __future__ import annotations
 
 import threading
-from time import sleep
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 import psutil
 
 from pid_monitor._dt_mvc import PSUTIL_NOTFOUND_ERRORS
-from pid_monitor._dt_mvc.appender import BaseTableAppender, load_table_appender_class
-from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig
+from pid_monitor._dt_mvc.appender import BaseTableAppender
+from pid_monitor._dt_mvc.appender.typing import STRING, INT64
+from pid_monitor._dt_mvc.exit_accounting import EXIT_ACCOUNTING_FIELDS, SOURCE_ALIVE, take_final_accounting
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
+from pid_monitor._dt_mvc.process_snapshot import ProcessSnapshotProvider, acquire_snapshot_provider, \
+    release_snapshot_provider
 from pid_monitor._dt_mvc.std_dispatcher import BaseTracerDispatcherThread, DispatcherController
 
 _REG_MUTEX = threading.Lock()
 """Mutex for writing registries"""
 
-_DISPATCHER_MUTEX = threading.Lock()
-"""Mutex for creating dispatchers for new process/thread"""
+_EXIT_MUTEX = threading.Lock()
+"""Mutex for writing exit accounting"""
 
 
-class ProcessTracerDispatcherThread(BaseTracerDispatcherThread):
+def _read_cmdline_and_exe(process: psutil.Process) -> Tuple[str, str]:
+    """
+    Read command line and executable path, empty if access is denied.
     """
-    The dispatcher, use to monitor whether a process have initiated a sub-process
-    and attach a dispatcher to it if it does so.
+    try:
+        cmdline = " ".join(process.cmdline())
+    except psutil.AccessDenied:
+        cmdline = ""
+    try:
+        exe = process.exe()
+    except psutil.AccessDenied:
+        exe = ""
+    return cmdline, exe
+
+
+def _read_environ(process: psutil.Process) -> Dict[str, str]:
+    try:
+        return process.environ()
+    except psutil.AccessDenied:
+        return {}
+
 
-    Also initializes and monitors task monitors like :py:class:`TraceIOThread`.
+class ProcessTracerDispatcherThread(BaseTracerDispatcherThread):
     """
+    The dispatcher of a process. Writes information of a process
+    and initializes task monitors like :py:class:`TraceIOThread`.
 
-    def before_ending(self):
-        pass
+    Sub-processes are detected by
+    :py:class:`pid_monitor._dt_mvc.std_dispatcher.process_table_scanner.ProcessTableScannerThread`,
+    which also asks this dispatcher to exit once the process is gone.
+    """
 
     _registry_appender: BaseTableAppender
-    process: Optional[psutil.Process]
+    _exit_appender: BaseTableAppender
+    _snapshot_provider: Optional[ProcessSnapshotProvider]
+    process: psutil.Process
+
+    ppid: int
+    """PPID when the process is discovered, before it may be re-parented"""
+
+    name: str
+    cmdline: str
+    exe: str
+    _environ: Dict[str, str]
 
     def __init__(
             self,
             trace_pid: int,
             pmc: PMConfig,
             dispatcher_controller: DispatcherController,
-            registry_appender: BaseTableAppender
+            registry_appender: BaseTableAppender,
+            exit_appender: BaseTableAppender,
+            ppid: Optional[int] = None
     ):
         """
         The constructor of the class will do following things:
 
         - Detect whether this process exists. If not exists, will raise an error.
-        - Add PID to all recorded PIDS.
-        - Write system-level registry.
-        - Write initializing environment variables of this process.
-        - Write mapfile information.
-        - Start load_tracers.
+        - Take the first snapshot for exit accounting.
+        - Write system-level registry and record the process in the session manifest.
+        - Read initializing environment variables of this process.
+
+        These are done in the thread that discovers the process,
+        so processes exiting before this dispatcher starts are still recorded.
+
+        :param ppid: PPID seen by whoever discovers the process, read from the process if ``None``.
         """
+        # Before registering to the controller, so nothing is left behind if the process is gone
+        snapshot_provider = acquire_snapshot_provider(
+            pid=trace_pid,
+            fields=EXIT_ACCOUNTING_FIELDS,
+            max_age=pmc.backend_refresh_interval / 2
+        )
+        process = snapshot_provider.process
+        try:
+            snapshot_provider.get()
+            with process.oneshot():
+                name = process.name()
+                if ppid is None:
+                    ppid = process.ppid()
+                start_time = process.create_time()
+                cmdline, exe = _read_cmdline_and_exe(process)
+                environ = _read_environ(process)
+        except PSUTIL_NOTFOUND_ERRORS:
+            release_snapshot_provider(trace_pid)
+            raise
         super().__init__(
             trace_pid=trace_pid,
             pmc=pmc,
             dispatcher_controller=dispatcher_controller
         )
-        self.process = None
         self._registry_appender = registry_appender
+        self._exit_appender = exit_appender
+        self._snapshot_provider = snapshot_provider
+        self.process = process
+        self.ppid = ppid
+        self.name = name
+        self.cmdline = cmdline
+        self.exe = exe
+        self._environ = environ
+        if self.pmc.session_manifest is not None:
+            self.pmc.session_manifest.add_process(
+                pid=self.trace_pid,
+                ppid=self.ppid,
+                name=self.name,
+                start_time=start_time
+            )
+        self._write_registry()
 
     def run_body(self):
         """
         The major running part of this function performs following things:
 
-        - Refresh CPU time.
-        - Detect whether the process have forked sub-processes.
-        - Detect whether the process have created new threads.
+        - Write environment variables and mapfile.
+        - Start tracers.
+        - Wait until being asked to exit.
         """
+        self._write_env()
         try:
-            self.process = psutil.Process(self.trace_pid)
-            name = self.process.name()
-            ppid = self.process.ppid()
-            self._write_registry()
-            self._write_env()
             self._write_mapfile()
         except PSUTIL_NOTFOUND_ERRORS as e:
             self.log_handler.error(f"DISPATCHEE={self.trace_pid}: {e.__class__.__name__} encountered!")
@@ -81,8 +149,8 @@ class ProcessTracerDispatcherThread(BaseTracerDispatcherThread):
             return
 
         self._frontend_cache = ProcessFrontendCache(
-            name=name,
-            ppid=ppid,
+            name=self.name,
+            ppid=self.ppid,
             pid=self.trace_pid
         )
         self._dispatcher_controller.register_frontend_cache(
@@ -98,15 +166,54 @@ class ProcessTracerDispatcherThread(BaseTracerDispatcherThread):
             self._dispatcher_controller.remove_dispatcher(self.trace_pid)
             self.sigterm()
             return
-        while not self.should_exit:
-            try:
-                with _DISPATCHER_MUTEX:
-                    self._detect_process()
-            except PSUTIL_NOTFOUND_ERRORS:
-                break
-            sleep(self.pmc.backend_refresh_interval)
+        self.wait_for_exit()
         self.sigterm()
 
+    def before_ending(self):
+        """
+        Write exit accounting of the process and release its snapshot provider.
+        """
+        if self._snapshot_provider is None:
+            return
+        accounting = self._snapshot_provider.accounting
+        source = take_final_accounting(self.process, accounting)
+        if self.pmc.session_manifest is not None and source != SOURCE_ALIVE:
+            self.pmc.session_manifest.end_process(self.trace_pid, self.get_timestamp())
+        with _EXIT_MUTEX:
+            self._exit_appender.append(accounting.to_row(
+                timestamp=self.get_timestamp(),
+                pid=self.trace_pid,
+                source=source
+            ))
+        self._snapshot_provider = None
+        release_snapshot_provider(self.trace_pid)
+        self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: writing exit accounting SUCCESS ({source})")
+
+    def on_exec(self):
+        """
+        Write registry again if command line or executable path have changed,
+        and update name shown in the frontend.
+
+        Called by the thread that receives the exec event, so the new program is read before the process exits.
+        """
+        try:
+            # A new object, since psutil caches executable path
+            process = psutil.Process(self.trace_pid)
+            with process.oneshot():
+                cmdline, exe = _read_cmdline_and_exe(process)
+                if (cmdline, exe) == (self.cmdline, self.exe):
+                    return
+                self.cmdline, self.exe = cmdline, exe
+                self.name = process.name()
+                self._write_registry()
+        except PSUTIL_NOTFOUND_ERRORS as e:
+            self.log_handler.error(f"DISPATCHEE={self.trace_pid}: {e.__class__.__name__} encountered at exec!")
+            return
+        try:
+            self._frontend_cache.name = self.name
+        except AttributeError:
+            pass
+
     def _write_registry(self):
         """
         Write registry information with following information:
@@ -117,32 +224,37 @@ class ProcessTracerDispatcherThread(BaseTracerDispatcherThread):
         - Current working directory
         """
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: writing registry")
-        self._registry_appender.append([
-            self.get_timestamp(),
-            self.trace_pid,
-            " ".join(self.process.cmdline()),
-            self.process.exe(),
-            self.process.cwd()
-        ])
+        try:
+            cwd = self.process.cwd()
+        except PSUTIL_NOTFOUND_ERRORS:
+            cwd = ""
+        with _REG_MUTEX:
+            self._registry_appender.append([
+                self.get_timestamp(),
+                self.trace_pid,
+                self.cmdline,
+                self.exe,
+                cwd
+            ])
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: writing registry SUCCESS")
 
     def _write_env(self):
         """
-        Write initializing environment variables.
+        Write initializing environment variables, as read when the process is discovered.
 
         If the process changes its environment variable during execution, it will NOT be recorded!
         """
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: writing ENV")
-        appender = load_table_appender_class(self.pmc.table_appender_type)(
-            filename=f"{self.pmc.output_basename}.{self.trace_pid}.env",
+        appender = self.pmc.create_process_table_appender(
+            pid=self.trace_pid,
+            table_name="env",
             header=["NAME", "VALUE"],
-            tac=TableAppenderConfig(
-                self.pmc.table_appender_buffer_size
-            )
+            column_types=[STRING, STRING]
         )
-        for env_name, env_value in self.process.environ().items():
+        for env_name, env_value in self._environ.items():
             appender.append([env_name, env_value])
         appender.close()
+        self._environ = {}
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: writing ENV SUCCESS")
 
     def _write_mapfile(self):
@@ -152,12 +264,11 @@ class ProcessTracerDispatcherThread(BaseTracerDispatcherThread):
         Mapfile information shows how files, especially libraries are stored in memory.
         """
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: writing MAPFILE")
-        appender = load_table_appender_class(self.pmc.table_appender_type)(
-            filename=f"{self.pmc.output_basename}.{self.trace_pid}.mapfile",
+        appender = self.pmc.create_process_table_appender(
+            pid=self.trace_pid,
+            table_name="mapfile",
             header=["PATH", "RESIDENT", "VIRT", "SWAP"],
-            tac=TableAppenderConfig(
-                self.pmc.table_appender_buffer_size
-            )
+            column_types=[STRING, INT64, INT64, INT64]
         )
         for item in self.process.memory_maps():
             appender.append([
@@ -168,22 +279,3 @@ class ProcessTracerDispatcherThread(BaseTracerDispatcherThread):
             ])
         appender.close()
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: writing MAPFILE SUCCESS")
-
-    def _detect_process(self):
-        """
-        Detect and start child process dispatcher.
-        """
-        self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: DETECT PROCESS")
-        for process in self.process.children():
-            if process.pid not in self._dispatcher_controller.get_current_active_pids():
-                self.log_handler.info(
-                    f"DISPATCHEE={self.trace_pid}: DETECT PROCESS: Sub-process {process.pid} detected.")
-                new_thread = ProcessTracerDispatcherThread(
-                    trace_pid=process.pid,
-                    pmc=self.pmc,
-                    dispatcher_controller=self._dispatcher_controller,
-                    registry_appender=self._registry_appender
-                )
-                new_thread.start()
-                self.append_threadpool(new_thread)
-        self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: DETECT PROCESS SUCCESS")
@@ -1,8 +1,7 @@
 import psutil
 
 from pid_monitor._dt_mvc import DEFAULT_SYSTEM_INDICATOR_PID
-from pid_monitor._dt_mvc.appender import load_table_appender_class
-from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig
+from pid_monitor._dt_mvc.appender.typing import STRING, CATEGORY, INT64
 from pid_monitor._dt_mvc.frontend_cache.system_frontend_cache import SystemFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_dispatcher import BaseTracerDispatcherThread, DispatcherController
@@ -46,8 +45,8 @@ class SystemTracerDispatcherThread(BaseTracerDispatcherThread):
         """
         Write mounted volumes to ``mnt.csv``.
         """
-        appender = load_table_appender_class(self.pmc.table_appender_type)(
-            filename=f"{self.pmc.output_basename}.mnt",
+        appender = self.pmc.create_table_appender(
+            table_name="mnt",
             header=[
                 "DEVICE",
                 "MOUNT_POINT",
@@ -56,9 +55,7 @@ class SystemTracerDispatcherThread(BaseTracerDispatcherThread):
                 "TOTAL",
                 "USED"
             ],
-            tac=TableAppenderConfig(
-                self.pmc.table_appender_buffer_size
-            )
+            column_types=[STRING, STRING, CATEGORY, STRING, INT64, INT64]
         )
         for item in psutil.disk_partitions():
             disk_usage = psutil.disk_usage(item.mountpoint)
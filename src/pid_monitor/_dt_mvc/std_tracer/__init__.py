@@ -8,58 +8,89 @@ Other tracers that may depend on third-party libraries or software is located in
 under :py:mod:`additional_tracer`.
 """
 from abc import abstractmethod, ABC
-from time import sleep
-from typing import Union, Optional, List
+from typing import Union, Optional, List, Tuple
 
 import psutil
 
 from pid_monitor._dt_mvc import DEFAULT_SYSTEM_INDICATOR_PID, PSUTIL_NOTFOUND_ERRORS
-from pid_monitor._dt_mvc.appender import BaseTableAppender, load_table_appender_class
-from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig
+from pid_monitor._dt_mvc.appender import BaseTableAppender
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.frontend_cache.system_frontend_cache import SystemFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
-from pid_monitor._dt_mvc.typing import ThreadWithPMC
+from pid_monitor._dt_mvc.process_snapshot import ProcessSnapshotProvider, ProcessSnapshot, \
+    acquire_snapshot_provider, release_snapshot_provider
+from pid_monitor._dt_mvc.typing import WithPMC
 
 
 class ProbeError(ValueError):
     pass
 
-class BaseTracerThread(ThreadWithPMC):
+
+class BaseTracerThread(WithPMC):
     """
     The base class of all tracers.
+
+    Tracers are plain probe objects. They do not own a thread;
+    instead, they are registered to a :py:class:`pid_monitor._dt_mvc.tick_scheduler.TickScheduler`,
+    which calls :py:func:`run_once` every :py:attr:`probe_interval` seconds.
     """
 
     tracer_type: str
     """What aspect is being traced? CPU, memory or others?"""
 
+    tick: int
+    """Index of the tick being probed, ``-1`` if not driven by a scheduler"""
+
+    tick_timestamp: Optional[float]
+    """Wall-clock time of the tick being probed"""
+
     _appender: Optional[BaseTableAppender]
 
     def _init_setup_hook(
             self,
             tracer_type: str,
-            table_appender_header: Optional[List[str]]
+            table_appender_header: Optional[List[str]],
+            table_appender_column_types: Optional[List[str]] = None
     ):
+        """
+        :param table_appender_column_types: Type of each column in ``table_appender_header``,
+            see :py:data:`pid_monitor._dt_mvc.appender.typing.COLUMN_TYPES`.
+        """
         self.tracer_type = tracer_type
         if table_appender_header is None:
             self._appender = None
         else:
-            if self.trace_pid == DEFAULT_SYSTEM_INDICATOR_PID:
-                filename = f"{self.pmc.output_basename}.sys.{self.tracer_type}"
-            else:
-                filename = f"{self.pmc.output_basename}.{self.trace_pid}.{self.tracer_type}"
-            self._appender = load_table_appender_class(
-                self.pmc.table_appender_type
-            )(
-                filename=filename,
-                header=table_appender_header,
-                tac=TableAppenderConfig(
-                    self.pmc.table_appender_buffer_size
-                )
+            self._appender = self._create_appender(
+                tracer_type=tracer_type,
+                table_appender_header=table_appender_header,
+                table_appender_column_types=table_appender_column_types
             )
         self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} added")
         self._post_inithook_hook()
 
+    def _create_appender(
+            self,
+            tracer_type: str,
+            table_appender_header: List[str],
+            table_appender_column_types: Optional[List[str]] = None
+    ) -> BaseTableAppender:
+        """
+        Create an appender named after the traced PID and ``tracer_type``.
+        Tracers writing more than one table may call this for the extra tables.
+        """
+        if self.trace_pid != DEFAULT_SYSTEM_INDICATOR_PID:
+            return self.pmc.create_process_table_appender(
+                pid=self.trace_pid,
+                table_name=tracer_type,
+                header=table_appender_header,
+                column_types=table_appender_column_types
+            )
+        return self.pmc.create_table_appender(
+            table_name=f"sys.{tracer_type}",
+            header=table_appender_header,
+            column_types=table_appender_column_types
+        )
+
     def _post_inithook_hook(self):
         pass
 
@@ -71,33 +102,65 @@ class BaseTracerThread(ThreadWithPMC):
     ):
         super().__init__(pmc=pmc, trace_pid=trace_pid)
         self.frontend_cache = frontend_cache
-
-    def run(self):
-        self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} started")
-        self.run_body()
-        self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} stopped")
-
-    def run_body(self):
-        while not self.should_exit:
-            try:
-                self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} PROBE")
-                self.probe()
-                self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} PROBE FIN")
-            except ProbeError as e:
-                self.log_handler.error(
-                    f"TRACE_PID={self.trace_pid} TYPE={self.tracer_type}: ProbeError {e.__class__.__name__} encountered!"
-                )
-                return
-            except PSUTIL_NOTFOUND_ERRORS as e:
-                self.log_handler.error(
-                    f"TRACE_PID={self.trace_pid} TYPE={self.tracer_type}: PSUtilError {e.__class__.__name__} encountered!"
-                )
-                return
-            sleep(self.pmc.backend_refresh_interval)
+        self.tick = -1
+        self.tick_timestamp = None
+
+    @property
+    def probe_interval(self) -> float:
+        """Interval between two probes, in seconds"""
+        return self.pmc.backend_refresh_interval
+
+    def get_timestamp(self):
+        """
+        Get timestamp of current probe.
+        In aligned sampling mode, it is the time of the tick, which is shared by all tracers probed at this tick.
+        """
+        if self.pmc.sampling_mode == "aligned" and self.tick_timestamp is not None:
+            return self.tick_timestamp
+        return super().get_timestamp()
+
+    def run_once(self, tick: int = -1, tick_timestamp: Optional[float] = None) -> bool:
+        """
+        Probe once.
+
+        :param tick: Index of the tick on the grid of the scheduler.
+        :param tick_timestamp: Wall-clock time of the tick.
+        :return: Whether this tracer should be probed again.
+        """
+        self.tick = tick
+        self.tick_timestamp = tick_timestamp
+        try:
+            self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} PROBE")
+            self.probe()
+            self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} PROBE FIN")
+        except ProbeError as e:
+            self.log_handler.error(
+                f"TRACE_PID={self.trace_pid} TYPE={self.tracer_type}: ProbeError {e.__class__.__name__} encountered!"
+            )
+            return False
+        except PSUTIL_NOTFOUND_ERRORS as e:
+            self.log_handler.error(
+                f"TRACE_PID={self.trace_pid} TYPE={self.tracer_type}: PSUtilError {e.__class__.__name__} encountered!"
+            )
+            return False
+        except Exception as e:
+            self.log_handler.error(
+                f"TRACE_PID={self.trace_pid} TYPE={self.tracer_type}: "
+                f"{e.__class__.__name__} encountered! DETAILS={e.__repr__()}"
+            )
+            return False
+        return True
+
+    def close(self):
+        """
+        Close the appender. Called by the scheduler when the tracer is retired.
+        """
+        self.should_exit = True
         try:
             self._appender.close()
         except AttributeError:
             pass
+        self.log_handler.debug(f"Tracer for TRACE_PID={self.trace_pid} TYPE={self.tracer_type} stopped")
 
     @abstractmethod
     def probe(self):
@@ -128,7 +191,11 @@ class BaseSystemTracerThread(BaseTracerThread, ABC):
 
 
 class BaseProcessTracerThread(BaseTracerThread, ABC):
+    snapshot_fields: Tuple[str, ...] = ()
+    """Fields of :py:class:`ProcessSnapshot` needed by this tracer"""
+
     _process: psutil.Process
+    _snapshot_provider: Optional[ProcessSnapshotProvider]
 
     def __init__(
             self,
@@ -142,11 +209,29 @@ class BaseProcessTracerThread(BaseTracerThread, ABC):
             frontend_cache=frontend_cache
         )
         self.trace_pid = trace_pid
+        self._snapshot_provider = None
 
     def _post_inithook_hook(self):
         try:
-            self._process = psutil.Process(pid=self.trace_pid)
+            self._snapshot_provider = acquire_snapshot_provider(
+                pid=self.trace_pid,
+                fields=self.snapshot_fields,
+                max_age=self.probe_interval / 2
+            )
         except PSUTIL_NOTFOUND_ERRORS as e:
             self.log_handler.error(
                 f"TRACE_PID={self.trace_pid} TYPE={self.tracer_type}: {e.__class__.__name__} encountered!")
             raise e
+        self._process = self._snapshot_provider.process
+
+    def get_snapshot(self) -> ProcessSnapshot:
+        """
+        Get snapshot of current tick, which is shared among all tracers of this process.
+        """
+        return self._snapshot_provider.get(tick=self.tick, timestamp=self.get_timestamp())
+
+    def close(self):
+        super().close()
+        if self._snapshot_provider is not None:
+            self._snapshot_provider = None
+            release_snapshot_provider(self.trace_pid)
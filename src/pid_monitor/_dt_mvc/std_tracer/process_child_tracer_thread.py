@@ -1,3 +1,4 @@
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread
@@ -9,6 +10,7 @@ class ProcessChildTracerThread(BaseProcessTracerThread):
     """
     The CHILD monitor. Monitors number of child process and thread of a process.
     """
+    snapshot_fields = ("num_children", "num_threads")
 
     def __init__(
             self,
@@ -27,14 +29,16 @@ class ProcessChildTracerThread(BaseProcessTracerThread):
                 'TIME',
                 'CHILD_PROCESS_NUMBER',
                 'THREAD_NUMBER'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64, INT64, INT64]
         )
 
     def probe(self):
-        self.frontend_cache.num_child_processes = len(self._process.children())
-        self.frontend_cache.num_threads = len(self._process.threads())
+        snapshot = self.get_snapshot()
+        self.frontend_cache.num_child_processes = snapshot["num_children"]
+        self.frontend_cache.num_threads = snapshot["num_threads"]
         self._appender.append([
-            self.get_timestamp(),
+            snapshot.timestamp,
             self.frontend_cache.num_child_processes,
             self.frontend_cache.num_threads
         ])
@@ -1,10 +1,6 @@
-import threading
-import time
+from typing import Optional
 
-import psutil
-
-from pid_monitor._dt_mvc import PSUTIL_NOTFOUND_ERRORS
-from pid_monitor._dt_mvc.appender import BaseTableAppender
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread
@@ -12,36 +8,19 @@ from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread
 __all__ = ("ProcessCPUTracerThread",)
 
 
-class AsyncProcessCPUProbeThread(threading.Thread):
-    process: psutil.Process
-    appender: BaseTableAppender
-
-    def __init__(self, process: psutil.Process, appender: BaseTableAppender, frontend_cache: ProcessFrontendCache):
-        super().__init__()
-        self.process = process
-        self.appender = appender
-        self.frontend_cache = frontend_cache
-
-    def run(self):
-        try:
-            cpu_percent = self.process.cpu_percent(interval=1)
-            if cpu_percent is None:
-                return
-            on_cpu = self.process.cpu_num()
-        except PSUTIL_NOTFOUND_ERRORS:
-            return
-        self.frontend_cache.cpu_percent = cpu_percent
-        self.appender.append([
-            time.time(),  # FIXME: Replace with get_timestamp()
-            on_cpu,
-            cpu_percent
-        ])
-
-
 class ProcessCPUTracerThread(BaseProcessTracerThread):
     """
     The CPU monitor, monitoring CPU usage (in percent) of a process. Also shows which CPU a process is on.
+
+    CPU usage is computed from the difference of user + system CPU time between two consecutive probes,
+    divided by the elapsed monotonic time, so its resolution follows the sampling interval.
+    Note that the kernel accounts CPU time in clock ticks (usually 10 ms),
+    so values are quantized if the interval is close to that.
     """
+    snapshot_fields = ("cpu_times", "cpu_num")
+
+    _last_cpu_time: Optional[float]
+    _last_monotonic: Optional[float]
 
     def __init__(
             self,
@@ -60,13 +39,27 @@ class ProcessCPUTracerThread(BaseProcessTracerThread):
                 'TIME',
                 'OnCPU',
                 'CPU_PERCENT'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64, INT64, FLOAT64]
         )
+        self._last_cpu_time = None
+        self._last_monotonic = None
 
     def probe(self):
-        acp = AsyncProcessCPUProbeThread(
-            appender=self._appender,
-            process=self._process,
-            frontend_cache=self.frontend_cache
-        )
-        acp.start()
+        snapshot = self.get_snapshot()
+        cpu_times = snapshot["cpu_times"]
+        cpu_time = cpu_times.user + cpu_times.system
+        on_cpu = snapshot["cpu_num"]
+        last_cpu_time, last_monotonic = self._last_cpu_time, self._last_monotonic
+        if last_monotonic is not None and snapshot.monotonic <= last_monotonic:
+            return
+        self._last_cpu_time, self._last_monotonic = cpu_time, snapshot.monotonic
+        if last_monotonic is None:
+            return
+        cpu_percent = (cpu_time - last_cpu_time) / (snapshot.monotonic - last_monotonic) * 100
+        self.frontend_cache.cpu_percent = cpu_percent
+        self._appender.append([
+            snapshot.timestamp,
+            on_cpu,
+            cpu_percent
+        ])
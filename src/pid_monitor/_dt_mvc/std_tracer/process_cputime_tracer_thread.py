@@ -1,22 +1,19 @@
-import sys
-
-import psutil
-
 from pid_monitor._dt_mvc import PSUTIL_NOTFOUND_ERRORS
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
+from pid_monitor._dt_mvc.process_snapshot import ProcessSnapshot
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread
 
 __all__ = ("ProcessCPUTimeTracerThread",)
 
 
-def get_total_cpu_time(_p: psutil.Process) -> float:
+def get_total_cpu_time(snapshot: ProcessSnapshot) -> float:
     """
     Get total CPU time for a process.
     Should return time spent in system mode (aka. kernel mode) and user mode.
     """
     try:
-        cpu_time_tuple = _p.cpu_times()
+        cpu_time_tuple = snapshot["cpu_times"]
         return cpu_time_tuple.system + cpu_time_tuple.user
     except PSUTIL_NOTFOUND_ERRORS:
         return -1
@@ -26,6 +23,7 @@ class ProcessCPUTimeTracerThread(BaseProcessTracerThread):
     """
     The CPU time tracer
     """
+    snapshot_fields = ("cpu_times",)
     _cached_last_cpu_time: float
     _cputime_filename: str
 
@@ -49,12 +47,14 @@ class ProcessCPUTimeTracerThread(BaseProcessTracerThread):
 
     def probe(self):
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: update CPUTIME")
-        lct = get_total_cpu_time(self._process)
+        lct = get_total_cpu_time(self.get_snapshot())
         if lct == -1:
             pass
         else:
             self._cached_last_cpu_time = lct
         self.frontend_cache.cpu_time = self._cached_last_cpu_time
-        with open(self._cputime_filename, 'w') as writer:
-            writer.write(str(self._cached_last_cpu_time) + '\n')
+        if self.pmc.session_store is None:
+            # With a session store, final CPU times are in the exit table instead.
+            with open(self._cputime_filename, 'w') as writer:
+                writer.write(str(self._cached_last_cpu_time) + '\n')
         self.log_handler.debug(f"DISPATCHEE={self.trace_pid}: update CPUTIME {self._cached_last_cpu_time} SUCCESS")
@@ -1,7 +1,7 @@
-import glob
 import os
-from typing import Iterable, Tuple
+from typing import Iterable, Tuple, List
 
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64, STRING
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread, ProbeError
@@ -10,6 +10,7 @@ __all__ = ("ProcessFDTracerThread",)
 
 
 class ProcessFDTracerThread(BaseProcessTracerThread):
+    snapshot_fields = ("fd_names",)
 
     def __init__(
             self,
@@ -28,18 +29,19 @@ class ProcessFDTracerThread(BaseProcessTracerThread):
                 'TIME',
                 'FD',
                 'Path'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64, INT64, STRING]
         )
 
-    def iter_full_fd_linux(self) -> Iterable[Tuple[int, str]]:
+    def iter_full_fd_linux(self, fd_names: List[str]) -> Iterable[Tuple[int, str]]:
         """
         Get a dictionary of file descriptor and its absolute path, will return original fd path if error.
 
+        :param fd_names: Content of ``/proc/[pid]/fd``, from the snapshot.
         :return: A dict of [fd, fd_path], None for permission error.
         """
-        glob_pattern = f'/proc/{self.trace_pid}/fd/[0-9]*'
-
-        for item in glob.glob(glob_pattern):
+        for fd_name in fd_names:
+            item = f'/proc/{self.trace_pid}/fd/{fd_name}'
             try:
                 yield int(os.path.basename(item)), os.path.realpath(item)
             except FileNotFoundError:
@@ -48,12 +50,15 @@ class ProcessFDTracerThread(BaseProcessTracerThread):
                 yield int(os.path.basename(item)), item
 
     def probe(self):
+        snapshot = self.get_snapshot()
         try:
-            for fd, path in self.iter_full_fd_linux():
+            for fd, path in self.iter_full_fd_linux(snapshot["fd_names"]):
                 self._appender.append([
-                    self.get_timestamp(),
+                    snapshot.timestamp,
                     fd,
                     path
                 ])
         except PermissionError:
             raise ProbeError(f"TRACEE={self.trace_pid}: PermissionError encountered!")
+        except FileNotFoundError:
+            raise ProbeError(f"TRACEE={self.trace_pid}: FileNotFoundError encountered! Process exited?")
@@ -1,3 +1,4 @@
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread, ProbeError
@@ -9,6 +10,7 @@ class ProcessIOTracerThread(BaseProcessTracerThread):
     """
     The IO monitor, monitoring the disk and total read/write of a process.
     """
+    snapshot_fields = ("io_counters",)
 
     def __init__(
             self,
@@ -29,11 +31,13 @@ class ProcessIOTracerThread(BaseProcessTracerThread):
                 'DiskWrite',
                 'TotalRead',
                 'TotalWrite'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64, INT64, INT64, INT64, INT64]
         )
 
     def probe(self):
-        io_info = self._process.io_counters()
+        snapshot = self.get_snapshot()
+        io_info = snapshot["io_counters"]
         if io_info is None:
             raise ProbeError(f"TRACEE={self.trace_pid}: IO returns None!")
         curr_dr = io_info.read_bytes
@@ -41,7 +45,7 @@ class ProcessIOTracerThread(BaseProcessTracerThread):
         curr_tr = io_info.read_chars
         curr_tw = io_info.write_chars
         self._appender.append([
-            self.get_timestamp(),
+            snapshot.timestamp,
             curr_dr,
             curr_dw,
             curr_tr,
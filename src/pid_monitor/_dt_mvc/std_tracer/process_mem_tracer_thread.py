@@ -1,3 +1,4 @@
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread, ProbeError
@@ -9,6 +10,7 @@ class ProcessMEMTracerThread(BaseProcessTracerThread):
     """
     The process memory usage monitor.
     """
+    snapshot_fields = ("memory_full_info",)
 
     def __init__(
             self,
@@ -32,16 +34,18 @@ class ProcessMEMTracerThread(BaseProcessTracerThread):
                 'TEXT',
                 'DATA',
                 'SWAP'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64] + [INT64] * 7
         )
 
     def probe(self):
-        x = self._process.memory_full_info()
+        snapshot = self.get_snapshot()
+        x = snapshot["memory_full_info"]
         if x is None:
             raise ProbeError(f"TRACEE={self.trace_pid}: MEM returns None!")
         self.frontend_cache.resident_mem = x.rss
         self._appender.append([
-            self.get_timestamp(),
+            snapshot.timestamp,
             x.vms,
             x.rss,
             x.shared,
@@ -1,5 +1,4 @@
-import glob
-
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread, ProbeError
@@ -8,6 +7,7 @@ __all__ = ("ProcessNFDTracerThread",)
 
 
 class ProcessNFDTracerThread(BaseProcessTracerThread):
+    snapshot_fields = ("fd_names",)
 
     def __init__(
             self,
@@ -25,24 +25,18 @@ class ProcessNFDTracerThread(BaseProcessTracerThread):
             table_appender_header=[
                 'TIME',
                 'N_FD'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64, INT64]
         )
 
-    def get_nfd(self) -> int:
-        """
-        Get a dictionary of file descriptor and its absolute path, will return original fd path if error.
-
-        :return: A dict of [fd, fd_path], None for permission error.
-        """
-        glob_pattern = f'/proc/{self.trace_pid}/fd/[0-9]*'
-        return len(glob.glob(glob_pattern))
-
     def probe(self):
+        snapshot = self.get_snapshot()
         try:
             self._appender.append([
-                self.get_timestamp(),
-                self.get_nfd()
+                snapshot.timestamp,
+                len(snapshot["fd_names"])
             ])
-
         except PermissionError:
             raise ProbeError(f"TRACEE={self.trace_pid}: PermissionError encountered!")
+        except FileNotFoundError:
+            raise ProbeError(f"TRACEE={self.trace_pid}: FileNotFoundError encountered! Process exited?")
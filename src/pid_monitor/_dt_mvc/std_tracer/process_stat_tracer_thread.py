@@ -1,3 +1,4 @@
+from pid_monitor._dt_mvc.appender.typing import CATEGORY, FLOAT64
 from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseProcessTracerThread, ProbeError
@@ -6,6 +7,7 @@ __all__ = ("ProcessSTATTracerThread",)
 
 
 class ProcessSTATTracerThread(BaseProcessTracerThread):
+    snapshot_fields = ("status",)
     _cached_stat: str
 
     def __init__(
@@ -24,15 +26,17 @@ class ProcessSTATTracerThread(BaseProcessTracerThread):
             table_appender_header=[
                 'TIME',
                 'STAT'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64, CATEGORY]
         )
 
     def probe(self):
-        stat = self._process.status()
+        snapshot = self.get_snapshot()
+        stat = snapshot["status"]
         if stat is None:
             raise ProbeError(f"TRACEE={self.trace_pid}: STAT returns None!")
         self.frontend_cache.stat = stat
         self._appender.append([
-            self.get_timestamp(),
+            snapshot.timestamp,
             stat
         ])
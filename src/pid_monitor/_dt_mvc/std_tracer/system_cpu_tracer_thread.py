@@ -1,42 +1,63 @@
-import threading
-import time
-from statistics import mean
-from typing import List
+from typing import List, Tuple
 
-import psutil
+import numpy as np
 
 from pid_monitor._dt_mvc.appender import BaseTableAppender
-from pid_monitor._dt_mvc.frontend_cache.process_frontend_cache import ProcessFrontendCache
+from pid_monitor._dt_mvc.appender.typing import FLOAT64
 from pid_monitor._dt_mvc.frontend_cache.system_frontend_cache import SystemFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseSystemTracerThread
 
 __all__ = ("SystemCPUTracerThread",)
 
+_PROC_STAT_PATH = "/proc/stat"
 
-class AsyncSystemCPUProbeThread(threading.Thread):
-    appender: BaseTableAppender
+# Indices of columns in per-CPU lines of /proc/stat, see proc(5)
+_USER, _NICE, _SYSTEM, _IDLE, _IOWAIT, _IRQ, _SOFTIRQ, _STEAL = range(8)
+_N_ACCOUNTED_COLUMNS = 8
+"""guest and guest_nice are already accounted in user and nice"""
 
-    def __init__(self, appender: BaseTableAppender, frontend_cache: ProcessFrontendCache):
-        super().__init__()
-        self.appender = appender
-        self.frontend_cache = frontend_cache
+_DETAIL_FIELDS = ("USER", "SYSTEM", "IOWAIT", "STEAL")
 
-    def run(self):
-        cpu_percents: List[float] = psutil.cpu_percent(interval=1, percpu=True)
-        if cpu_percents is None:
-            return
-        self.frontend_cache.cpu_percent = mean(cpu_percents)
-        cpu_value_array = [time.time()]
-        cpu_value_array.extend(cpu_percents)
-        self.appender.append(cpu_value_array)
+
+def read_proc_stat_cpu() -> Tuple[List[str], np.ndarray]:
+    """
+    Read per-CPU lines of ``/proc/stat`` at once.
+
+    :return: Names of logical CPUs (e.g., ``"0"``), and a ``(n_cpu, 8)`` array of times in clock ticks.
+    """
+    cpu_names = []
+    cpu_times = []
+    with open(_PROC_STAT_PATH, "rt") as reader:
+        for line in reader:
+            if not line.startswith("cpu"):
+                break
+            if not line[3].isdigit():
+                continue
+            fields = line.split()
+            cpu_names.append(fields[0][3:])
+            cpu_times.append(fields[1:_N_ACCOUNTED_COLUMNS + 1])
+    return cpu_names, np.array(cpu_times, dtype=np.int64)
 
 
 class SystemCPUTracerThread(BaseSystemTracerThread):
     """
     System-level CPU utilization tracer, traces CPU utilization of all logical cores.
+
+    Utilization is computed from the difference of ``/proc/stat`` between two consecutive probes.
+    Busy percent of each core is written to ``sys.cpu``,
+    while user/system/iowait/steal percent of each core is written to ``sys.cpu_detail``.
+
+    Columns are CPUs online when tracing starts. CPUs going offline are written as NaN
+    until they are online again at two consecutive probes; CPUs coming online later are not traced.
     """
 
+    _cpu_names: List[str]
+    _last_cpu_times: np.ndarray
+    """Times of CPUs in :py:attr:`_cpu_names`, NaN for CPUs offline at last probe"""
+    _online_cpu_names: List[str]
+    _detail_appender: BaseTableAppender
+
     def __init__(
             self,
             trace_pid: int,
@@ -48,16 +69,74 @@ class SystemCPUTracerThread(BaseSystemTracerThread):
             pmc=pmc,
             frontend_cache=frontend_cache
         )
+        self._cpu_names, cpu_times = read_proc_stat_cpu()
+        self._last_cpu_times = cpu_times.astype(np.float64)
+        self._online_cpu_names = self._cpu_names
         cpu_name_array = ['TIME']
-        cpu_name_array.extend(map(str, range(psutil.cpu_count())))
+        cpu_name_array.extend(self._cpu_names)
         self._init_setup_hook(
             tracer_type="cpu",
-            table_appender_header=cpu_name_array
+            table_appender_header=cpu_name_array,
+            table_appender_column_types=[FLOAT64] * len(cpu_name_array)
         )
+        detail_name_array = ['TIME']
+        for cpu_name in self._cpu_names:
+            detail_name_array.extend(f"{cpu_name}_{field}" for field in _DETAIL_FIELDS)
+        self._detail_appender = self._create_appender(
+            tracer_type="cpu_detail",
+            table_appender_header=detail_name_array,
+            table_appender_column_types=[FLOAT64] * len(detail_name_array)
+        )
+
+    def _align_to_columns(self, cpu_names: List[str], cpu_times: np.ndarray) -> np.ndarray:
+        """
+        Times of CPUs in :py:attr:`_cpu_names`, NaN for those offline.
+        """
+        if cpu_names != self._online_cpu_names:
+            self.log_handler.warning(f"Set of online CPUs changed from {self._online_cpu_names} to {cpu_names}")
+            self._online_cpu_names = cpu_names
+        if cpu_names == self._cpu_names:
+            return cpu_times.astype(np.float64)
+        rows = {cpu_name: i for i, cpu_name in enumerate(cpu_names)}
+        aligned_cpu_times = np.full((len(self._cpu_names), _N_ACCOUNTED_COLUMNS), np.nan)
+        for i, cpu_name in enumerate(self._cpu_names):
+            if cpu_name in rows:
+                aligned_cpu_times[i] = cpu_times[rows[cpu_name]]
+        return aligned_cpu_times
 
     def probe(self):
-        acp = AsyncSystemCPUProbeThread(
-            appender=self._appender,
-            frontend_cache=self.frontend_cache
-        )
-        acp.start()
+        timestamp = self.get_timestamp()
+        # On CPU hotplug, deltas are only taken over CPUs online at both probes
+        cpu_times = self._align_to_columns(*read_proc_stat_cpu())
+        delta = cpu_times - self._last_cpu_times
+        self._last_cpu_times = cpu_times
+
+        total = delta.sum(axis=1)
+        idle = delta[:, _IDLE] + delta[:, _IOWAIT]
+        parts = np.stack((
+            delta[:, _USER] + delta[:, _NICE],
+            delta[:, _SYSTEM] + delta[:, _IRQ] + delta[:, _SOFTIRQ],
+            delta[:, _IOWAIT],
+            delta[:, _STEAL]
+        ), axis=1)
+        idle_default = np.where(np.isnan(total), np.nan, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            busy_percent = np.where(total > 0, (total - idle) / total * 100, idle_default)
+            parts_percent = np.where(
+                total[:, np.newaxis] > 0,
+                parts / total[:, np.newaxis] * 100,
+                idle_default[:, np.newaxis]
+            )
+
+        if not np.isnan(busy_percent).all():
+            self.frontend_cache.cpu_percent = float(np.nanmean(busy_percent))
+        cpu_value_array = [timestamp]
+        cpu_value_array.extend(busy_percent.tolist())
+        self._appender.append(cpu_value_array)
+        detail_value_array = [timestamp]
+        detail_value_array.extend(parts_percent.ravel().tolist())
+        self._detail_appender.append(detail_value_array)
+
+    def close(self):
+        super().close()
+        self._detail_appender.close()
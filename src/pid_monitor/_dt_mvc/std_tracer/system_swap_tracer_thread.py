@@ -1,5 +1,6 @@
 import psutil
 
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64
 from pid_monitor._dt_mvc.frontend_cache.system_frontend_cache import SystemFrontendCache
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_tracer import BaseSystemTracerThread
@@ -29,7 +30,8 @@ class SystemSWAPTracerThread(BaseSystemTracerThread):
                 'TIME',
                 'TOTAL',
                 'USED'
-            ]
+            ],
+            table_appender_column_types=[FLOAT64, INT64, INT64]
         )
 
     def probe(self):
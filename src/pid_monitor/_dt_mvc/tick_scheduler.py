@@ -0,0 +1,181 @@
+"""
+tick_scheduler -- Drive tracers from a fixed pool of worker threads
+
+Instead of having one OS thread per tracer per PID, each looping on ``sleep()``,
+tracers are registered to a :py:class:`TickScheduler` as plain probe objects.
+The scheduler keeps a priority heap ordered by the time each tracer is due,
+and a small fixed pool of worker threads pops due tracers, probes them and pushes them back.
+
+Due times are placed on a grid anchored at the start of the scheduler,
+so tracers sharing an interval are probed at the same ticks.
+If a probe takes longer than the interval, missed ticks are skipped instead of being caught up.
+
+The grid is anchored at a whole second of wall-clock time, so the wall-clock time of tick ``i``
+is :py:attr:`TickScheduler.wall_anchor` + ``i`` * interval.
+In aligned sampling mode, tracers stamp their probes with this time instead of reading the clock,
+so tables of all tracers probed at the same tick share the very same ``TIME``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from typing import List, Tuple
+
+from pid_monitor._dt_mvc.pm_config import DEFAULT_SCHEDULER_POOL_SIZE
+from pid_monitor._dt_mvc.std_tracer import BaseTracerThread
+
+_HeapItem = Tuple[float, int, int, BaseTracerThread]
+"""Due time, sequence number (to break ties), tick index and the tracer"""
+
+
+class _TickSchedulerWorkerThread(threading.Thread):
+    """Worker thread of :py:class:`TickScheduler`."""
+
+    def __init__(self, scheduler: TickScheduler, worker_id: int):
+        super().__init__(name=f"TickSchedulerWorker-{worker_id}", daemon=True)
+        self.scheduler = scheduler
+
+    def run(self):
+        self.scheduler.run_worker()
+
+
+class TickScheduler:
+    """
+    A priority-heap-based scheduler that drives :py:func:`BaseTracerThread.run_once`.
+
+    A tracer is never probed by two workers at the same time,
+    since it is removed from the heap while being probed.
+    """
+
+    pool_size: int
+    n_probes: int
+    """Number of probes performed"""
+
+    n_missed_ticks: int
+    """Number of ticks skipped because the probe was late"""
+
+    _heap: List[_HeapItem]
+    _cond: threading.Condition
+    _seq: itertools.count
+    wall_anchor: float
+    """Wall-clock time of tick 0, which is a whole second"""
+
+    _anchor: float
+    """Monotonic time of tick 0"""
+
+    _workers: List[_TickSchedulerWorkerThread]
+    _is_stopped: bool
+
+    def __init__(self, pool_size: int = DEFAULT_SCHEDULER_POOL_SIZE):
+        if pool_size < 1:
+            raise ValueError(f"pool_size should be positive, got {pool_size}")
+        self.pool_size = pool_size
+        self.n_probes = 0
+        self.n_missed_ticks = 0
+        self._heap = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        wall_now = time.time()
+        monotonic_now = time.monotonic()
+        self.wall_anchor = float(math.floor(wall_now))
+        self._anchor = monotonic_now - (wall_now - self.wall_anchor)
+        self._workers = []
+        self._is_stopped = False
+        self._log_handler = logging.getLogger()
+
+    def _first_tick_after(self, after: float, interval: float) -> int:
+        """Get index of the first point on the tick grid that is no earlier than ``after``."""
+        if interval <= 0:
+            return 0
+        return max(0, math.ceil((after - self._anchor) / interval))
+
+    def get_tick_timestamp(self, tick: int, interval: float) -> float:
+        """Get wall-clock time of a point on the tick grid."""
+        return self.wall_anchor + tick * interval
+
+    def _push(self, tick: int, tracer: BaseTracerThread):
+        """Push a tracer to the heap. Should be called with ``_cond`` held."""
+        due = self._anchor + tick * tracer.probe_interval
+        heapq.heappush(self._heap, (due, next(self._seq), tick, tracer))
+        self._cond.notify()
+
+    def register(self, tracer: BaseTracerThread):
+        """Add a tracer to the scheduler. It will be probed at the next tick."""
+        with self._cond:
+            if self._is_stopped:
+                raise RuntimeError("Cannot register tracers to a stopped scheduler")
+            self._push(self._first_tick_after(time.monotonic(), tracer.probe_interval), tracer)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def start(self):
+        for worker_id in range(self.pool_size):
+            worker = _TickSchedulerWorkerThread(self, worker_id)
+            worker.start()
+            self._workers.append(worker)
+        self._log_handler.debug(
+            f"TickScheduler started with {self.pool_size} workers, WALL_ANCHOR={self.wall_anchor}"
+        )
+
+    def _pop_due(self):
+        """
+        Block until a tracer is due. Return ``None`` if the scheduler is stopped.
+        """
+        with self._cond:
+            while not self._is_stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due = self._heap[0][0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                return heapq.heappop(self._heap)
+            return None
+
+    def run_worker(self):
+        while True:
+            item = self._pop_due()
+            if item is None:
+                return
+            _, _, tick, tracer = item
+            tick_timestamp = self.get_tick_timestamp(tick, tracer.probe_interval)
+            if tracer.should_exit or not tracer.run_once(tick=tick, tick_timestamp=tick_timestamp):
+                tracer.close()
+                continue
+            next_tick = max(tick + 1, self._first_tick_after(time.monotonic(), tracer.probe_interval))
+            with self._cond:
+                self.n_probes += 1
+                self.n_missed_ticks += next_tick - tick - 1
+                if self._is_stopped:
+                    retire = True
+                else:
+                    retire = False
+                    self._push(next_tick, tracer)
+            if retire:
+                tracer.close()
+
+    def stop(self):
+        """
+        Stop all workers and close all remaining tracers.
+        """
+        with self._cond:
+            self._is_stopped = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        with self._cond:
+            remaining = [item[3] for item in self._heap]
+            self._heap.clear()
+        for tracer in remaining:
+            tracer.close()
+        self._log_handler.debug(
+            f"TickScheduler stopped: PROBES={self.n_probes} MISSED_TICKS={self.n_missed_ticks}"
+        )
@@ -1,14 +1,15 @@
 import logging
 import threading
 import time
+from typing import Optional
 
 from pid_monitor._dt_mvc.pm_config import PMConfig
 
 
-class ThreadWithPMC(threading.Thread):
+class WithPMC:
     pmc: PMConfig
     should_exit: bool
-    """Whether this thread should be terminated"""
+    """Whether this object should be terminated"""
 
     log_handler: logging.Logger
     """The logger handler"""
@@ -28,3 +29,31 @@ class ThreadWithPMC(threading.Thread):
         Get timestamp in an accuracy of 0.01 seconds.
         """
         return time.time()
+
+
+class ThreadWithPMC(WithPMC, threading.Thread):
+    _should_exit_event: threading.Event
+
+    def __init__(self, trace_pid: int, pmc: PMConfig):
+        self._should_exit_event = threading.Event()
+        super().__init__(trace_pid=trace_pid, pmc=pmc)
+
+    @property
+    def should_exit(self) -> bool:
+        """Whether this thread should be terminated"""
+        return self._should_exit_event.is_set()
+
+    @should_exit.setter
+    def should_exit(self, value: bool):
+        if value:
+            self._should_exit_event.set()
+        else:
+            self._should_exit_event.clear()
+
+    def wait_for_exit(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until :py:attr:`should_exit` is set or timeout.
+
+        :return: Value of :py:attr:`should_exit`.
+        """
+        return self._should_exit_event.wait(timeout)
@@ -1,66 +1,169 @@
 """Helper for multiprocessing"""
-import gc
-import multiprocessing
+import concurrent.futures
+import logging
+import math
+import os
 import threading
-import time
-from typing import Union
+from typing import Any, Callable, List, Optional, Tuple
 
 import tqdm
 
+_LOG_HANDLER = logging.getLogger()
+
+_CHUNKS_PER_WORKER = 4
+"""Number of chunks each worker gets when jobs are chunked automatically, as is done by :py:meth:`multiprocessing.Pool.map`"""
+
+_Job = Tuple[Callable[..., Any], Tuple[Any, ...], dict]
+
+
+def _read_cgroup_cpu_quota() -> Optional[float]:
+    """
+    CPU quota of the cgroup of current process in number of CPUs, ``None`` if unlimited or unknown.
+    """
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max") as reader:
+            quota, period = reader.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as reader:
+            quota = int(reader.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as reader:
+            period = int(reader.read())
+    except (OSError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+
+def get_available_cpu_count() -> int:
+    """
+    Number of CPUs current process may use, considering CPU affinity and cgroup CPU quota.
+    """
+    try:
+        cpu_count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpu_count = os.cpu_count() or 1
+    quota = _read_cgroup_cpu_quota()
+    if quota is not None:
+        cpu_count = min(cpu_count, math.ceil(quota))
+    return max(1, cpu_count)
+
+
+def _run_chunk(jobs: List[_Job]) -> List[Any]:
+    """
+    Run a chunk of jobs in a worker. Failed jobs are logged and give ``None``.
+    """
+    results = []
+    for func, args, kwargs in jobs:
+        try:
+            results.append(func(*args, **kwargs))
+        except Exception as e:
+            _LOG_HANDLER.error(f"{func.__name__}{args}: {e.__class__.__name__} encountered! DETAILS={e.__repr__()}")
+            results.append(None)
+    return results
+
 
 class ParallelJobQueue(threading.Thread):
-    def __init__(self,
-                 pool_name: str = "Unnamed pool",
-                 pool_size: int = 0,
-                 refresh_interval: float = 0.01):
+    """
+    Run jobs appended by :py:meth:`append` on a pool of ``pool_size`` workers, showing progress.
+
+    Jobs are sent to workers in chunks of ``chunk_size``, so many small jobs do not cost one round trip each.
+    Results are in :py:attr:`results`, in the order jobs were appended, once the queue is joined.
+    Jobs run in processes, so their callables and arguments should be picklable,
+    unless ``use_threads`` is set, which suits jobs waiting on subprocesses or I/O.
+    """
+
+    pool_name: str
+    pool_size: int
+    chunk_size: int
+    use_threads: bool
+    results: List[Any]
+
+    _jobs: List[_Job]
+    _n_finished: int
+    _executor: Optional[concurrent.futures.Executor]
+
+    def __init__(
+            self,
+            pool_name: str = "Unnamed pool",
+            pool_size: int = 0,
+            chunk_size: int = 0,
+            use_threads: bool = False
+    ):
+        """
+        :param pool_size: Number of workers, ``0`` for all available CPUs, see :py:func:`get_available_cpu_count`.
+        :param chunk_size: Number of jobs sent to a worker at once, ``0`` to split jobs into a few chunks per worker.
+        """
         super().__init__()
+        self.pool_name = pool_name
         self.pool_size = pool_size
         if self.pool_size == 0:
-            self.pool_size = multiprocessing.cpu_count()
-        self.pending_job_queue = []
-        self._is_terminated = False
-        self._max_queue_len = 0
-        self.pool_name = pool_name
-        self.running_job_queue = []
-        self.refresh_interval = refresh_interval
+            self.pool_size = get_available_cpu_count()
+        self.chunk_size = chunk_size
+        self.use_threads = use_threads
+        self.results = []
+        self._jobs = []
+        self._n_finished = 0
+        self._executor = None
 
     @property
     def all_finished(self) -> bool:
-        return len(self.pending_job_queue) + len(self.running_job_queue) == 0
+        return self._n_finished == len(self._jobs)
+
+    def _get_chunk_size(self) -> int:
+        if self.chunk_size > 0:
+            return self.chunk_size
+        return max(1, math.ceil(len(self._jobs) / (self.pool_size * _CHUNKS_PER_WORKER)))
 
     def run(self):
-        def _scan_through_process():
-            """
-            Scan through all processes and terminate the exited process.
-            """
-            for process in self.running_job_queue:
-                if not process.is_alive():
-                    process.join()
-                    if isinstance(process, multiprocessing.Process):
-                        process.close()
-                    self.running_job_queue.remove(process)
-                    del process
-                    gc.collect()
-                    pbar.update(1)
-
-        pbar = tqdm.tqdm(desc=self.pool_name, total=self._max_queue_len)
-        while len(self.pending_job_queue) > 0 and not self._is_terminated:
-            while len(self.pending_job_queue) > 0 and len(self.running_job_queue) < self.pool_size:
-                new_processs = self.pending_job_queue[0]
-                self.pending_job_queue.remove(new_processs)
-                self.running_job_queue.append(new_processs)
-                new_processs.start()
-            _scan_through_process()
-            time.sleep(self.refresh_interval)
-        while len(self.running_job_queue) > 0 and not self._is_terminated:
-            _scan_through_process()
-            time.sleep(self.refresh_interval)
-        pbar.close()
-        self._is_terminated = True
+        self.results = [None] * len(self._jobs)
+        if not self._jobs:
+            return
+        chunk_size = self._get_chunk_size()
+        chunk_starts = range(0, len(self._jobs), chunk_size)
+        executor_class = (
+            concurrent.futures.ThreadPoolExecutor
+            if self.use_threads
+            else concurrent.futures.ProcessPoolExecutor
+        )
+        with tqdm.tqdm(desc=self.pool_name, total=len(self._jobs)) as pbar, \
+                executor_class(max_workers=min(self.pool_size, len(chunk_starts))) as executor:
+            self._executor = executor
+            futures = {
+                executor.submit(_run_chunk, self._jobs[start:start + chunk_size]): start
+                for start in chunk_starts
+            }
+            for future in concurrent.futures.as_completed(futures):
+                start = futures[future]
+                n_jobs = min(chunk_size, len(self._jobs) - start)
+                try:
+                    self.results[start:start + n_jobs] = future.result()
+                except concurrent.futures.CancelledError:
+                    continue
+                except Exception as e:
+                    # Worker killed, or unpicklable job
+                    _LOG_HANDLER.error(f"{self.pool_name}: {e.__class__.__name__} encountered! DETAILS={e.__repr__()}")
+                self._n_finished += n_jobs
+                pbar.update(n_jobs)
+        self._executor = None
 
     def stop(self):
-        self._is_terminated = True
+        """
+        Cancel jobs not yet started.
+        """
+        executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-    def append(self, mp_instance: Union[multiprocessing.Process, threading.Thread]):
-        self.pending_job_queue.append(mp_instance)
-        self._max_queue_len += 1
+    def append(self, func: Callable[..., Any], *args, **kwargs):
+        """
+        Add job ``func(*args, **kwargs)``. Should be called before the queue is started.
+        """
+        self._jobs.append((func, args, kwargs))
@@ -2,24 +2,47 @@
 WARNING! This file is subject to change.
 """
 
+import contextlib
+import fnmatch
+import functools
 import glob
 import logging
 import math
-import multiprocessing
 import os
-import queue
 import re
-from typing import Tuple, Optional, List, Dict
+from typing import Tuple, Optional, List, Dict, Any, Iterator, Iterable
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import tqdm
 import seaborn as sns
 
+from pid_monitor._dt_mvc.appender.session_manifest import load_session_manifest, iter_manifest_tables, \
+    TABLE_KIND_PROCESS, find_session_manifest, MANIFEST_SUFFIX
 from pid_monitor._lib import parallel_helper
+from pid_monitor._resampler import engine
+
+AGGREGATION_CHUNK_CELLS = 1 << 25
+"""Maximum number of cells of resampled tables stacked in memory at once by :py:func:`aggregate_using_sum`"""
+
+RESAMPLED_ROW_GROUP_SIZE = 4096
+"""Rows per row group of resampled tables, so that they can be aggregated in chunks of time"""
+
+TOTAL_PROCESS_TABLES = {
+    "mem": ["VIRT", "RESIDENT"],
+    "cpu": ["CPU_PERCENT"],
+    "nfd": ["N_FD"]
+}
+"""Per-process tables resampled and summed by :py:func:`total_process`, with their columns"""
 
 
 def get_first_and_last_timestamp_from_a_file(path: str) -> Optional[Tuple[float, float]]:
+    """
+    Get the time range of a table by reading it. Time ranges of sessions with a manifest are recorded there.
+    """
     _lh = logging.getLogger()
     _lh.debug(f"Parsing {path}")
     retd_start = None
@@ -44,23 +67,46 @@ def get_first_and_last_timestamp_from_a_file(path: str) -> Optional[Tuple[float,
         return None
 
 
-class GetFirstAndLastTimestampFromAFileProcess(multiprocessing.Process):
-    def __init__(self, path: str, result_queue: multiprocessing.Queue):
-        super().__init__()
-        self.path = path
-        self.result_queue = result_queue
+def list_process_tables(output_basename: str, file_mask: str) -> List[Dict[str, Any]]:
+    """
+    Per-process tables whose filenames match ``file_mask``, as described in the session manifest.
+    Sessions traced without a manifest are globbed, skipping system tables and outputs of the resampler.
+
+    Tables in shared files of the session layout are not listed,
+    since they cannot be resampled one file per process.
+    """
+    manifest = load_session_manifest(output_basename)
+    if manifest is not None:
+        return [
+            table
+            for table in iter_manifest_tables(manifest, kind=TABLE_KIND_PROCESS)
+            if not table["shared"] and fnmatch.fnmatch(os.path.basename(table["filename"]), file_mask)
+        ]
+    tables = []
+    for path in glob.glob(os.path.join(output_basename, file_mask)):
+        if path.find("sys") != -1 or path.find("resampled") != -1 or path.find("final") != -1:
+            continue
+        tables.append({"filename": path, "n_rows": None, "min_time": None, "max_time": None})
+    return tables
 
-    def run(self) -> None:
-        self.result_queue.put(
-            get_first_and_last_timestamp_from_a_file(self.path)
-        )
+
+def get_manifest_time_range(manifest: Dict[str, Any], tables: List[Dict[str, Any]]) -> Tuple[float, float]:
+    """
+    Time range of tables from their indexes, or of the session if some table has no index.
+
+    :raises ValueError: If neither is known.
+    """
+    if all(table["min_time"] is not None for table in tables):
+        return min(table["min_time"] for table in tables), max(table["max_time"] for table in tables)
+    if manifest["end_time"] is None:
+        raise ValueError("Cannot find the time range of a session traced without index and not finished")
+    return manifest["start_time"], manifest["end_time"]
 
 
 class ResamplerConfig:
     interval: pd.Timedelta
     time_start: pd.Timestamp
     time_end: pd.Timestamp
-    index: pd.DatetimeIndex
 
     def __init__(
             self,
@@ -72,8 +118,25 @@ class ResamplerConfig:
         self.interval = pd.Timedelta(interval, unit="s")
         self.time_start = pd.Timestamp(round(time_start, round_to_demical), unit="s")
         self.time_end = pd.Timestamp(round(time_end, round_to_demical), unit="s")
-        self.index = pd.date_range(
-            start=self.time_start - 2 * self.interval,
+
+    @property
+    def index_start(self) -> pd.Timestamp:
+        return self.time_start - 2 * self.interval
+
+    @property
+    def n_bins(self) -> int:
+        """
+        Length of :py:attr:`index`, without building it.
+        """
+        return (self.time_end - self.time_start + 4 * self.interval) // self.interval + 1
+
+    @functools.cached_property
+    def index(self) -> pd.DatetimeIndex:
+        """
+        Resampling grid. Built on first use, as it is large for long sessions at fine intervals.
+        """
+        return pd.date_range(
+            start=self.index_start,
             end=self.time_end + 2 * self.interval,
             freq=self.interval
         )
@@ -88,31 +151,20 @@ class ResamplerConfig:
     ):
         new_instance_start = math.inf
         new_instance_end = -math.inf
-        files_needed_to_be_parsed = list(glob.glob(os.path.join(output_basename, file_mask)))
-        manager = multiprocessing.Manager()
-        result_queue = manager.Queue()
-        pool = parallel_helper.ParallelJobQueue("Parsing...", refresh_interval=0, pool_size=1000)
-        for path in files_needed_to_be_parsed:
-            if path.find("sys") != -1:
-                continue
-            if path.find("resampled") != -1:
-                continue
-            if path.find("final") != -1:
-                continue
-            pool.append(GetFirstAndLastTimestampFromAFileProcess(path, result_queue))
+        pool = parallel_helper.ParallelJobQueue("Parsing...")
+        for table in list_process_tables(output_basename, file_mask):
+            if table["min_time"] is not None:
+                new_instance_start = min(new_instance_start, table["min_time"])
+                new_instance_end = max(new_instance_end, table["max_time"])
+            elif table["n_rows"] != 0:
+                pool.append(get_first_and_last_timestamp_from_a_file, table["filename"])
         pool.start()
-        while not pool.all_finished:
-            try:
-                this_time_start_end = result_queue.get(timeout=0.1)
-            except (TimeoutError, queue.Empty):
-                continue
+        pool.join()
+        for this_time_start_end in pool.results:
             if this_time_start_end is None:
                 continue
-            else:
-                new_instance_start = min(new_instance_start, this_time_start_end[0])
-                new_instance_end = max(new_instance_end, this_time_start_end[1])
-        pool.join()
-        manager.shutdown()
+            new_instance_start = min(new_instance_start, this_time_start_end[0])
+            new_instance_end = max(new_instance_end, this_time_start_end[1])
         if new_instance_start is math.inf or new_instance_end is math.inf:
             raise ValueError(f"Failed to get valid start/end time from {output_basename}")
         new_instance = cls(
@@ -128,6 +180,36 @@ class ResamplerConfig:
         # )
         return new_instance
 
+    @classmethod
+    def from_manifest(
+            cls,
+            manifest: Dict[str, Any],
+            interval: float,
+            round_to_demical: int,
+            table_names: Iterable[str]
+    ):
+        """
+        Resampling grid covering per-process tables ``table_names`` of a session,
+        whatever their format or layout, from the time ranges recorded in its manifest.
+
+        :raises ValueError: If no table has rows, or their time range is unknown.
+        """
+        table_names = set(table_names)
+        tables = [
+            table
+            for table in iter_manifest_tables(manifest, kind=TABLE_KIND_PROCESS)
+            if table["table"] in table_names and table["n_rows"] != 0
+        ]
+        if not tables:
+            raise ValueError(f"No table of {sorted(table_names)} with rows found in the session manifest")
+        time_start, time_end = get_manifest_time_range(manifest, tables)
+        return cls(
+            time_start=time_start,
+            time_end=time_end,
+            interval=interval,
+            round_to_demical=round_to_demical
+        )
+
 
 class BaseResampler:
     filename_regex: re.Pattern
@@ -139,13 +221,44 @@ class BaseResampler:
     ):
         self.rsc = rsc
 
+    def _snap_to_index(self, df: pd.DataFrame) -> bool:
+        """
+        If all ``TIME`` lie on the resampling grid, as is written in aligned sampling mode
+        with the same interval, replace them with exact points of the grid.
+
+        :return: Whether ``TIME`` was snapped.
+        """
+        index_start = self.rsc.index[0]
+        interval_seconds = self.rsc.interval / pd.Timedelta("1s")
+        offsets = (df['TIME'] - (index_start - pd.Timestamp("1970-01-01")) / pd.Timedelta("1s")) / interval_seconds
+        rounded_offsets = offsets.round()
+        if not ((offsets - rounded_offsets).abs() < 1E-3).all():
+            return False
+        df['TIME'] = index_start + pd.to_timedelta(rounded_offsets.astype("int64") * self.rsc.interval.value, unit="ns")
+        return True
+
     def resample(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        The Default resampler will resample all data
+        The Default resampler will resample all data.
+
+        Points of the resampling grid between first and last sample take the last sample at or before them,
+        as empty bins are forward-filled by :py:mod:`engine`.
+        Data that is already on the resampling grid is only filled where ticks are missing.
         """
+        if df.shape[0] != 0 and self._snap_to_index(df):
+            df = df.drop_duplicates(subset=['TIME'], keep="last").set_index('TIME')
+            lifetime_index = pd.date_range(start=df.index[0], end=df.index[-1], freq=self.rsc.interval)
+            df = (
+                df
+                .reindex(lifetime_index, method="ffill")
+                .reindex(self.rsc.index)
+                .reset_index(drop=False)
+            )
+            df['TIME'] = (df['index'] - pd.Timestamp("1970-01-01")) / pd.Timedelta("1s")
+            return df.drop('index', axis=1)
         df['TIME'] = pd.to_datetime(df['TIME'], unit="s")
         if df.shape[0] == 0:
-            df = df.set_index('TIME').reindex(self.rsc.index, method="bfill").reset_index(drop=False)
+            df = df.set_index('TIME').reindex(self.rsc.index, method="ffill").reset_index(drop=False)
         else:
             df = df.sort_values(by=['TIME'])
             df_time_start = df['TIME'][0]
@@ -161,7 +274,7 @@ class BaseResampler:
             df = (
                 df
                 .set_index('TIME')
-                .reindex(phase1_scale_index, method="bfill")
+                .reindex(phase1_scale_index, method="ffill")
                 .reindex(self.rsc.index)
                 .reset_index(drop=False)
             )
@@ -174,31 +287,63 @@ class BaseResampler:
         return df
 
 
-def aggregate_using_sum(output_basename: str, file_mask: str):
-    files_needed_to_be_parsed = list(glob.glob(os.path.join(output_basename, file_mask)))
-    full_df = None
-    full_df_names = []
-
-    for path in tqdm.tqdm(files_needed_to_be_parsed, desc="Aggregating..."):
-        df = pd.read_parquet(path).set_index("TIME").fillna(value=0)
-        # print(df.head(2))
-        if full_df is None:
-            full_df = df
-            full_df_names = full_df.columns
-            full_df = full_df.assign(NPROC=0)
-        else:
-            # print(full_df.head(2))
-            # print(list(df.index.array))
-            for time in full_df.index.array:
-                if df.loc[time, full_df_names[0]] != 0:
-                    full_df.loc[time, "NPROC"] += 1
-            full_df = full_df.join(df, on="TIME", lsuffix="_L", rsuffix="_R")
-            # print(full_df.shape)
-            for name in full_df_names:
-                full_df[name] = full_df[[f"{name}_L", f"{name}_R"]].sum(axis=1)
-                full_df = full_df.drop([f"{name}_R", f"{name}_L"], axis=1)
-                # print(full_df.dtypes.keys())
-    return full_df
+def _read_parquet_rows(path: str, columns: List[str], start: int, stop: int) -> pd.DataFrame:
+    """
+    Read rows ``[start, stop)`` of a Parquet file, decoding only row groups holding them.
+    """
+    parquet_file = pq.ParquetFile(path)
+    try:
+        row_groups = []
+        first_row = 0
+        offset = 0
+        for i in range(parquet_file.metadata.num_row_groups):
+            n_rows = parquet_file.metadata.row_group(i).num_rows
+            if offset < stop and offset + n_rows > start:
+                if not row_groups:
+                    first_row = offset
+                row_groups.append(i)
+            offset += n_rows
+        table = parquet_file.read_row_groups(row_groups, columns=columns)
+    finally:
+        parquet_file.close()
+    return table.slice(start - first_row, stop - start).to_pandas()
+
+
+def aggregate_using_sum(output_basename: str, file_mask: str) -> Optional[pd.DataFrame]:
+    """
+    Sum resampled tables of all processes, with ``NPROC`` the number of processes with samples at each time.
+
+    Tables are stacked into a ``process x time x column`` array and reduced along the process axis,
+    in chunks of time of at most :py:data:`AGGREGATION_CHUNK_CELLS` cells, so long sessions fit in memory.
+
+    :return: Frame indexed by ``TIME``, ``None`` if no table matches.
+    """
+    paths = sorted(glob.glob(os.path.join(output_basename, file_mask)))
+    if not paths:
+        return None
+    value_names = [
+        name
+        for name in pq.read_schema(paths[0]).names
+        if name != "TIME" and not name.startswith("__index_level_")
+    ]
+    n_rows = pq.read_metadata(paths[0]).num_rows
+    chunk_rows = max(1, AGGREGATION_CHUNK_CELLS // (len(paths) * max(1, len(value_names))))
+    chunk_dfs = []
+    with tqdm.tqdm(total=len(paths) * math.ceil(n_rows / chunk_rows), desc="Aggregating...") as pbar:
+        for start in range(0, n_rows, chunk_rows):
+            stop = min(n_rows, start + chunk_rows)
+            stacked = np.empty((len(paths), stop - start, len(value_names)), dtype="float64")
+            times = None
+            for i, path in enumerate(paths):
+                df = _read_parquet_rows(path, ["TIME", *value_names], start, stop)
+                if times is None:
+                    times = df["TIME"].to_numpy()
+                stacked[i] = df[value_names].to_numpy(dtype="float64")
+                pbar.update(1)
+            chunk_df = pd.DataFrame(np.nansum(stacked, axis=0), columns=value_names, index=pd.Index(times, name="TIME"))
+            chunk_df["NPROC"] = np.count_nonzero(~np.isnan(stacked[:, :, 0]), axis=0)
+            chunk_dfs.append(chunk_df)
+    return pd.concat(chunk_dfs)
 
 
 def plot_aggregation_figure(output_basename: str, file_mask: str, col_name: str, out_filename: str):
@@ -220,52 +365,179 @@ def plot_aggregation_figure(output_basename: str, file_mask: str, col_name: str,
 
 
 
+def _resample_file(rsc: ResamplerConfig, path: str, keepfield: List[str]):
+    df = pd.read_csv(path, delimiter="\t", engine="pyarrow", usecols=[*keepfield, "TIME"])
+    (
+        BaseResampler(rsc)
+        .resample(df)
+        .to_parquet(path.replace(".tsv.gz", ".resampled.parquet"), row_group_size=RESAMPLED_ROW_GROUP_SIZE)
+    )
+
+
 def parallel_resample(
         output_basename: str,
         rsc: ResamplerConfig,
         file_mask: str,
         keepfield: List[str]
 ):
-    class ResampleProcess(multiprocessing.Process):
-        def __init__(self, _rsc: ResamplerConfig, _path: str, _keepfield: List[str]):
-            super().__init__()
-            self.rsc = _rsc
-            self.path = _path
-            self.keepfield = _keepfield
-            self.keepfield.append("TIME")
-
-        def run(self) -> None:
-            df = pd.read_csv(self.path, delimiter="\t", engine="pyarrow")
-            for field in df.columns:
-                if field not in self.keepfield:
-                    df = df.drop(field, axis=1)
-            (
-                BaseResampler(self.rsc)
-                .resample(df)
-                .to_parquet(self.path.replace(".tsv.gz", ".resampled.parquet"))
-            )
-
-    files_needed_to_be_parsed = list(glob.glob(os.path.join(output_basename, file_mask)))
-    pool = parallel_helper.ParallelJobQueue(pool_name="Resampling", refresh_interval=0, pool_size=1000)
-    for path in files_needed_to_be_parsed:
-        if path.find("sys") != -1:
-            continue
-        pool.append(ResampleProcess(rsc, path, keepfield))
+    pool = parallel_helper.ParallelJobQueue(pool_name="Resampling")
+    for table in list_process_tables(output_basename, file_mask):
+        pool.append(_resample_file, rsc, table["filename"], keepfield)
     pool.start()
     pool.join()
 
 
-def total_process(output_basename: str):
-    # print(output_basename)
-    rsc = ResamplerConfig.from_dir(
-        output_basename=output_basename,
-        interval=1,
-        round_to_demical=0,
-        file_mask="*.tsv.gz"
+def resample_table(
+        output_basename: str,
+        rsc: ResamplerConfig,
+        table_name: str,
+        keepfield: List[str],
+        aggregation: str = "last"
+):
+    """
+    Resample per-process table ``table_name`` of all processes into ``{basename}.{pid}.{table_name}.resampled.parquet``.
+
+    Sessions with a manifest are resampled at once by :py:mod:`engine`, whatever their format or layout.
+    Others are resampled file by file by :py:func:`parallel_resample`.
+    """
+    manifest_filename = find_session_manifest(output_basename)
+    if manifest_filename is None:
+        parallel_resample(output_basename, rsc, f"*.{table_name}.tsv.gz", keepfield)
+        return
+    session_basename = manifest_filename[:-len(MANIFEST_SUFFIX) - 1]
+    long_table = engine.load_long_format(load_session_manifest(manifest_filename), table_name, keepfield)
+    resampled_table = engine.resample_long_format(
+        long_table,
+        time_start=(rsc.index_start - pd.Timestamp("1970-01-01")) / pd.Timedelta("1s"),
+        interval=rsc.interval / pd.Timedelta("1s"),
+        n_bins=rsc.n_bins,
+        aggregation=aggregation
+    )
+    for j, pid in enumerate(tqdm.tqdm(resampled_table.pids, desc=f"Writing {table_name}...")):
+        resampled_table.get_process_frame(j).to_parquet(
+            f"{session_basename}.{pid}.{table_name}.resampled.parquet",
+            row_group_size=RESAMPLED_ROW_GROUP_SIZE
+        )
+
+
+def stream_resample_table(
+        output_basename: str,
+        rsc: ResamplerConfig,
+        table_name: str,
+        keepfield: List[str],
+        aggregation: str = "last",
+        window_bins: int = 0
+) -> Iterator[engine.ResampledTable]:
+    """
+    Resample per-process table ``table_name`` of all processes window by window with :py:class:`engine.StreamingResampler`,
+    appending each window to ``{basename}.{table_name}.resampled_long.parquet``, in long format
+    (``TIME``, ``PID``, ``keepfield...``) with only bins within lifetimes of processes, and yielding it.
+    The file is only complete once the generator is exhausted or closed.
+
+    :param window_bins: Number of bins per window, see :py:class:`engine.StreamingResampler`.
+    :raises ValueError: If the session has no manifest.
+    """
+    manifest_filename = find_session_manifest(output_basename)
+    if manifest_filename is None:
+        raise ValueError(f"Streaming resampling needs a session manifest, none found at {output_basename}")
+    session_basename = manifest_filename[:-len(MANIFEST_SUFFIX) - 1]
+    streaming_resampler = engine.StreamingResampler(
+        load_session_manifest(manifest_filename),
+        table_name,
+        keepfield,
+        time_start=(rsc.index_start - pd.Timestamp("1970-01-01")) / pd.Timedelta("1s"),
+        interval=rsc.interval / pd.Timedelta("1s"),
+        n_bins=rsc.n_bins,
+        aggregation=aggregation,
+        window_bins=window_bins
     )
-    parallel_resample(output_basename, rsc, "*.mem.tsv.gz", keepfield=["VIRT", "RESIDENT"])
-    parallel_resample(output_basename, rsc, "*.cpu.tsv.gz", keepfield=["CPU_PERCENT"])
-    parallel_resample(output_basename, rsc, "*.nfd.tsv.gz", keepfield=["N_FD"])
+    schema = pa.schema([
+        ("TIME", pa.float64()),
+        ("PID", pa.int64()),
+        *((name, pa.float64()) for name in keepfield)
+    ])
+    with pq.ParquetWriter(f"{session_basename}.{table_name}.resampled_long.parquet", schema) as writer:
+        for resampled_table in streaming_resampler:
+            is_alive = ~np.isnan(resampled_table.values[keepfield[0]])
+            bin_ids, pid_columns = np.nonzero(is_alive)
+            writer.write_table(pa.table(
+                {
+                    "TIME": resampled_table.time_index[bin_ids],
+                    "PID": resampled_table.pids[pid_columns],
+                    **{name: resampled_table.values[name][is_alive] for name in keepfield}
+                },
+                schema=schema
+            ))
+            yield resampled_table
+
+
+def _stream_total_process(output_basename: str, interval: float):
+    """
+    :py:func:`total_process` for sessions larger than memory, writing ``final.csv`` window by window.
+    Figures, which need all processes over the whole session, are not drawn.
+
+    :raises ValueError: If the session has no manifest.
+    """
+    manifest = load_session_manifest(output_basename)
+    if manifest is None:
+        raise ValueError(f"Streaming resampling needs a session manifest, none found at {output_basename}")
+    rsc = ResamplerConfig.from_manifest(manifest, interval, 0, TOTAL_PROCESS_TABLES)
+    # Tables are resampled in windows of the same bins, so that they can be summed together
+    n_pids = len({
+        table["pid"]
+        for table in iter_manifest_tables(manifest, kind=TABLE_KIND_PROCESS)
+        if table["table"] in TOTAL_PROCESS_TABLES
+    })
+    window_bins = max(1, engine.STREAM_WINDOW_CELLS // max(1, n_pids))
+    final_filename = os.path.join(output_basename, "final.csv")
+    is_first_window = True
+    with contextlib.ExitStack() as stack:
+        # Closing streams finishes their outputs, even if resampling fails
+        streams = [
+            stack.enter_context(contextlib.closing(
+                stream_resample_table(output_basename, rsc, table_name, keepfield, window_bins=window_bins)
+            ))
+            for table_name, keepfield in TOTAL_PROCESS_TABLES.items()
+        ]
+        for resampled_tables in tqdm.tqdm(zip(*streams), desc="Resampling..."):
+            full_df = pd.DataFrame(index=pd.Index(resampled_tables[0].time_index, name="TIME"))
+            nproc = np.zeros(full_df.shape[0], dtype="int64")
+            for resampled_table in resampled_tables:
+                for name, values in resampled_table.values.items():
+                    full_df[name] = np.nansum(values, axis=1)
+                first_values = next(iter(resampled_table.values.values()))
+                nproc = np.maximum(nproc, np.count_nonzero(~np.isnan(first_values), axis=1))
+            full_df["NPROC"] = nproc
+            full_df.to_csv(final_filename, mode="w" if is_first_window else "a", header=is_first_window)
+            is_first_window = False
+
+
+def total_process(output_basename: str, interval: float = 1, streaming: bool = False):
+    """
+    Resample memory, CPU and file descriptor usage of all processes and sum them into ``final.csv``.
+
+    The resampling grid of sessions with a manifest covers the time ranges it records for these tables,
+    whatever their format or layout. Others are globbed for ``*.tsv.gz``.
+
+    :param interval: Resampling interval in seconds.
+    :param streaming: Resample window by window, for sessions larger than memory. Needs a session manifest.
+    """
+    # print(output_basename)
+    if streaming:
+        _stream_total_process(output_basename, interval)
+        return
+    manifest = load_session_manifest(output_basename)
+    if manifest is None:
+        rsc = ResamplerConfig.from_dir(
+            output_basename=output_basename,
+            interval=interval,
+            round_to_demical=0,
+            file_mask="*.tsv.gz"
+        )
+    else:
+        rsc = ResamplerConfig.from_manifest(manifest, interval, 0, TOTAL_PROCESS_TABLES)
+    for table_name, keepfield in TOTAL_PROCESS_TABLES.items():
+        resample_table(output_basename, rsc, table_name, keepfield=keepfield)
 
     full_df_mem = aggregate_using_sum(output_basename, "*.mem.resampled.parquet")
     full_df_cpu = aggregate_using_sum(output_basename, "*.cpu.resampled.parquet")
@@ -0,0 +1,401 @@
+"""
+engine -- Resample one metric of all processes at once
+
+Resampling process by process reads, sorts and reindexes one small frame per process,
+so sessions with thousands of short-lived processes spend most of their time in per-frame overhead.
+
+Here, a metric of all processes is loaded into a long table of ``(PID, TIME, values...)``,
+every sample is assigned to its bin with one :py:func:`numpy.searchsorted`,
+and bins are aggregated into a dense ``time x PID`` matrix per column with grouped NumPy operations.
+Bin ``i`` is labelled with its start ``time_start + i * interval`` and holds samples in ``[start, start + interval)``.
+
+Sessions larger than memory are resampled by :py:class:`StreamingResampler`,
+which reads tables in chunks and yields windows of bins of all processes,
+carrying the last value of each process from one window to the next.
+"""
+
+import logging
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pid_monitor._dt_mvc.appender.session_manifest import iter_manifest_tables, TABLE_KIND_PROCESS
+from pid_monitor._dt_mvc.appender.table_reader import read_manifest_table, iter_manifest_table_chunks, \
+    DEFAULT_CHUNK_ROWS
+
+AGGREGATIONS = ("last", "mean", "max")
+
+_BIN_TOLERANCE = 1E-3
+"""Fraction of interval by which samples are moved to the next bin, so samples on the grid are not binned before it"""
+
+STREAM_WINDOW_CELLS = 1 << 20
+"""Number of ``bin x process`` cells per window of :py:class:`StreamingResampler` if not given"""
+
+_LOG_HANDLER = logging.getLogger()
+
+
+class LongTable(NamedTuple):
+    """
+    Samples of all processes, not sorted.
+    """
+    pids: np.ndarray
+    times: np.ndarray
+    values: Dict[str, np.ndarray]
+
+
+class ResampledTable(NamedTuple):
+    """
+    Resampled metric, with ``values[column][i, j]`` for bin ``time_index[i]`` of process ``pids[j]``.
+    Bins without samples are NaN.
+    """
+    time_index: np.ndarray
+    pids: np.ndarray
+    values: Dict[str, np.ndarray]
+
+    def get_process_frame(self, j: int) -> pd.DataFrame:
+        """
+        Resampled metric of process ``pids[j]``, with ``TIME`` in seconds as the last column.
+        """
+        df = pd.DataFrame({name: values[:, j] for name, values in self.values.items()})
+        df["TIME"] = self.time_index
+        return df
+
+
+def load_long_format(manifest: Dict[str, Any], table_name: str, columns: List[str]) -> LongTable:
+    """
+    Load ``TIME`` and ``columns`` of per-process table ``table_name`` of all processes of a session.
+
+    Shared tables of the session layout are read once, with their ``PID`` column.
+    """
+    pids = []
+    times = []
+    values = {name: [] for name in columns}
+    read_shared_filenames = set()
+    for table in iter_manifest_tables(manifest, table_name=table_name, kind=TABLE_KIND_PROCESS):
+        if table["n_rows"] == 0:
+            continue
+        if table["shared"]:
+            if table["filename"] in read_shared_filenames:
+                continue
+            read_shared_filenames.add(table["filename"])
+        df = read_manifest_table(table, ["TIME", *columns])
+        if table["shared"]:
+            pids.append(df["PID"].to_numpy(dtype="int64"))
+        else:
+            pids.append(np.full(df.shape[0], table["pid"], dtype="int64"))
+        times.append(df["TIME"].to_numpy(dtype="float64"))
+        for name in columns:
+            values[name].append(df[name].to_numpy(dtype="float64"))
+    if not pids:
+        return LongTable(
+            np.empty(0, dtype="int64"),
+            np.empty(0, dtype="float64"),
+            {name: np.empty(0, dtype="float64") for name in columns}
+        )
+    return LongTable(
+        np.concatenate(pids),
+        np.concatenate(times),
+        {name: np.concatenate(arrays) for name, arrays in values.items()}
+    )
+
+
+def _fill_gaps(matrix: np.ndarray, has_sample: np.ndarray) -> np.ndarray:
+    """
+    Forward-fill empty bins of each column between its first and last bin with samples.
+    """
+    n_bins = matrix.shape[0]
+    bin_ids = np.arange(n_bins)[:, np.newaxis]
+    last_bin_with_sample = np.maximum.accumulate(np.where(has_sample, bin_ids, -1), axis=0)
+    # Bins from the first to the last sample of each column
+    is_alive = (
+            (last_bin_with_sample >= 0)
+            & np.flip(np.maximum.accumulate(np.flip(has_sample, axis=0), axis=0), axis=0)
+    )
+    filled = np.take_along_axis(matrix, np.maximum(last_bin_with_sample, 0), axis=0)
+    return np.where(is_alive, filled, np.nan)
+
+
+def _aggregate_bins(
+        pid_columns: np.ndarray,
+        n_pids: int,
+        times: np.ndarray,
+        values: Dict[str, np.ndarray],
+        time_start: float,
+        interval: float,
+        n_bins: int,
+        aggregation: str
+) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Aggregate samples of process ``pid_columns`` into ``n_bins x n_pids`` matrices, without filling gaps.
+    Samples out of the bins are ignored.
+
+    :return: Matrices by column, and which bins have samples.
+    """
+    edges = time_start + interval * np.arange(n_bins + 1)
+    bins = np.searchsorted(edges, times + _BIN_TOLERANCE * interval, side="right") - 1
+    in_range = (bins >= 0) & (bins < n_bins)
+    flat = bins[in_range] * n_pids + pid_columns[in_range]
+    times = times[in_range]
+    n_cells = n_bins * n_pids
+    has_sample = np.zeros(n_cells, dtype=bool)
+    has_sample[flat] = True
+
+    if aggregation == "last":
+        order = np.lexsort((times, flat))
+        sorted_flat = flat[order]
+        is_last = np.ones(len(sorted_flat), dtype=bool)
+        is_last[:-1] = sorted_flat[1:] != sorted_flat[:-1]
+        last_order = order[is_last]
+        last_flat = sorted_flat[is_last]
+
+    aggregated_values = {}
+    for name, column_values in values.items():
+        column_values = column_values[in_range]
+        if aggregation == "last":
+            aggregated = np.full(n_cells, np.nan)
+            aggregated[last_flat] = column_values[last_order]
+        elif aggregation == "mean":
+            is_valid = ~np.isnan(column_values)
+            sums = np.bincount(flat[is_valid], weights=column_values[is_valid], minlength=n_cells)
+            counts = np.bincount(flat[is_valid], minlength=n_cells)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                aggregated = np.where(counts > 0, sums / counts, np.nan)
+        else:
+            aggregated = np.full(n_cells, np.nan)
+            np.fmax.at(aggregated, flat, column_values)
+        aggregated_values[name] = aggregated.reshape(n_bins, n_pids)
+    return aggregated_values, has_sample.reshape(n_bins, n_pids)
+
+
+def resample_long_format(
+        long_table: LongTable,
+        time_start: float,
+        interval: float,
+        n_bins: int,
+        aggregation: str = "last",
+        fill_gaps: bool = True
+) -> ResampledTable:
+    """
+    Aggregate samples into ``n_bins`` bins of ``interval`` seconds from ``time_start``.
+
+    :param aggregation: How samples in one bin are aggregated, one of :py:data:`AGGREGATIONS`.
+    :param fill_gaps: Whether empty bins within the lifetime of a process take the value of the previous bin.
+    :raises ValueError: On unknown aggregation.
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation {aggregation}, should be one of {AGGREGATIONS}")
+    pids, pid_columns = np.unique(long_table.pids, return_inverse=True)
+    aggregated_values, has_sample = _aggregate_bins(
+        pid_columns, len(pids), long_table.times, long_table.values, time_start, interval, n_bins, aggregation
+    )
+    if fill_gaps:
+        aggregated_values = {
+            name: _fill_gaps(aggregated, has_sample)
+            for name, aggregated in aggregated_values.items()
+        }
+    return ResampledTable(time_start + interval * np.arange(n_bins), pids, aggregated_values)
+
+
+class _StreamInput:
+    """
+    A table read in chunks, with rows read but not yet resampled.
+    """
+    table: Dict[str, Any]
+    chunks: Iterator[pd.DataFrame]
+    pids: np.ndarray
+    times: np.ndarray
+    values: Dict[str, np.ndarray]
+    is_exhausted: bool
+
+    def __init__(self, table: Dict[str, Any], columns: List[str], chunk_rows: int):
+        self.table = table
+        self.chunks = iter_manifest_table_chunks(table, ["TIME", *columns], chunk_rows)
+        self.pids = np.empty(0, dtype="int64")
+        self.times = np.empty(0, dtype="float64")
+        self.values = {name: np.empty(0, dtype="float64") for name in columns}
+        self.is_exhausted = False
+
+    def _read_chunk(self) -> bool:
+        try:
+            df = next(self.chunks)
+        except StopIteration:
+            self.is_exhausted = True
+            return False
+        if self.table["shared"]:
+            pids = df["PID"].to_numpy(dtype="int64")
+        else:
+            pids = np.full(df.shape[0], self.table["pid"], dtype="int64")
+        self.pids = np.concatenate((self.pids, pids))
+        self.times = np.concatenate((self.times, df["TIME"].to_numpy(dtype="float64")))
+        for name in self.values:
+            self.values[name] = np.concatenate((self.values[name], df[name].to_numpy(dtype="float64")))
+        return True
+
+    def take_before(self, time_limit: float) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Take rows before ``time_limit``, reading until a row after it, as tables are written in time order.
+        """
+        while not self.is_exhausted and (len(self.times) == 0 or self.times.max() < time_limit):
+            self._read_chunk()
+        is_taken = self.times < time_limit
+        taken = self.pids[is_taken], self.times[is_taken], {
+            name: values[is_taken] for name, values in self.values.items()
+        }
+        self.pids = self.pids[~is_taken]
+        self.times = self.times[~is_taken]
+        self.values = {name: values[~is_taken] for name, values in self.values.items()}
+        return taken
+
+
+class StreamingResampler:
+    """
+    Resample per-process table ``table_name`` of all processes like :py:func:`resample_long_format`,
+    yielding windows of ``window_bins`` bins, so memory is bounded by window and chunk sizes times number of processes.
+
+    The lifetime of a process, within which gaps are filled, ends with its last sample.
+    It is taken from the session manifest, or found by reading ``TIME`` of tables without index beforehand.
+    Rows are expected in time order within each table;
+    rows older than the window being resampled when read are dropped.
+    """
+
+    table_name: str
+    columns: List[str]
+    time_start: float
+    interval: float
+    n_bins: int
+    aggregation: str
+    window_bins: int
+    chunk_rows: int
+    pids: np.ndarray
+
+    _tables: List[Dict[str, Any]]
+    _last_bins: np.ndarray
+    _last_values: Dict[str, np.ndarray]
+    _is_started: np.ndarray
+
+    def __init__(
+            self,
+            manifest: Dict[str, Any],
+            table_name: str,
+            columns: List[str],
+            time_start: float,
+            interval: float,
+            n_bins: int,
+            aggregation: str = "last",
+            window_bins: int = 0,
+            chunk_rows: int = DEFAULT_CHUNK_ROWS
+    ):
+        """
+        :param window_bins: Number of bins per window, ``0`` for :py:data:`STREAM_WINDOW_CELLS` cells per window.
+        :raises ValueError: On unknown aggregation.
+        """
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {aggregation}, should be one of {AGGREGATIONS}")
+        self.table_name = table_name
+        self.columns = columns
+        self.time_start = time_start
+        self.interval = interval
+        self.n_bins = n_bins
+        self.aggregation = aggregation
+        self.chunk_rows = chunk_rows
+        self._tables = []
+        read_shared_filenames = set()
+        for table in iter_manifest_tables(manifest, table_name=table_name, kind=TABLE_KIND_PROCESS):
+            if table["n_rows"] == 0:
+                continue
+            if table["shared"]:
+                if table["filename"] in read_shared_filenames:
+                    continue
+                read_shared_filenames.add(table["filename"])
+            self._tables.append(table)
+        last_times = self._get_last_times()
+        self.pids = np.array(sorted(last_times), dtype="int64")
+        self._last_bins = np.floor(
+            (np.array([last_times[pid] for pid in self.pids], dtype="float64") - time_start) / interval
+            + _BIN_TOLERANCE
+        )
+        self.window_bins = window_bins if window_bins > 0 else max(1, STREAM_WINDOW_CELLS // max(1, len(self.pids)))
+        self._last_values = {name: np.full(len(self.pids), np.nan) for name in columns}
+        self._is_started = np.zeros(len(self.pids), dtype=bool)
+
+    def _get_last_times(self) -> Dict[int, float]:
+        """
+        Time of last sample of each process.
+        """
+        last_times: Dict[int, float] = {}
+        for table in self._tables:
+            if not table["shared"] and table["max_time"] is not None:
+                last_times[table["pid"]] = max(last_times.get(table["pid"], -np.inf), table["max_time"])
+                continue
+            for df in iter_manifest_table_chunks(table, ["TIME"], self.chunk_rows):
+                if df.shape[0] == 0:
+                    continue
+                if table["shared"]:
+                    chunk_last_times = df.groupby("PID")["TIME"].max()
+                else:
+                    chunk_last_times = pd.Series([df["TIME"].max()], index=[table["pid"]])
+                for pid, last_time in chunk_last_times.items():
+                    last_times[pid] = max(last_times.get(pid, -np.inf), last_time)
+        return last_times
+
+    def _fill_window(
+            self,
+            aggregated_values: Dict[str, np.ndarray],
+            has_sample: np.ndarray,
+            first_bin: int
+    ) -> Dict[str, np.ndarray]:
+        """
+        Forward-fill a window from the last values of the previous window, within lifetimes of processes.
+        """
+        n_window_bins = has_sample.shape[0]
+        has_sample = np.vstack((self._is_started, has_sample))
+        last_bin_with_sample = np.maximum.accumulate(
+            np.where(has_sample, np.arange(n_window_bins + 1)[:, np.newaxis], -1),
+            axis=0
+        )
+        is_alive = (
+                (last_bin_with_sample[1:] >= 0)
+                & (first_bin + np.arange(n_window_bins)[:, np.newaxis] <= self._last_bins)
+        )
+        filled_values = {}
+        for name, aggregated in aggregated_values.items():
+            filled = np.take_along_axis(
+                np.vstack((self._last_values[name], aggregated)),
+                np.maximum(last_bin_with_sample, 0),
+                axis=0
+            )
+            self._last_values[name] = filled[-1]
+            filled_values[name] = np.where(is_alive, filled[1:], np.nan)
+        self._is_started = last_bin_with_sample[-1] >= 0
+        return filled_values
+
+    def __iter__(self) -> Iterator[ResampledTable]:
+        inputs = [_StreamInput(table, self.columns, self.chunk_rows) for table in self._tables]
+        n_pids = len(self.pids)
+        for first_bin in range(0, self.n_bins, self.window_bins):
+            n_window_bins = min(self.window_bins, self.n_bins - first_bin)
+            window_start = self.time_start + first_bin * self.interval
+            time_limit = window_start + (n_window_bins - _BIN_TOLERANCE) * self.interval
+            taken = [stream_input.take_before(time_limit) for stream_input in inputs]
+            times = np.concatenate([times for _, times, _ in taken]) if taken else np.empty(0)
+            values = {
+                name: np.concatenate([values[name] for _, _, values in taken]) if taken else np.empty(0)
+                for name in self.columns
+            }
+            pid_columns = np.searchsorted(
+                self.pids,
+                np.concatenate([pids for pids, _, _ in taken]) if taken else np.empty(0, dtype="int64")
+            )
+            if first_bin > 0:
+                n_late = np.count_nonzero(times < window_start - _BIN_TOLERANCE * self.interval)
+                if n_late > 0:
+                    _LOG_HANDLER.warning(f"{self.table_name}: {n_late} rows out of time order dropped")
+            aggregated_values, has_sample = _aggregate_bins(
+                pid_columns, n_pids, times, values, window_start, self.interval, n_window_bins, self.aggregation
+            )
+            yield ResampledTable(
+                window_start + self.interval * np.arange(n_window_bins),
+                self.pids,
+                self._fill_window(aggregated_values, has_sample, first_bin)
+            )
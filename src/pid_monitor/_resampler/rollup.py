@@ -0,0 +1,325 @@
+"""
+rollup -- Precompute multi-resolution summaries of per-process metrics
+
+Dashboards and reports showing hours of a session do not need samples taken every 10 ms,
+but scanning them again for each figure is what takes most of their time.
+
+:py:func:`rollup_session` aligns samples of all processes onto a fine grid of ``resolution`` seconds
+with :py:class:`engine.StreamingResampler`, then summarizes bins of each tier (by default 1 s, 10 s and 60 s)
+with the number of fine bins with samples and the minimum, mean, maximum and last value of each column.
+Only the first tier is computed from the fine grid; each following tier is computed from the previous one.
+
+This is done for each process, and for each process tree, whose value on the fine grid is the sum over the process
+and all its descendants alive. Tiers are written in long format, one row per bin and process (or root of tree)
+with samples, to ``{basename}.{table}.rollup.{scope}.{tier}s.parquet``, where ``scope`` is ``pid`` or ``tree``::
+
+    TIME, PID, COUNT, VIRT_MIN, VIRT_MEAN, VIRT_MAX, VIRT_LAST, ...
+
+``TIME`` is the start of the bin. Bins are aligned to multiples of the largest tier since the epoch,
+so tiers of different sessions line up.
+"""
+
+import logging
+import math
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import tqdm
+
+from pid_monitor._dt_mvc.appender.session_manifest import find_session_manifest, load_session_manifest, \
+    iter_manifest_tables, MANIFEST_SUFFIX, TABLE_KIND_PROCESS
+from pid_monitor._resampler import engine, get_manifest_time_range
+
+DEFAULT_ROLLUP_RESOLUTION = 0.01
+
+DEFAULT_ROLLUP_TIERS = (1.0, 10.0, 60.0)
+
+ROLLUP_TABLES = {
+    "mem": ["VIRT", "RESIDENT"],
+    "cpu": ["CPU_PERCENT"],
+    "nfd": ["N_FD"]
+}
+"""Per-process tables rolled up, with their columns"""
+
+ROLLUP_STATS = ("MIN", "MEAN", "MAX", "LAST")
+
+ROLLUP_SCOPES = ("pid", "tree")
+
+_LOG_HANDLER = logging.getLogger()
+
+
+def get_rollup_filename(session_basename: str, table_name: str, scope: str, tier: float) -> str:
+    return f"{session_basename}.{table_name}.rollup.{scope}.{tier:g}s.parquet"
+
+
+def read_rollup(
+        output_basename: str,
+        table_name: str,
+        tier: float,
+        scope: str = "pid",
+        columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Read a tier written by :py:func:`rollup_session`.
+
+    :raises FileNotFoundError: If the session or the tier is not found.
+    """
+    manifest_filename = find_session_manifest(output_basename)
+    if manifest_filename is None:
+        raise FileNotFoundError(f"No session manifest found at {output_basename}")
+    session_basename = manifest_filename[:-len(MANIFEST_SUFFIX) - 1]
+    return pd.read_parquet(get_rollup_filename(session_basename, table_name, scope, tier), columns=columns)
+
+
+class _Stats(NamedTuple):
+    """
+    Summary of bins, each a ``bin x process`` matrix.
+    """
+    count: np.ndarray
+    min: np.ndarray
+    mean: np.ndarray
+    max: np.ndarray
+    last: np.ndarray
+
+
+def _stats_from_values(values: np.ndarray) -> _Stats:
+    """
+    Summary of bins of the fine grid, each holding at most one value.
+    """
+    return _Stats((~np.isnan(values)).astype("int64"), values, values, values, values)
+
+
+def _coarsen(stats: _Stats, factor: int) -> _Stats:
+    """
+    Summarize each ``factor`` consecutive bins into one.
+    """
+    n_bins, n_columns = stats.count.shape
+
+    def _group(matrix: np.ndarray) -> np.ndarray:
+        return matrix.reshape(n_bins // factor, factor, n_columns)
+
+    count = _group(stats.count).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, np.nansum(_group(stats.mean) * _group(stats.count), axis=1) / count, np.nan)
+    grouped_last = _group(stats.last)
+    has_last = ~np.isnan(grouped_last)
+    last_index = factor - 1 - np.argmax(np.flip(has_last, axis=1), axis=1)
+    last = np.take_along_axis(grouped_last, last_index[:, np.newaxis, :], axis=1)[:, 0, :]
+    return _Stats(
+        count,
+        np.fmin.reduce(_group(stats.min), axis=1),
+        mean,
+        np.fmax.reduce(_group(stats.max), axis=1),
+        np.where(has_last.any(axis=1), last, np.nan)
+    )
+
+
+def _find_ancestor_column(pid: int, ppids: Dict[int, Optional[int]], columns: Dict[int, int]) -> int:
+    """
+    Column of the nearest ancestor of ``pid`` with a column, ``-1`` if none.
+    """
+    visited = {pid}
+    ancestor = ppids.get(pid)
+    while ancestor is not None and ancestor not in visited:
+        if ancestor in columns:
+            return columns[ancestor]
+        visited.add(ancestor)
+        ancestor = ppids.get(ancestor)
+    return -1
+
+
+class _ProcessTree:
+    """
+    Sum values of processes over their subtrees, level by level from the deepest.
+
+    The tree is built from all processes of the session manifest, not only those with samples,
+    and each process is linked to its nearest ancestor with samples,
+    so descendants of processes without samples (e.g., a short-lived shell) are still summed into their tree.
+    """
+    parent_columns: np.ndarray
+    depths: np.ndarray
+
+    def __init__(self, pids: np.ndarray, processes: Dict[str, Dict[str, Any]]):
+        ppids = {int(pid): process["ppid"] for pid, process in processes.items()}
+        columns = {pid: j for j, pid in enumerate(pids.tolist())}
+        self.parent_columns = np.array(
+            [_find_ancestor_column(pid, ppids, columns) for pid in pids.tolist()],
+            dtype="int64"
+        )
+        self.depths = np.zeros(len(pids), dtype="int64")
+        for j in range(len(pids)):
+            depth = 0
+            k = self.parent_columns[j]
+            while k >= 0 and depth < len(pids):
+                depth += 1
+                k = self.parent_columns[k]
+            if depth == len(pids):
+                # Cycle caused by reused PIDs
+                self.parent_columns[j] = -1
+                depth = 0
+            self.depths[j] = depth
+
+    def sum_subtrees(self, values: np.ndarray) -> np.ndarray:
+        """
+        Sum over subtrees of a ``bin x process`` matrix, with NaN for trees without processes alive.
+        """
+        sums = np.nan_to_num(values, nan=0.0)
+        n_alive = (~np.isnan(values)).astype("int64")
+        for depth in range(int(self.depths.max(initial=0)), 0, -1):
+            children = np.nonzero((self.depths == depth) & (self.parent_columns >= 0))[0]
+            parents = self.parent_columns[children]
+            np.add.at(sums, (slice(None), parents), sums[:, children])
+            np.add.at(n_alive, (slice(None), parents), n_alive[:, children])
+        return np.where(n_alive > 0, sums, np.nan)
+
+
+def _check_tiers(resolution: float, tiers: Iterable[float]) -> List[int]:
+    """
+    :return: Factor between each tier and the previous one, or the fine grid.
+    :raises ValueError: If a tier is not a multiple of the previous one.
+    """
+    factors = []
+    previous_interval = resolution
+    for tier in tiers:
+        factor = tier / previous_interval
+        if factor < 1 or not math.isclose(factor, round(factor), rel_tol=0, abs_tol=1E-6):
+            raise ValueError(f"Tier {tier:g}s should be a multiple of {previous_interval:g}s")
+        factors.append(round(factor))
+        previous_interval = tier
+    if not factors:
+        raise ValueError("No tier given")
+    return factors
+
+
+def _rollup_schema(columns: List[str]) -> pa.Schema:
+    return pa.schema([
+        ("TIME", pa.float64()),
+        ("PID", pa.int64()),
+        ("COUNT", pa.int64()),
+        *((f"{name}_{stat}", pa.float64()) for name in columns for stat in ROLLUP_STATS)
+    ])
+
+
+def _write_tier(
+        writer: pq.ParquetWriter,
+        schema: pa.Schema,
+        time_index: np.ndarray,
+        pids: np.ndarray,
+        stats: Dict[str, _Stats]
+):
+    first_stats = next(iter(stats.values()))
+    has_samples = first_stats.count > 0
+    bin_ids, pid_columns = np.nonzero(has_samples)
+    data = {
+        "TIME": time_index[bin_ids],
+        "PID": pids[pid_columns],
+        "COUNT": first_stats.count[has_samples]
+    }
+    for name, column_stats in stats.items():
+        for stat, matrix in zip(ROLLUP_STATS, column_stats[1:]):
+            data[f"{name}_{stat}"] = matrix[has_samples]
+    writer.write_table(pa.table(data, schema=schema))
+
+
+def rollup_table(
+        manifest: Dict[str, Any],
+        session_basename: str,
+        table_name: str,
+        columns: List[str],
+        resolution: float = DEFAULT_ROLLUP_RESOLUTION,
+        tiers: Iterable[float] = DEFAULT_ROLLUP_TIERS
+) -> int:
+    """
+    Roll up per-process table ``table_name`` of a session, see :py:mod:`rollup`.
+
+    :return: Number of processes rolled up, ``0`` if the table is not found.
+    :raises ValueError: If tiers are not multiples of each other and of ``resolution``.
+    """
+    tiers = list(tiers)
+    factors = _check_tiers(resolution, tiers)
+    tables = [
+        table
+        for table in iter_manifest_tables(manifest, table_name=table_name, kind=TABLE_KIND_PROCESS)
+        if table["n_rows"] != 0
+    ]
+    if not tables:
+        return 0
+    time_start, time_end = get_manifest_time_range(manifest, tables)
+    largest_tier = tiers[-1]
+    time_start = math.floor(time_start / largest_tier) * largest_tier
+    n_largest_tier_bins = math.floor((time_end - time_start) / largest_tier) + 1
+    fine_bins_per_largest_tier = math.prod(factors)
+    streaming_resampler = engine.StreamingResampler(
+        manifest,
+        table_name,
+        columns,
+        time_start=time_start,
+        interval=resolution,
+        n_bins=n_largest_tier_bins * fine_bins_per_largest_tier
+    )
+    n_pids = len(streaming_resampler.pids)
+    # Windows should hold whole bins of the largest tier
+    streaming_resampler.window_bins = fine_bins_per_largest_tier * max(
+        1, engine.STREAM_WINDOW_CELLS // max(1, n_pids * fine_bins_per_largest_tier)
+    )
+    process_tree = _ProcessTree(streaming_resampler.pids, manifest["processes"])
+    schema = _rollup_schema(columns)
+    writers = {
+        (scope, tier): pq.ParquetWriter(get_rollup_filename(session_basename, table_name, scope, tier), schema)
+        for scope in ROLLUP_SCOPES
+        for tier in tiers
+    }
+    try:
+        for resampled_table in tqdm.tqdm(streaming_resampler, desc=f"Rolling up {table_name}..."):
+            scope_stats = {
+                "pid": {
+                    name: _stats_from_values(values)
+                    for name, values in resampled_table.values.items()
+                },
+                "tree": {
+                    name: _stats_from_values(process_tree.sum_subtrees(values))
+                    for name, values in resampled_table.values.items()
+                }
+            }
+            fine_bins_per_tier = 1
+            for tier, factor in zip(tiers, factors):
+                fine_bins_per_tier *= factor
+                time_index = resampled_table.time_index[::fine_bins_per_tier]
+                for scope in ROLLUP_SCOPES:
+                    scope_stats[scope] = {
+                        name: _coarsen(stats, factor)
+                        for name, stats in scope_stats[scope].items()
+                    }
+                    _write_tier(writers[(scope, tier)], schema, time_index, resampled_table.pids, scope_stats[scope])
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return n_pids
+
+
+def rollup_session(
+        output_basename: str,
+        resolution: float = DEFAULT_ROLLUP_RESOLUTION,
+        tiers: Iterable[float] = DEFAULT_ROLLUP_TIERS,
+        rollup_tables: Optional[Dict[str, List[str]]] = None
+):
+    """
+    Roll up tables of :py:data:`ROLLUP_TABLES` of a session, see :py:mod:`rollup`.
+
+    :raises ValueError: If the session has no manifest, or on invalid tiers.
+    """
+    manifest_filename = find_session_manifest(output_basename)
+    if manifest_filename is None:
+        raise ValueError(f"Rolling up needs a session manifest, none found at {output_basename}")
+    session_basename = manifest_filename[:-len(MANIFEST_SUFFIX) - 1]
+    manifest = load_session_manifest(manifest_filename)
+    tiers = list(tiers)
+    for table_name, columns in (rollup_tables or ROLLUP_TABLES).items():
+        n_pids = rollup_table(manifest, session_basename, table_name, columns, resolution, tiers)
+        if n_pids == 0:
+            _LOG_HANDLER.warning(f"{table_name}: No table found in {manifest_filename}")
+        else:
+            _LOG_HANDLER.info(f"{table_name}: Rolled up {n_pids} processes into {len(tiers)} tiers")
@@ -0,0 +1,59 @@
+import pytest
+
+from pid_monitor._dt_mvc.appender.typing import ColumnBuffer, INT64, FLOAT64, CATEGORY, STRING
+
+_HEADER = ["TIME", "PID", "STATE", "NAME"]
+_COLUMN_TYPES = [FLOAT64, INT64, CATEGORY, STRING]
+
+
+def _assert_columns(buff: ColumnBuffer, expected: dict):
+    columns = buff.to_dict()
+    assert len(buff) == len(next(iter(expected.values())))
+    for name, values in expected.items():
+        assert list(columns[name]) == values
+
+
+def test_append():
+    buff = ColumnBuffer(_HEADER, _COLUMN_TYPES)
+    buff.append([1.0, 10, "R", "bash"])
+    buff.append([2.0, 11, "S", "sleep"])
+    buff.append([3.0, 10, "R", "bash"])
+    _assert_columns(buff, {
+        "TIME": [1.0, 2.0, 3.0],
+        "PID": [10, 11, 10],
+        "STATE": ["R", "S", "R"],
+        "NAME": ["bash", "sleep", "bash"]
+    })
+    assert buff.get_categories(2) == ["R", "S"]
+
+
+@pytest.mark.parametrize("row", [[1.0, 10, "R"], [1.0, 10, "R", "bash", "extra"]])
+def test_append_wrong_length(row):
+    buff = ColumnBuffer(_HEADER, _COLUMN_TYPES)
+    buff.append([0.0, 1, "R", "init"])
+    with pytest.raises(ValueError):
+        buff.append(row)
+    _assert_columns(buff, {"TIME": [0.0], "PID": [1], "STATE": ["R"], "NAME": ["init"]})
+
+
+def test_append_bad_value_rolls_back():
+    buff = ColumnBuffer(_HEADER, _COLUMN_TYPES)
+    buff.append([0.0, 1, "R", "init"])
+    # Fails on the second column, after the first one is appended
+    with pytest.raises(TypeError):
+        buff.append([1.0, "not an int", "R", "bash"])
+    _assert_columns(buff, {"TIME": [0.0], "PID": [1], "STATE": ["R"], "NAME": ["init"]})
+    buff.append([2.0, 2, "S", "sleep"])
+    _assert_columns(buff, {"TIME": [0.0, 2.0], "PID": [1, 2], "STATE": ["R", "S"], "NAME": ["init", "sleep"]})
+
+
+def test_append_bad_value_removes_new_category():
+    buff = ColumnBuffer(["STATE", "PID"], [CATEGORY, INT64])
+    buff.append(["R", 1])
+    with pytest.raises(TypeError):
+        buff.append(["Z", None])
+    assert buff.get_categories(0) == ["R"]
+    with pytest.raises(TypeError):
+        buff.append(["R", None])
+    assert buff.get_categories(0) == ["R"]
+    _assert_columns(buff, {"STATE": ["R"], "PID": [1]})
@@ -0,0 +1,30 @@
+import os
+
+import pandas as pd
+
+from pid_monitor._dt_mvc.appender.hdf5_appender import HDF5TableAppender, MIN_STRING_ITEMSIZE
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, FLOAT64, STRING, CATEGORY
+
+
+def test_long_string_after_short_one(tmp_path):
+    appender = HDF5TableAppender(
+        os.path.join(tmp_path, "test"),
+        ["TIME", "CMD", "STATE"],
+        TableAppenderConfig(buffer_size=1),
+        [FLOAT64, STRING, CATEGORY]
+    )
+    long_cmd = "x" * 1500
+    # Multibyte characters are not cut in the middle
+    long_unicode_cmd = "é" * 1000
+    appender.append([0.0, "sh", "R"])
+    appender.append([1.0, long_cmd, "S" * 1500])
+    appender.append([2.0, long_unicode_cmd, "R"])
+    appender.append([3.0, None, "R"])
+    appender.close()
+
+    df = pd.read_hdf(os.path.join(tmp_path, "test.hdf5")).reset_index(drop=True)
+    assert list(df["TIME"]) == [0.0, 1.0, 2.0, 3.0]
+    assert df["CMD"][0] == "sh"
+    assert df["CMD"][1] == long_cmd[:MIN_STRING_ITEMSIZE]
+    assert df["CMD"][2] == long_unicode_cmd[:MIN_STRING_ITEMSIZE // 2]
+    assert df["STATE"][1] == "S" * MIN_STRING_ITEMSIZE
@@ -0,0 +1,36 @@
+from pid_monitor._dt_mvc.std_dispatcher.proc_connector import parse_proc_events, NLMSG_DONE, \
+    PROC_EVENT_FORK, PROC_EVENT_EXEC, PROC_EVENT_EXIT, _NLMSGHDR, _CN_MSG, _PROC_EVENT_HEADER, _FORK_EVENT, \
+    _EXEC_OR_EXIT_EVENT
+
+
+def _message(what: int, body: bytes, nlmsg_type: int = NLMSG_DONE, padding: int = 0) -> bytes:
+    event = _PROC_EVENT_HEADER.pack(what, 0, 0) + body
+    cn_msg = _CN_MSG.pack(1, 1, 0, 0, len(event), 0) + event
+    nlmsg_len = _NLMSGHDR.size + len(cn_msg) + padding
+    return _NLMSGHDR.pack(nlmsg_len, nlmsg_type, 0, 0, 0) + cn_msg + bytes(padding + (-nlmsg_len % 4))
+
+
+def test_parse_proc_events():
+    data = b"".join((
+        _message(PROC_EVENT_FORK, _FORK_EVENT.pack(10, 10, 11, 11), padding=2),
+        # Thread created by process 11
+        _message(PROC_EVENT_FORK, _FORK_EVENT.pack(11, 11, 12, 11)),
+        _message(PROC_EVENT_EXEC, _EXEC_OR_EXIT_EVENT.pack(11, 11)),
+        # Unknown event
+        _message(0x00000040, _EXEC_OR_EXIT_EVENT.pack(11, 11)),
+        # Thread exit
+        _message(PROC_EVENT_EXIT, _EXEC_OR_EXIT_EVENT.pack(12, 11)),
+        _message(PROC_EVENT_EXIT, _EXEC_OR_EXIT_EVENT.pack(11, 11))
+    ))
+    assert list(parse_proc_events(data)) == [
+        (PROC_EVENT_FORK, 11, 10),
+        (PROC_EVENT_EXEC, 11, 0),
+        (PROC_EVENT_EXIT, 11, 0)
+    ]
+
+
+def test_parse_truncated_proc_events():
+    data = _message(PROC_EVENT_EXEC, _EXEC_OR_EXIT_EVENT.pack(11, 11))
+    assert list(parse_proc_events(data[:_NLMSGHDR.size - 1])) == []
+    # Messages shorter than their header are not followed
+    assert list(parse_proc_events(_NLMSGHDR.pack(0, NLMSG_DONE, 0, 0, 0) + data)) == []
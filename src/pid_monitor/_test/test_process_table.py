@@ -0,0 +1,21 @@
+import os
+
+from pid_monitor._dt_mvc.process_table import ProcessTable, read_ppid
+
+
+def test_children_index():
+    process_table = ProcessTable({1: 0, 2: 1, 3: 1, 4: 3})
+    assert len(process_table) == 4
+    assert 3 in process_table
+    assert 5 not in process_table
+    assert sorted(process_table.get_children(1)) == [2, 3]
+    assert process_table.get_children(4) == []
+    assert process_table.count_children(3) == 1
+
+
+def test_from_procfs():
+    process_table = ProcessTable.from_procfs()
+    assert process_table.ppid_map[os.getpid()] == os.getppid()
+    assert os.getpid() in process_table.get_children(os.getppid())
+    assert read_ppid(os.getpid()) == os.getppid()
+    assert read_ppid(-1) is None
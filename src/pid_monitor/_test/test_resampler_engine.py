@@ -0,0 +1,205 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pid_monitor._dt_mvc.appender.arrow_appender import ArrowTableAppender
+from pid_monitor._dt_mvc.appender import create_table_appender
+from pid_monitor._dt_mvc.appender.session_manifest import SessionManifest, load_session_manifest, \
+    TABLE_KIND_PROCESS
+from pid_monitor._dt_mvc.appender.session_store import SessionStore
+from pid_monitor._dt_mvc.appender.table_reader import read_manifest_table
+from pid_monitor._dt_mvc.appender.tsv_appender import TSVTableAppender
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, FLOAT64, INT64
+from pid_monitor._resampler import BaseResampler, ResamplerConfig, resample_table, stream_resample_table, \
+    total_process, TOTAL_PROCESS_TABLES
+from pid_monitor._resampler import engine
+from pid_monitor._resampler.engine import LongTable, StreamingResampler, load_long_format, resample_long_format
+
+
+def _long_table(pids, times, values) -> LongTable:
+    return LongTable(
+        np.array(pids, dtype="int64"),
+        np.array(times, dtype="float64"),
+        {"VALUE": np.array(values, dtype="float64")}
+    )
+
+
+def test_binning():
+    # Bin i holds [i, i + 1); samples a little before the grid belong to the next bin
+    long_table = _long_table([1, 1, 1, 1], [0.0, 0.5, 1.9999999, 3.0], [1, 2, 3, 4])
+    resampled = resample_long_format(long_table, time_start=0, interval=1, n_bins=3, fill_gaps=False)
+    assert list(resampled.time_index) == [0, 1, 2]
+    assert list(resampled.pids) == [1]
+    np.testing.assert_array_equal(resampled.values["VALUE"][:, 0], [2, np.nan, 3])
+
+
+@pytest.mark.parametrize("aggregation, expected", [("last", [3, 5]), ("mean", [2, 4.5]), ("max", [3, 5])])
+def test_aggregations(aggregation, expected):
+    # Samples are not sorted
+    long_table = _long_table([7, 7, 7, 7, 7], [0.6, 0.1, 0.2, 1.5, 1.6], [3, 2, 1, 4, 5])
+    resampled = resample_long_format(long_table, 0, 1, 2, aggregation=aggregation)
+    np.testing.assert_array_equal(resampled.values["VALUE"][:, 0], expected)
+
+
+def test_unknown_aggregation():
+    with pytest.raises(ValueError):
+        resample_long_format(_long_table([], [], []), 0, 1, 2, aggregation="median")
+
+
+def test_fill_gaps():
+    long_table = _long_table([1, 1, 2, 2], [1, 4, 0, 2], [10, 40, 1, 3])
+    resampled = resample_long_format(long_table, 0, 1, 6)
+    assert list(resampled.pids) == [1, 2]
+    # Forward-filled within the lifetime of each process only
+    np.testing.assert_array_equal(resampled.values["VALUE"][:, 0], [np.nan, 10, 10, 10, 40, np.nan])
+    np.testing.assert_array_equal(resampled.values["VALUE"][:, 1], [1, 1, 3, np.nan, np.nan, np.nan])
+
+
+def _write_session(output_basename: str, appender_class, samples: pd.DataFrame):
+    session_manifest = SessionManifest(output_basename, toplevel_pid=1, table_appender_type=appender_class.__name__)
+    for pid, df in samples.groupby("PID"):
+        appender = appender_class(
+            f"{output_basename}.{pid}.mem",
+            ["TIME", "VALUE"],
+            TableAppenderConfig(buffer_size=16),
+            [FLOAT64, INT64]
+        )
+        session_manifest.add_table(appender, table_name="mem", kind=TABLE_KIND_PROCESS, pid=pid)
+        for time, value in zip(df["TIME"], df["VALUE"]):
+            appender.append([time, value])
+        appender.close()
+    session_manifest.write(is_final=True)
+    return load_session_manifest(output_basename)
+
+
+@pytest.mark.parametrize("appender_class", [TSVTableAppender, ArrowTableAppender])
+def test_streaming_matches_in_memory(tmp_path, appender_class):
+    rng = np.random.default_rng(0)
+    n_samples = 300
+    samples = pd.DataFrame({
+        "PID": rng.integers(1, 6, n_samples),
+        # Exact in decimal, so that TSV tables read back the same times
+        "TIME": np.sort(rng.integers(0, 160, n_samples)) / 4,
+        "VALUE": rng.integers(0, 1000, n_samples)
+    })
+    manifest = _write_session(os.path.join(tmp_path, "trace"), appender_class, samples)
+
+    # All columns of a table are read when none are given
+    table = next(table for table in manifest["tables"] if table["pid"] == samples["PID"].iloc[0])
+    df = read_manifest_table(table)
+    assert list(df.columns) == ["TIME", "VALUE"]
+    assert df.shape[0] == (samples["PID"] == table["pid"]).sum()
+
+    for aggregation in ("last", "mean", "max"):
+        resampled = resample_long_format(
+            load_long_format(manifest, "mem", ["VALUE"]), 0, 2, 22, aggregation=aggregation
+        )
+        windows = list(StreamingResampler(
+            manifest, "mem", ["VALUE"], 0, 2, 22, aggregation=aggregation, window_bins=3, chunk_rows=7
+        ))
+        assert len(windows) == 8
+        np.testing.assert_array_equal(windows[0].pids, resampled.pids)
+        np.testing.assert_array_equal(np.concatenate([window.time_index for window in windows]), resampled.time_index)
+        np.testing.assert_array_equal(
+            np.vstack([window.values["VALUE"] for window in windows]),
+            resampled.values["VALUE"]
+        )
+
+
+def test_streaming_output_does_not_match_per_process_outputs(tmp_path):
+    samples = pd.DataFrame({"PID": [1, 1, 2], "TIME": [0.0, 2.0, 1.0], "VALUE": [1, 2, 3]})
+    _write_session(os.path.join(tmp_path, "trace"), TSVTableAppender, samples)
+    rsc = ResamplerConfig(interval=1, time_start=0, time_end=2, round_to_demical=0)
+    resample_table(str(tmp_path), rsc, "mem", keepfield=["VALUE"])
+    assert len(list(stream_resample_table(str(tmp_path), rsc, "mem", keepfield=["VALUE"]))) == 1
+    assert sorted(map(os.path.basename, glob.glob(os.path.join(tmp_path, "*.mem.resampled.parquet")))) == [
+        "trace.1.mem.resampled.parquet",
+        "trace.2.mem.resampled.parquet"
+    ]
+    df = pd.read_parquet(os.path.join(tmp_path, "trace.mem.resampled_long.parquet"))
+    assert list(df.columns) == ["TIME", "PID", "VALUE"]
+    assert df.shape[0] == 4
+
+
+def _write_total_process_session(
+        output_basename: str,
+        table_appender_type: str,
+        output_layout: str,
+        nfd_pids=(1, 2)
+):
+    """
+    Session of 2 processes, with rows of each table of :py:func:`total_process` at 10, 11 and 12 s.
+    """
+    session_manifest = SessionManifest(output_basename, toplevel_pid=1, table_appender_type=table_appender_type)
+    tac = TableAppenderConfig(buffer_size=2)
+    session_store = None
+    if output_layout == "session":
+        session_store = SessionStore(output_basename, table_appender_type, tac, session_manifest)
+    appenders = []
+    for pid in (1, 2):
+        for table_name, keepfield in TOTAL_PROCESS_TABLES.items():
+            if table_name == "nfd" and pid not in nfd_pids:
+                continue
+            header = ["TIME", *keepfield]
+            column_types = [FLOAT64, *(INT64 for _ in keepfield)]
+            if session_store is None:
+                appender = create_table_appender(
+                    table_appender_type, f"{output_basename}.{pid}.{table_name}", header, tac, column_types
+                )
+            else:
+                appender = session_store.create_appender(pid, table_name, header, column_types)
+            session_manifest.add_table(
+                appender, table_name, TABLE_KIND_PROCESS, pid=pid, shared=session_store is not None
+            )
+            for time in (10.0, 11.0, 12.0):
+                appender.append([time, *(pid for _ in keepfield)])
+            appenders.append(appender)
+    for appender in appenders:
+        appender.close()
+    if session_store is not None:
+        session_store.close()
+    session_manifest.write(is_final=True)
+
+
+@pytest.mark.parametrize("table_appender_type, output_layout", [
+    ("ArrowTableAppender", "per_process"),
+    ("TSVTableAppender", "session"),
+    ("ArrowTableAppender", "session")
+])
+@pytest.mark.parametrize("streaming", [False, True], ids=["in_memory", "streaming"])
+def test_total_process(tmp_path, table_appender_type, output_layout, streaming):
+    _write_total_process_session(os.path.join(tmp_path, "trace"), table_appender_type, output_layout)
+    total_process(str(tmp_path), streaming=streaming)
+    final_df = pd.read_csv(os.path.join(tmp_path, "final.csv")).set_index("TIME")
+    assert list(final_df.loc[[10.0, 11.0, 12.0], "N_FD"]) == [3, 3, 3]
+    assert list(final_df.loc[[10.0, 11.0, 12.0], "NPROC"]) == [2, 2, 2]
+    assert final_df["N_FD"].sum() == 9
+
+
+def test_stream_total_process_finishes_outputs(tmp_path, monkeypatch):
+    # nfd of fewer processes would be resampled in larger windows than other tables by default
+    _write_total_process_session(os.path.join(tmp_path, "trace"), "TSVTableAppender", "per_process", nfd_pids=(1,))
+    monkeypatch.setattr(engine, "STREAM_WINDOW_CELLS", 4)
+    total_process(str(tmp_path), streaming=True)
+
+    final_df = pd.read_csv(os.path.join(tmp_path, "final.csv")).set_index("TIME")
+    assert list(final_df.loc[[10.0, 11.0, 12.0], "N_FD"]) == [1, 1, 1]
+    assert list(final_df.loc[[10.0, 11.0, 12.0], "RESIDENT"]) == [3, 3, 3]
+    for table_name in TOTAL_PROCESS_TABLES:
+        # Readable only if the writer was closed
+        df = pd.read_parquet(os.path.join(tmp_path, f"trace.{table_name}.resampled_long.parquet"))
+        assert df.shape[0] == (3 if table_name == "nfd" else 6)
+
+
+@pytest.mark.parametrize("times", [[9.5, 12.5], [9.7, 12.8]], ids=["aligned", "free"])
+def test_base_resampler_forward_fills(times):
+    rsc = ResamplerConfig(interval=1, time_start=9.5, time_end=12.5, round_to_demical=1)
+    df = BaseResampler(rsc).resample(pd.DataFrame({"TIME": times, "VALUE": [1.0, 4.0]}))
+    values = df.set_index("TIME")["VALUE"]
+    assert values.loc[10.5] == 1.0
+    assert values.loc[11.5] == 1.0
+    assert np.isnan(values.loc[7.5])
+    assert np.isnan(values.loc[14.5])
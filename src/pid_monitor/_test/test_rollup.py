@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+from pid_monitor._dt_mvc.appender.session_manifest import SessionManifest, TABLE_KIND_PROCESS
+from pid_monitor._dt_mvc.appender.tsv_appender import TSVTableAppender
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, FLOAT64, INT64
+from pid_monitor._resampler.rollup import _coarsen, _stats_from_values, _ProcessTree, read_rollup, rollup_session
+
+_NAN = np.nan
+
+
+def test_coarsen():
+    values = np.array([
+        [1, _NAN],
+        [3, _NAN],
+        [2, 5],
+        [_NAN, _NAN]
+    ])
+    stats = _coarsen(_stats_from_values(values), 2)
+    np.testing.assert_array_equal(stats.count, [[2, 0], [1, 1]])
+    np.testing.assert_array_equal(stats.min, [[1, _NAN], [2, 5]])
+    np.testing.assert_array_equal(stats.mean, [[2, _NAN], [2, 5]])
+    np.testing.assert_array_equal(stats.max, [[3, _NAN], [2, 5]])
+    np.testing.assert_array_equal(stats.last, [[3, _NAN], [2, 5]])
+
+    # Coarsening twice is coarsening once by the product of factors
+    stats = _coarsen(stats, 2)
+    np.testing.assert_array_equal(stats.count, [[3, 1]])
+    np.testing.assert_array_equal(stats.mean, [[2, 5]])
+    np.testing.assert_array_equal(stats.last, [[2, 5]])
+
+
+def _processes(ppids):
+    return {str(pid): {"ppid": ppid, "name": "sh", "start_time": 0, "end_time": None} for pid, ppid in ppids.items()}
+
+
+def test_process_tree_skips_processes_without_samples():
+    # 2 and 4 have no samples: 3 belongs to the tree of 1, and 5 to the tree of 3
+    processes = _processes({1: 0, 2: 1, 3: 2, 4: 3, 5: 4, 6: 0})
+    process_tree = _ProcessTree(np.array([1, 3, 5, 6]), processes)
+    np.testing.assert_array_equal(process_tree.parent_columns, [-1, 0, 1, -1])
+    values = np.array([
+        [1, 10, 100, 1000],
+        [_NAN, 10, _NAN, _NAN],
+        [_NAN, _NAN, _NAN, _NAN]
+    ])
+    np.testing.assert_array_equal(
+        process_tree.sum_subtrees(values),
+        [
+            [111, 110, 100, 1000],
+            [10, 10, _NAN, _NAN],
+            [_NAN, _NAN, _NAN, _NAN]
+        ]
+    )
+
+
+def test_process_tree_with_cycle():
+    # Reused PIDs may make a process its own ancestor
+    process_tree = _ProcessTree(np.array([1, 3]), _processes({1: 2, 2: 3, 3: 1}))
+    assert sorted(process_tree.parent_columns.tolist()) == [-1, 0]
+    np.testing.assert_array_equal(process_tree.sum_subtrees(np.array([[1.0, 2.0]])).max(), 3)
+
+
+def test_rollup_session(tmp_path):
+    output_basename = os.path.join(tmp_path, "trace")
+    session_manifest = SessionManifest(output_basename, toplevel_pid=1, table_appender_type="TSVTableAppender")
+    # 2 is a shell between 1 and 3 that exits before being sampled
+    for pid, ppid in ((1, 0), (2, 1), (3, 2)):
+        session_manifest.add_process(pid=pid, ppid=ppid, name="sh", start_time=0)
+    for pid, samples in ((1, [(0.0, 1), (1.0, 2), (3.5, 3)]), (3, [(1.0, 10), (1.5, 20)])):
+        appender = TSVTableAppender(
+            f"{output_basename}.{pid}.nfd",
+            ["TIME", "N_FD"],
+            TableAppenderConfig(buffer_size=2),
+            [FLOAT64, INT64]
+        )
+        session_manifest.add_table(appender, table_name="nfd", kind=TABLE_KIND_PROCESS, pid=pid)
+        for sample in samples:
+            appender.append(list(sample))
+        appender.close()
+    session_manifest.write(is_final=True)
+
+    rollup_session(output_basename, resolution=0.5, tiers=(1.0, 4.0), rollup_tables={"nfd": ["N_FD"]})
+    df = read_rollup(output_basename, "nfd", 1.0, scope="pid")
+    assert df[df["PID"] == 3][["TIME", "COUNT", "N_FD_MEAN", "N_FD_LAST"]].values.tolist() == [[1.0, 2, 15.0, 20.0]]
+    df = read_rollup(output_basename, "nfd", 4.0, scope="tree").set_index("PID")
+    assert df.loc[1, "N_FD_MAX"] == 22.0
+    assert df.loc[3, "N_FD_MAX"] == 20.0
@@ -0,0 +1,44 @@
+import gc
+import os
+import weakref
+
+from pid_monitor._dt_mvc.appender.session_manifest import SessionManifest, load_session_manifest, \
+    TABLE_KIND_PROCESS
+from pid_monitor._dt_mvc.appender.tsv_appender import TSVTableAppender
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, FLOAT64, INT64
+
+
+def test_closed_tables_are_frozen(tmp_path):
+    output_basename = os.path.join(tmp_path, "trace")
+    session_manifest = SessionManifest(output_basename, toplevel_pid=1, table_appender_type="TSVTableAppender")
+    appenders = []
+    for pid in (1, 2):
+        appender = TSVTableAppender(
+            f"{output_basename}.{pid}.mem",
+            ["TIME", "RESIDENT"],
+            TableAppenderConfig(buffer_size=2),
+            [FLOAT64, INT64]
+        )
+        session_manifest.add_table(appender, table_name="mem", kind=TABLE_KIND_PROCESS, pid=pid)
+        appenders.append(appender)
+    for appender in appenders:
+        for i in range(3):
+            appender.append([float(i), i])
+
+    appenders[0].close()
+    session_manifest.write()
+    manifest = load_session_manifest(output_basename)
+    assert [table["n_rows"] for table in manifest["tables"]] == [3, 2]
+    assert [table["max_time"] for table in manifest["tables"]] == [2.0, 1.0]
+
+    # The manifest no longer holds the closed appender
+    closed_appender = weakref.ref(appenders.pop(0))
+    gc.collect()
+    assert closed_appender() is None
+
+    appenders[0].append([3.0, 3])
+    appenders[0].close()
+    session_manifest.write(is_final=True)
+    manifest = load_session_manifest(output_basename)
+    assert [table["n_rows"] for table in manifest["tables"]] == [3, 4]
+    assert [table["pid"] for table in manifest["tables"]] == [1, 2]
@@ -0,0 +1,88 @@
+import os
+
+import pandas as pd
+
+from pid_monitor._dt_mvc.appender import parquet_appender
+from pid_monitor._dt_mvc.appender.parquet_appender import ParquetTableAppender
+from pid_monitor._dt_mvc.appender.table_reader import read_manifest_table, iter_manifest_table_chunks
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig, FLOAT64, INT64
+
+_HEADER = ["TIME", "VALUE"]
+_COLUMN_TYPES = [FLOAT64, INT64]
+
+
+def _describe(appender, table_appender_type: str):
+    """What the session manifest says of a table."""
+    return {
+        "filename": appender.get_readable_filename(),
+        "table_appender_type": table_appender_type,
+        "segmented": False,
+        "shared": False,
+        "table": "test"
+    }
+
+
+def test_read_parquet_while_open(tmp_path):
+    appender = ParquetTableAppender(
+        os.path.join(tmp_path, "test"),
+        _HEADER,
+        TableAppenderConfig(buffer_size=2, row_group_size=4),
+        _COLUMN_TYPES
+    )
+    for i in range(10):
+        appender.append([float(i), i])
+    table = _describe(appender, "ParquetTableAppender")
+    assert table["filename"].endswith(".parts")
+    # The temporary file of the next part must not be taken as a part
+    open(os.path.join(table["filename"], ".part-000009.parquet.tmp"), "wb").close()
+
+    df = read_manifest_table(table)
+    assert list(df["VALUE"]) == list(range(8))
+    df = pd.concat(iter_manifest_table_chunks(table, columns=["VALUE"], chunk_rows=3))
+    assert list(df["VALUE"]) == list(range(8))
+
+    appender.close()
+    # The manifest written while the table was open still leads to its rows
+    assert list(read_manifest_table(table)["VALUE"]) == list(range(10))
+    table = _describe(appender, "ParquetTableAppender")
+    assert not table["filename"].endswith(".parts")
+    assert list(read_manifest_table(table, columns=["VALUE"])["VALUE"]) == list(range(10))
+
+
+def test_read_parquet_without_parts(tmp_path):
+    appender = ParquetTableAppender(
+        os.path.join(tmp_path, "test"),
+        _HEADER,
+        TableAppenderConfig(buffer_size=2, row_group_size=4),
+        _COLUMN_TYPES
+    )
+    assert len(read_manifest_table(_describe(appender, "ParquetTableAppender"), columns=["VALUE"])) == 0
+    appender.close()
+
+
+def test_readable_filename_during_compaction(tmp_path, monkeypatch):
+    appender = ParquetTableAppender(
+        os.path.join(tmp_path, "test"),
+        _HEADER,
+        TableAppenderConfig(buffer_size=2, row_group_size=4),
+        _COLUMN_TYPES
+    )
+    for i in range(10):
+        appender.append([float(i), i])
+    readable_filenames = []
+    replace = os.replace
+
+    def _replace(src, dst):
+        # What a manifest rewrite would see while the compacted file is being moved into place
+        readable_filenames.append(appender.get_readable_filename())
+        replace(src, dst)
+
+    monkeypatch.setattr(parquet_appender.os, "replace", _replace)
+    appender.close()
+    compacted_filename = os.path.join(tmp_path, "test.parquet")
+    assert os.path.basename(readable_filenames[-1]) == "test.parquet.parts"
+    assert appender.get_readable_filename() == compacted_filename
+    assert list(read_manifest_table(_describe(appender, "ParquetTableAppender"))["VALUE"]) == list(range(10))
+    # Closing again does not compact again
+    appender.close()
+    assert os.path.exists(compacted_filename)
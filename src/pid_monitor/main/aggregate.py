@@ -1,14 +1,47 @@
 """
-Module for aggregation and time-series analysis of results
+aggregate -- Roll up per-process metrics of a session into tiers of coarser resolutions
+
+For each of memory, CPU and file descriptor usage, writes the minimum, mean, maximum and last value
+in bins of each tier, per process and per process tree. See :py:mod:`pid_monitor._resampler.rollup`.
 """
 import argparse
+import logging
 from typing import List
 
+from pid_monitor._resampler.rollup import rollup_session, DEFAULT_ROLLUP_RESOLUTION, DEFAULT_ROLLUP_TIERS
+
+_LOG_HANDLER = logging.getLogger()
+
 
 def _parse_args(args: List[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o", "--out",
+        help="Basename of output files of the tracing session, or the directory holding them",
+        type=str,
+        required=True
+    )
     parser.add_argument(
         "--resolution",
+        help="Interval in seconds of the grid samples are aligned onto before rolling up",
         type=float,
-        default=0.01
+        default=DEFAULT_ROLLUP_RESOLUTION
     )
+    parser.add_argument(
+        "--tiers",
+        help="Bin sizes in seconds of tiers, each a multiple of the previous one and of resolution",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_ROLLUP_TIERS)
+    )
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> int:
+    args = _parse_args(args)
+    try:
+        rollup_session(args.out, resolution=args.resolution, tiers=args.tiers)
+    except ValueError as e:
+        _LOG_HANDLER.error(str(e))
+        return 1
+    return 0
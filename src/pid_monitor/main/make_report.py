@@ -2,14 +2,15 @@
 This module generates R reports.
 """
 
+import argparse
 import logging
 import os
 import subprocess
-import threading
-from typing import Set
-
-from pid_monitor._private import DEFAULT_SYSTEM_INDICATOR_PID
+from typing import Set, List
 
+from pid_monitor._dt_mvc import DEFAULT_SYSTEM_INDICATOR_PID
+from pid_monitor._dt_mvc.appender.session_manifest import load_session_manifest, find_session_manifest, \
+    MANIFEST_SUFFIX
 from pid_monitor._lib import parallel_helper
 
 _LOG_HANDLER = logging.getLogger()
@@ -25,60 +26,80 @@ _RENV_CWD = os.path.dirname(os.path.dirname(_FILE_DIR))
 """Directory of renv, used for calling R processes"""
 
 
-class _MakeIndividualReportThread(threading.Thread):
-    def __init__(self, this_pid: int, output_basename: str):
-        super().__init__()
-        self.this_pid = this_pid
-        self.output_basename = output_basename
-        self.logger = logging.getLogger()
-
-    def run(self) -> None:
-        if self.this_pid == DEFAULT_SYSTEM_INDICATOR_PID:
-            log_filename = f'{self.output_basename}_report_system.log'
-        else:
-            log_filename = f'{self.output_basename}_report_{self.this_pid}.log'
-        log_writer = open(log_filename, "wt")
-        if self.this_pid == DEFAULT_SYSTEM_INDICATOR_PID:
-            report_process = subprocess.Popen((
-                'Rscript',
-                os.path.join(_R_FILE_DIR, 'make_system_report.R'),
-                '--basename', self.output_basename,
-                '--rmd', os.path.join(_R_FILE_DIR, 'system_report.Rmd')
-            ),
-                cwd=_RENV_CWD,
-                stdout=log_writer,
-                stderr=log_writer
-            )
-        else:
-            report_process = subprocess.Popen((
-                'Rscript',
-                os.path.join(_R_FILE_DIR, 'make_process_report.R'),
-                '--pid', str(self.this_pid),
-                '--basename', self.output_basename,
-                '--rmd', os.path.join(_R_FILE_DIR, 'process_report.Rmd')
-            ),
-                cwd=_RENV_CWD,
-                stdout=log_writer,
-                stderr=log_writer
-            )
+def _make_individual_report(this_pid: int, output_basename: str):
+    if this_pid == DEFAULT_SYSTEM_INDICATOR_PID:
+        log_filename = f'{output_basename}_report_system.log'
+    else:
+        log_filename = f'{output_basename}_report_{this_pid}.log'
+    log_writer = open(log_filename, "wt")
+    if this_pid == DEFAULT_SYSTEM_INDICATOR_PID:
+        report_process = subprocess.Popen((
+            'Rscript',
+            os.path.join(_R_FILE_DIR, 'make_system_report.R'),
+            '--basename', output_basename,
+            '--rmd', os.path.join(_R_FILE_DIR, 'system_report.Rmd')
+        ),
+            cwd=_RENV_CWD,
+            stdout=log_writer,
+            stderr=log_writer
+        )
+    else:
+        report_process = subprocess.Popen((
+            'Rscript',
+            os.path.join(_R_FILE_DIR, 'make_process_report.R'),
+            '--pid', str(this_pid),
+            '--basename', output_basename,
+            '--rmd', os.path.join(_R_FILE_DIR, 'process_report.Rmd')
+        ),
+            cwd=_RENV_CWD,
+            stdout=log_writer,
+            stderr=log_writer
+        )
 
-        self.logger.debug(f"{' '.join(report_process.args)} ADD")
-        retv = report_process.wait()
-        log_writer.close()
-        if retv == 0:
-            self.logger.debug(f"{' '.join(report_process.args)} FIN")
-            os.remove(log_filename)
-        else:
-            self.logger.error(f"{' '.join(report_process.args)} ERR")
+    _LOG_HANDLER.debug(f"{' '.join(report_process.args)} ADD")
+    retv = report_process.wait()
+    log_writer.close()
+    if retv == 0:
+        _LOG_HANDLER.debug(f"{' '.join(report_process.args)} FIN")
+        os.remove(log_filename)
+    else:
+        _LOG_HANDLER.error(f"{' '.join(report_process.args)} ERR")
 
 
 def make_all_report(all_pids: Set[int], output_basename: str):
     """
     Generate all report for both system and process asynchronously
     """
-    parallel_job_queue = parallel_helper.ParallelJobQueue(pool_name="Compiling HTMLs")
+    parallel_job_queue = parallel_helper.ParallelJobQueue(pool_name="Compiling HTMLs", use_threads=True)
     for this_pid in all_pids:
-        parallel_job_queue.append(_MakeIndividualReportThread(this_pid=this_pid, output_basename=output_basename))
+        parallel_job_queue.append(_make_individual_report, this_pid=this_pid, output_basename=output_basename)
     parallel_job_queue.start()
     parallel_job_queue.join()
     _LOG_HANDLER.info("All finished")
+
+
+def _parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o", "--out",
+        help="Basename of output files of the tracing session, or the directory holding them",
+        type=str,
+        required=True
+    )
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> int:
+    """
+    Generate reports of the system and of all processes listed in the session manifest.
+    """
+    args = _parse_args(args)
+    manifest = load_session_manifest(args.out)
+    if manifest is None:
+        _LOG_HANDLER.error(f"No session manifest found at {args.out}")
+        return 1
+    output_basename = find_session_manifest(args.out)[:-len(MANIFEST_SUFFIX) - 1]
+    all_pids = {int(pid) for pid in manifest["processes"]}
+    all_pids.add(DEFAULT_SYSTEM_INDICATOR_PID)
+    make_all_report(all_pids=all_pids, output_basename=output_basename)
+    return 0
@@ -0,0 +1,148 @@
+"""
+recover -- Stitch segments of tables back into one table each
+
+Tables traced with ``--segment_rows`` or ``--segment_duration`` are written as segments
+recorded in manifests (see :py:mod:`segmented_appender`).
+For each manifest of a session, this reads the closed segments,
+salvages what can be read of the segment being written if the tracer crashed,
+and writes all rows into table ``{filename}``, as if it was traced without segments.
+"""
+import argparse
+import glob
+import logging
+import os
+import shutil
+from typing import List, Dict, Any, Tuple
+
+from pid_monitor._dt_mvc.appender import AVAILABLE_TABLE_APPENDERS, load_table_appender_class
+from pid_monitor._dt_mvc.appender.segmented_appender import MANIFEST_SUFFIX, read_manifest
+from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig
+
+RECOVER_BUFFER_SIZE = 4096
+
+_LOG_HANDLER = logging.getLogger()
+
+
+def _parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o", "--out",
+        help="Basename of output files of the tracing session, or the directory holding them",
+        type=str,
+        required=True
+    )
+    parser.add_argument(
+        "--table_appender_type",
+        help="Type of recovered tables. Defaults to that of the segments",
+        type=str,
+        choices=list(AVAILABLE_TABLE_APPENDERS.keys()),
+        required=False,
+        default=None
+    )
+    parser.add_argument(
+        "--remove_segments",
+        help="Remove segments and manifests of recovered tables",
+        action="store_true"
+    )
+    return parser.parse_args(args)
+
+
+def find_manifests(output_basename: str) -> List[str]:
+    """
+    Find manifests of tables named ``{output_basename}.*``, or of all tables in directory ``output_basename``.
+    """
+    if os.path.isdir(output_basename):
+        return sorted(
+            os.path.join(output_basename, name)
+            for name in os.listdir(output_basename)
+            if name.endswith("." + MANIFEST_SUFFIX)
+        )
+    return sorted(glob.glob(glob.escape(output_basename) + ".*." + MANIFEST_SUFFIX))
+
+
+def _get_segments(records: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Get the last record of each segment.
+    """
+    segments = {}
+    for record in records:
+        if record["type"] == "segment":
+            segments[record["segment"]] = record
+    return segments
+
+
+def recover_table(
+        manifest_filename: str,
+        output_basename: str,
+        table_appender_type: str = None
+) -> Tuple[int, List[str]]:
+    """
+    Stitch segments of one manifest into a table.
+
+    :return: Number of rows recovered and paths of segments read.
+    :raises ValueError: If the manifest does not describe a table.
+    """
+    records = list(read_manifest(manifest_filename))
+    if not records or records[0]["type"] != "table":
+        raise ValueError(f"{manifest_filename} is not a manifest of a table")
+    table = records[0]
+    dirname = os.path.dirname(manifest_filename)
+    filename = manifest_filename[:-len(MANIFEST_SUFFIX) - 1]
+    segment_class = load_table_appender_class(table["table_appender_type"])
+    if table_appender_type is None:
+        table_appender_type = table["table_appender_type"]
+    appender = load_table_appender_class(table_appender_type)(
+        filename=filename,
+        header=table["header"],
+        tac=TableAppenderConfig(buffer_size=RECOVER_BUFFER_SIZE, output_basename=output_basename),
+        column_types=table["column_types"]
+    )
+    n_rows = 0
+    segment_paths = []
+    for segment_id, record in sorted(_get_segments(records[1:]).items()):
+        segment_path = os.path.join(dirname, record["filename"])
+        segment_paths.append(segment_path)
+        n_segment_rows = 0
+        try:
+            for row in segment_class.iter_salvaged_rows(segment_path, table["header"], table["column_types"]):
+                appender.append(row)
+                n_segment_rows += 1
+        except (OSError, NotImplementedError) as e:
+            _LOG_HANDLER.warning(f"{segment_path}: {e.__class__.__name__} encountered! DETAILS={e.__repr__()}")
+        if record["state"] == "open":
+            _LOG_HANDLER.warning(f"{segment_path}: Salvaged {n_segment_rows} rows of segment being written")
+        elif n_segment_rows != record["n_rows"]:
+            _LOG_HANDLER.warning(
+                f"{segment_path}: Required: {record['n_rows']} Actual: {n_segment_rows}"
+            )
+        n_rows += n_segment_rows
+    appender.close()
+    return n_rows, segment_paths
+
+
+def _remove_segments(manifest_filename: str, segment_paths: List[str]):
+    for segment_path in segment_paths:
+        if os.path.exists(segment_path):
+            os.remove(segment_path)
+        # Parts of Parquet segments not compacted
+        shutil.rmtree(segment_path + ".parts", ignore_errors=True)
+    os.remove(manifest_filename)
+
+
+def main(args: List[str]) -> int:
+    args = _parse_args(args)
+    manifest_filenames = find_manifests(args.out)
+    if not manifest_filenames:
+        _LOG_HANDLER.error(f"No manifest found at {args.out}")
+        return 1
+    output_basename = os.path.join(args.out, "") if os.path.isdir(args.out) else args.out
+    for manifest_filename in manifest_filenames:
+        try:
+            n_rows, segment_paths = recover_table(manifest_filename, output_basename, args.table_appender_type)
+        except ValueError as e:
+            _LOG_HANDLER.error(f"{manifest_filename}: {e}")
+            continue
+        print(f"{manifest_filename}: {n_rows} rows recovered from {len(segment_paths)} segments")
+        if args.remove_segments:
+            _remove_segments(manifest_filename, segment_paths)
+    return 0
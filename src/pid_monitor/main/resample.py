@@ -0,0 +1,42 @@
+"""
+resample -- Resample all processes of a session onto one time grid and sum them
+
+Writes resampled tables of memory, CPU and file descriptor usage,
+and their sums over all processes with the number of processes in ``final.csv``.
+Sessions larger than memory should be resampled with ``--streaming``,
+which writes one ``{basename}.{table}.resampled_long.parquet`` per table, in long format, instead.
+"""
+import argparse
+from typing import List
+
+from pid_monitor._resampler import total_process
+
+
+def _parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o", "--out",
+        help="Directory holding output files of the tracing session",
+        type=str,
+        required=True
+    )
+    parser.add_argument(
+        "--interval",
+        help="Resampling interval in seconds",
+        type=float,
+        default=1
+    )
+    parser.add_argument(
+        "--streaming",
+        help="Resample window by window and write outputs incrementally, for sessions larger than memory. "
+             "Needs the session manifest. Resampled tables are written in long format "
+             "to {basename}.{table}.resampled_long.parquet. Figures are not drawn",
+        action="store_true"
+    )
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> int:
+    args = _parse_args(args)
+    total_process(args.out, interval=args.interval, streaming=args.streaming)
+    return 0
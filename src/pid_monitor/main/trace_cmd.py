@@ -6,6 +6,7 @@ import uuid
 from collections import namedtuple
 from typing import List, Any, Mapping, Tuple
 
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor.main import trace_pid
 
@@ -26,20 +27,77 @@ class _PidMonitorProcess(threading.Thread):
     pid_monitor_kwargs: Mapping[str, Any]
     """Arguments to ``trace_pid``"""
 
+    pmc: PMConfig
+
     def __init__(self, pid: int, output_basename: str, pid_monitor_kwargs):
         super().__init__()
         self.monitored_pid = pid
         self.output_basename = output_basename
         self.pid_monitor_kwargs = pid_monitor_kwargs
-
-    def run(self):
-        trace_pid.trace_pid(PMConfig(
+        self.pmc = PMConfig(
             toplevel_trace_pid=self.monitored_pid,
             output_basename=os.path.abspath(os.path.expanduser(os.path.join(
                 self.output_basename, "proc_profiler", ""
-            ))))
+            )))
         )
 
+    def run(self):
+        trace_pid.trace_pid(self.pmc)
+
+
+def _wait_for_monitored_process(process: subprocess.Popen) -> Tuple[int, Any]:
+    """
+    Wait for the process with :py:func:`os.wait4`,
+    which also reports resource usage of the process and its waited-for descendants.
+
+    :return: Exit value in the style of :py:attr:`subprocess.Popen.returncode`, and the resource usage.
+    """
+    _, status, rusage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        exit_value = -os.WTERMSIG(status)
+    else:
+        exit_value = os.WEXITSTATUS(status)
+    process.returncode = exit_value
+    return exit_value, rusage
+
+
+def _write_rusage(pmc: PMConfig, exit_value: int, rusage: Any):
+    """
+    Write resource usage reported by the kernel at exit of the monitored process.
+    On Linux, ``ru_maxrss`` is in KiB while block IO is in 512-byte units.
+    """
+    appender = pmc.create_table_appender(
+        table_name="rusage",
+        header=[
+            "PID",
+            "EXIT_VALUE",
+            "UTIME",
+            "STIME",
+            "MAX_RSS",
+            "READ_BYTES",
+            "WRITE_BYTES",
+            "MINOR_FAULTS",
+            "MAJOR_FAULTS",
+            "VOLUNTARY_CTX_SWITCHES",
+            "INVOLUNTARY_CTX_SWITCHES"
+        ],
+        column_types=[INT64, INT64, FLOAT64, FLOAT64] + [INT64] * 7
+    )
+    appender.append([
+        pmc.toplevel_trace_pid,
+        exit_value,
+        rusage.ru_utime,
+        rusage.ru_stime,
+        rusage.ru_maxrss * 1024,
+        rusage.ru_inblock * 512,
+        rusage.ru_oublock * 512,
+        rusage.ru_minflt,
+        rusage.ru_majflt,
+        rusage.ru_nvcsw,
+        rusage.ru_nivcsw
+    ])
+    appender.close()
+
 
 def run_process(
         cmd: List[str],
@@ -70,8 +128,9 @@ def run_process(
         pid_monitor_kwargs=pid_monitor_kwargs
     )
     pid_monitor_process.start()
-    exit_value = _MONITORED_PROCESS.wait()
+    exit_value, rusage = _wait_for_monitored_process(_MONITORED_PROCESS)
     pid_monitor_process.join()
+    _write_rusage(pid_monitor_process.pmc, exit_value, rusage)
     return exit_value
 
 
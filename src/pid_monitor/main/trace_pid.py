@@ -1,18 +1,28 @@
 import argparse
 import logging
 import os
+import resource
 import signal
 import sys
-from typing import List
+from typing import List, Optional
 
 from pid_monitor._dt_mvc import PSUTIL_NOTFOUND_ERRORS
 from pid_monitor._dt_mvc.appender import load_table_appender_class, BaseTableAppender
-from pid_monitor._dt_mvc.appender.typing import TableAppenderConfig
+from pid_monitor._dt_mvc.appender.background_writer import BackgroundTableWriter
+from pid_monitor._dt_mvc.appender.flush_timer import FlushTimer
+from pid_monitor._dt_mvc.appender.session_manifest import SessionManifest
+from pid_monitor._dt_mvc.appender.session_store import SessionStore
+from pid_monitor._dt_mvc.appender.typing import FLOAT64, INT64, STRING
+from pid_monitor._dt_mvc.exit_accounting import EXIT_ACCOUNTING_HEADER, EXIT_ACCOUNTING_COLUMN_TYPES
 from pid_monitor._dt_mvc.frontend import show_frontend
 from pid_monitor._dt_mvc.pm_config import PMConfig
 from pid_monitor._dt_mvc.std_dispatcher import DispatcherController
+from pid_monitor._dt_mvc.std_dispatcher.proc_connector import ProcConnectorListenerThread, \
+    open_proc_connector_socket
+from pid_monitor._dt_mvc.std_dispatcher.process_table_scanner import ProcessTableScannerThread
 from pid_monitor._dt_mvc.std_dispatcher.process_tracer_dispatcher import ProcessTracerDispatcherThread
 from pid_monitor._dt_mvc.std_dispatcher.system_tracer_dispatcher import SystemTracerDispatcherThread
+from pid_monitor._dt_mvc.tick_scheduler import TickScheduler
 
 _LOG_HANDLER = logging.getLogger()
 
@@ -33,11 +43,93 @@ def _start_system_tracer_dispatcher(
     return system_dispatcher_process
 
 
+def _raise_open_file_limit():
+    """
+    Table appenders keep their files open, so raise the soft limit of open files to the hard limit.
+    """
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == hard_limit:
+        return
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+    except (ValueError, OSError) as e:
+        _LOG_HANDLER.warning(f"Cannot raise limit of open files from {soft_limit}: {e}")
+        return
+    _LOG_HANDLER.debug(f"Limit of open files raised from {soft_limit} to {hard_limit}")
+
+
+def _start_background_writer(pmc: PMConfig) -> Optional[BackgroundTableWriter]:
+    """
+    Start the background writer and make appenders created afterwards use it.
+    Return ``None`` if tables are written on tracer threads.
+    """
+    if pmc.writer_pool_size < 1:
+        return None
+    background_writer = BackgroundTableWriter(
+        pool_size=pmc.writer_pool_size,
+        queue_size=pmc.writer_queue_size,
+        drop_when_full=pmc.writer_drop_when_full
+    )
+    background_writer.start()
+    pmc.background_writer = background_writer
+    _LOG_HANDLER.debug("Background writer started")
+    return background_writer
+
+
+def _start_flush_timer(pmc: PMConfig) -> Optional[FlushTimer]:
+    """
+    Start the flush timer and make appenders created afterwards use it.
+    Return ``None`` if only full buffers are flushed.
+    """
+    if pmc.table_appender_max_latency <= 0:
+        return None
+    flush_timer = FlushTimer()
+    flush_timer.start()
+    pmc.flush_timer = flush_timer
+    _LOG_HANDLER.debug("Flush timer started")
+    return flush_timer
+
+
+def _start_session_manifest(pmc: PMConfig) -> SessionManifest:
+    """
+    Write the session manifest, keep it updated, and make appenders created afterwards register to it.
+    """
+    session_manifest = SessionManifest(
+        output_basename=pmc.output_basename,
+        toplevel_pid=pmc.toplevel_trace_pid,
+        table_appender_type=pmc.table_appender_type,
+        background_writer=pmc.background_writer
+    )
+    session_manifest.write()
+    session_manifest.start()
+    pmc.session_manifest = session_manifest
+    _LOG_HANDLER.debug(f"Session manifest started at {session_manifest.filename}")
+    return session_manifest
+
+
+def _create_session_store(pmc: PMConfig) -> Optional[SessionStore]:
+    """
+    Create the session store if asked to, and make per-process appenders created afterwards use it.
+    """
+    if pmc.output_layout == "per_process":
+        return None
+    # The session layout is opt-in for appenders writing one file per table,
+    # as the R report reads per-process .cputime files, which it does not write.
+    if pmc.output_layout == "auto" and not load_table_appender_class(pmc.table_appender_type).single_container:
+        return None
+    session_store = SessionStore(
+        output_basename=pmc.output_basename,
+        table_appender_type=pmc.table_appender_type,
+        tac=pmc.get_table_appender_config(),
+        session_manifest=pmc.session_manifest
+    )
+    pmc.session_store = session_store
+    return session_store
+
+
 def _create_registry_appender(pmc: PMConfig):
-    return load_table_appender_class(
-        pmc.table_appender_type
-    )(
-        filename=f"{pmc.output_basename}.reg",
+    return pmc.create_table_appender(
+        table_name="reg",
         header=[
             "TIME",
             "PID",
@@ -45,9 +137,15 @@ def _create_registry_appender(pmc: PMConfig):
             "EXE",
             "CWD"
         ],
-        tac=TableAppenderConfig(
-            pmc.table_appender_buffer_size
-        )
+        column_types=[FLOAT64, INT64, STRING, STRING, STRING]
+    )
+
+
+def _create_exit_appender(pmc: PMConfig):
+    return pmc.create_table_appender(
+        table_name="exit",
+        header=EXIT_ACCOUNTING_HEADER,
+        column_types=EXIT_ACCOUNTING_COLUMN_TYPES
     )
 
 
@@ -55,7 +153,8 @@ def _start_main_tracer_dispatcher(
         trace_pid: int,
         pmc: PMConfig,
         dispatcher_controller: DispatcherController,
-        registry_appender: BaseTableAppender
+        registry_appender: BaseTableAppender,
+        exit_appender: BaseTableAppender
 ) -> ProcessTracerDispatcherThread:
     """
     Start the main dispatcher over traced process. If failed, suicide.
@@ -65,7 +164,8 @@ def _start_main_tracer_dispatcher(
             trace_pid=trace_pid,
             pmc=pmc,
             dispatcher_controller=dispatcher_controller,
-            registry_appender=registry_appender
+            registry_appender=registry_appender,
+            exit_appender=exit_appender
         )
     except PSUTIL_NOTFOUND_ERRORS:
         _LOG_HANDLER.error(f"Process pid={trace_pid} not found -- Maybe it is terminated?")
@@ -76,6 +176,54 @@ def _start_main_tracer_dispatcher(
     return main_dispatcher
 
 
+def _start_process_table_scanner(
+        pmc: PMConfig,
+        dispatcher_controller: DispatcherController,
+        registry_appender: BaseTableAppender,
+        exit_appender: BaseTableAppender
+) -> ProcessTableScannerThread:
+    """
+    Start the thread that discovers sub-processes of traced processes.
+    """
+    process_table_scanner = ProcessTableScannerThread(
+        pmc=pmc,
+        dispatcher_controller=dispatcher_controller,
+        registry_appender=registry_appender,
+        exit_appender=exit_appender
+    )
+    process_table_scanner.start()
+    _LOG_HANDLER.debug("Process table scanner started")
+    return process_table_scanner
+
+
+def _start_proc_connector_listener(
+        pmc: PMConfig,
+        process_table_scanner: ProcessTableScannerThread
+) -> Optional[ProcConnectorListenerThread]:
+    """
+    Start the process events listener if asked to. Return ``None`` if falling back to /proc polling.
+    """
+    if pmc.process_discovery_backend == "poll":
+        return None
+    try:
+        sock = open_proc_connector_socket()
+    except OSError as e:
+        message = f"Process events connector unavailable ({e.__class__.__name__}: {e}), using /proc polling only"
+        if pmc.process_discovery_backend == "netlink":
+            _LOG_HANDLER.warning(message)
+        else:
+            _LOG_HANDLER.info(message)
+        return None
+    proc_connector_listener = ProcConnectorListenerThread(
+        pmc=pmc,
+        sock=sock,
+        process_table_scanner=process_table_scanner
+    )
+    proc_connector_listener.start()
+    _LOG_HANDLER.debug("Process events listener started")
+    return proc_connector_listener
+
+
 def _parse_args(args: List[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser = PMConfig.append_pmc_args_to_argparser(parser)
@@ -97,7 +245,14 @@ def trace_pid(
     _LOG_HANDLER.info(
         f"Tracer started with toplevel_trace_pid={pmc.toplevel_trace_pid} and output_basename={pmc.output_basename}"
     )
-    dispatcher_controller = DispatcherController()
+    _raise_open_file_limit()
+    background_writer = _start_background_writer(pmc)
+    flush_timer = _start_flush_timer(pmc)
+    session_manifest = _start_session_manifest(pmc)
+    session_store = _create_session_store(pmc)
+    tick_scheduler = TickScheduler(pool_size=pmc.scheduler_pool_size)
+    tick_scheduler.start()
+    dispatcher_controller = DispatcherController(tick_scheduler=tick_scheduler)
 
     try:
         for _signal in (
@@ -116,24 +271,71 @@ def trace_pid(
         dispatcher_controller=dispatcher_controller
     )
     _registry_appender = _create_registry_appender(pmc)
+    _exit_appender = _create_exit_appender(pmc)
     main_tracer_dispatcher = _start_main_tracer_dispatcher(
         trace_pid=pmc.toplevel_trace_pid,
         pmc=pmc,
         dispatcher_controller=dispatcher_controller,
-        registry_appender=_registry_appender
+        registry_appender=_registry_appender,
+        exit_appender=_exit_appender
+    )
+    process_table_scanner = _start_process_table_scanner(
+        pmc=pmc,
+        dispatcher_controller=dispatcher_controller,
+        registry_appender=_registry_appender,
+        exit_appender=_exit_appender
+    )
+    proc_connector_listener = _start_proc_connector_listener(
+        pmc=pmc,
+        process_table_scanner=process_table_scanner
     )
     show_frontend(
         pmc=pmc,
         dispatcher_controller=dispatcher_controller
     )
+    if proc_connector_listener is not None:
+        proc_connector_listener.should_exit = True
+        proc_connector_listener.join()
+        _LOG_HANDLER.debug("Process events listener ended")
+    process_table_scanner.should_exit = True
+    process_table_scanner.join()
+    _LOG_HANDLER.debug("Process table scanner ended")
     _registry_appender.close()
+    process_tracer_dispatchers = dispatcher_controller.get_current_dispatchers()
     dispatcher_controller.terminate_all_dispatchers(signal.SIGTERM)  # Send signal.SIGINT to all dispatchers
 
     main_tracer_dispatcher.join()
     _LOG_HANDLER.debug("Main dispatcher ended")
+    for dispatcher in process_tracer_dispatchers:
+        if dispatcher is not system_tracer_dispatcher:
+            dispatcher.join()
+    _exit_appender.close()
+    _LOG_HANDLER.debug("Exit accounting written")
 
     system_tracer_dispatcher.join()
     _LOG_HANDLER.debug("System dispatcher ended")
+
+    tick_scheduler.stop()
+    _LOG_HANDLER.debug("Tick scheduler ended")
+
+    if session_store is not None:
+        session_store.close()
+        pmc.session_store = None
+        _LOG_HANDLER.debug("Session store closed")
+
+    session_manifest.stop()
+    pmc.session_manifest = None
+    _LOG_HANDLER.debug("Session manifest written")
+
+    if flush_timer is not None:
+        flush_timer.stop()
+        pmc.flush_timer = None
+        _LOG_HANDLER.debug("Flush timer ended")
+
+    if background_writer is not None:
+        background_writer.stop()
+        pmc.background_writer = None
+        _LOG_HANDLER.debug("Background writer ended")
     return 0
 
 